@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""
+Async Dashboard Service (ASGI)
+
+ASGI variant of main.py serving the same routes on AsyncElasticsearch, so a
+worker keeps many slow Elasticsearch calls in flight on one event loop
+instead of tying up a thread per request:
+
+    uvicorn asgi_app:app --host 0.0.0.0 --port 5000 --workers 4
+    gunicorn -k uvicorn.workers.UvicornWorker -w 4 -b 0.0.0.0:5000 asgi_app:app
+
+Built on Starlette; requires aiohttp (the HTTP transport of
+AsyncElasticsearch) and an ASGI server such as uvicorn. Configuration,
+templates and metrics are shared with main.py. The client, the connection
+checker and the ingest flusher are created in the lifespan startup, so each
+worker owns its own, and the ingest buffer is flushed on shutdown.
+"""
+
+import asyncio
+import contextlib
+import logging
+import os
+import time
+
+from starlette.applications import Starlette
+from starlette.exceptions import HTTPException
+from starlette.middleware import Middleware
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Match, Mount, Route
+from starlette.staticfiles import StaticFiles
+from starlette.templating import Jinja2Templates
+
+import main
+from client_factory import create_async_client
+from ingest_buffer import AsyncBulkFlusher, BufferFull, RingBuffer
+from metrics import CONTENT_TYPE, REGISTRY
+from schema_mapping import SchemaMappingError
+from status_collector import collect_status_async
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+templates = Jinja2Templates(directory=os.path.join(BASE_DIR, 'templates'))
+
+# Per-worker state, set up in the lifespan startup
+es_client = None
+es_reachable = False  # result of the last connection check
+es_checked_at = None  # time.monotonic() of the last connection check
+es_checker = None
+ingest_buffer = RingBuffer(main.INGEST_BUFFER_SIZE)
+ingest_flusher = None
+
+# This process serves the ASGI app, so the shared gauges report its buffer
+main.INGEST_QUEUE_DEPTH.set_function(lambda: len(ingest_buffer))
+for _result in ('flushed', 'failed', 'dropped'):
+    main.INGEST_FLUSHER_DOCUMENTS.labels(_result).set_function(
+        lambda result=_result: ingest_flusher.stats[result] if ingest_flusher else 0
+    )
+
+
+def route_label(scope):
+    """Path of the route rule a request matches, or 'unmatched'.
+
+    Matched against the app's routes up front rather than read from
+    scope['route'], which only recent Starlette releases set.
+    """
+    partial = None
+    for route in scope['app'].routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route.path
+        if match == Match.PARTIAL and partial is None:
+            # Path matches but the method does not (405)
+            partial = route.path
+    return partial or 'unmatched'
+
+
+class RequestMetrics:
+    """ASGI middleware recording the latency of every HTTP request"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        started = time.perf_counter()
+        status = 500
+        # Label by route rule, not raw path, to keep label cardinality bounded
+        endpoint = route_label(scope)
+
+        async def send_with_status(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            main.HTTP_REQUEST_SECONDS.labels(endpoint, scope['method'], status).observe(
+                time.perf_counter() - started
+            )
+
+
+async def connect_elasticsearch():
+    """Check that the cluster answers and record the result"""
+    global es_reachable, es_checked_at
+    reachable = False
+    try:
+        if await es_client.ping():
+            if not es_reachable:
+                logger.info("Connected to Elasticsearch")
+                info = await es_client.info()
+                logger.info(f"Elasticsearch version: {info.get('version', {}).get('number', 'unknown')}")
+            reachable = True
+        else:
+            logger.warning("Elasticsearch ping failed on all configured nodes")
+    except Exception as e:
+        logger.warning(f"Error checking Elasticsearch connection: {str(e)}")
+
+    if not reachable:
+        main.ES_CONNECTION_FAILURES.inc()
+    es_reachable = reachable
+    es_checked_at = time.monotonic()
+    main.ES_CONNECTED.set(1 if reachable else 0)
+
+
+async def check_es_connection():
+    """Periodic connection check; requests keep using the client meanwhile"""
+    while True:
+        await connect_elasticsearch()
+        await asyncio.sleep(main.ES_HEALTH_CHECK_INTERVAL)
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    global es_client, es_checker, ingest_flusher
+    # No network I/O here: a cluster that is still starting does not block startup
+    es_client = create_async_client(main.ES_HOST, request_timeout=main.ES_REQUEST_TIMEOUT, max_retries=2)
+    es_checker = asyncio.get_running_loop().create_task(check_es_connection(), name='es-connection-check')
+    ingest_flusher = AsyncBulkFlusher(
+        ingest_buffer,
+        lambda: es_client,
+        flush_size=main.INGEST_FLUSH_SIZE,
+        flush_interval=main.INGEST_FLUSH_INTERVAL
+    ).start()
+    try:
+        yield
+    finally:
+        es_checker.cancel()
+        await ingest_flusher.stop()
+        await es_client.close()
+
+
+async def healthz(request):
+    """Liveness probe: the process is serving requests (no I/O)"""
+    return JSONResponse({"status": "ok"})
+
+
+async def readyz(request):
+    """Readiness probe: cached result of the background connection check"""
+    if es_checked_at is None:
+        return JSONResponse({"status": "starting"}, 503)
+    age = round(time.monotonic() - es_checked_at, 1)
+    if es_reachable:
+        return JSONResponse({"status": "ready", "elasticsearch": "reachable", "checked_seconds_ago": age})
+    return JSONResponse({"status": "not ready", "elasticsearch": "unreachable", "checked_seconds_ago": age}, 503)
+
+
+async def metrics(request):
+    """Expose application and Elasticsearch client metrics for Prometheus"""
+    return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
+
+
+async def index(request):
+    """Render the main dashboard page"""
+    return templates.TemplateResponse(request, 'index.html')
+
+
+async def dashboard(request):
+    """Render the Kibana dashboard page"""
+    kibana_url = os.environ.get('KIBANA_URL', 'http://localhost:5601')
+    return templates.TemplateResponse(request, 'dashboard.html', {'kibana_url': kibana_url})
+
+
+async def status(request):
+    """Check the Elasticsearch connection and the sensor data streams"""
+    return JSONResponse(await collect_status_async(es_client, main.STATUS_STREAMS))
+
+
+async def ingest(request):
+    """Accept sensor readings and queue them for bulk ingestion"""
+    sensor = request.path_params['sensor']
+    stream = main.ingest_stream(sensor)
+    if stream is None:
+        return JSONResponse({"error": f"Unknown sensor type: {sensor}"}, 404)
+
+    body = (await request.body()).decode('utf-8')
+    mimetype = request.headers.get('content-type', '').split(';')[0].strip().lower()
+    try:
+        records = main.parse_ingest_payload(body, mimetype)
+    except ValueError as e:
+        return JSONResponse({"error": f"Invalid payload: {str(e)}"}, 400)
+    if not records:
+        return JSONResponse({"error": "No readings in request"}, 400)
+
+    # Document building is pandas work; keep it off the event loop
+    try:
+        documents = await asyncio.to_thread(main.build_ingest_documents, records, stream)
+    except main.InvalidTimestampError as e:
+        return JSONResponse({"error": str(e), "rows": e.rows}, 400)
+    except (SchemaMappingError, ValueError) as e:
+        return JSONResponse({"error": str(e)}, 400)
+
+    rejected = len(records) - len(documents)
+    if not documents:
+        return JSONResponse({"error": "No valid readings in request", "rejected": rejected}, 400)
+
+    try:
+        depth = ingest_buffer.offer(documents)
+    except BufferFull as e:
+        return JSONResponse({"error": str(e), "queue_depth": len(ingest_buffer)}, 429, {"Retry-After": "1"})
+    ingest_flusher.notify()
+
+    return JSONResponse({"accepted": len(documents), "rejected": rejected, "queue_depth": depth}, 202)
+
+
+async def http_error(request, exc):
+    """JSON bodies for 404, 405 and other HTTP errors, like the Flask app"""
+    return JSONResponse({"error": exc.detail}, exc.status_code, headers=exc.headers)
+
+
+async def server_error(request, exc):
+    logger.error(f"Error handling {request.method} {request.url.path}: {str(exc)}")
+    return JSONResponse({"error": "Internal Server Error"}, 500)
+
+
+app = Starlette(
+    routes=[
+        Route('/healthz', healthz),
+        Route('/readyz', readyz),
+        Route('/metrics', metrics),
+        Route('/', index),
+        Route('/dashboard', dashboard),
+        Route('/status', status),
+        Route('/api/ingest/{sensor}', ingest, methods=['POST']),
+        Mount('/static', StaticFiles(directory=os.path.join(BASE_DIR, 'static')), name='static'),
+    ],
+    middleware=[Middleware(RequestMetrics)],
+    exception_handlers={HTTPException: http_error, Exception: server_error},
+    lifespan=lifespan,
+)
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Backfill Routing
+
+Writes to a data stream always go to its current write index, so a backfill
+of months of readings would pile all of them into one backing index next to
+today's data. With a backfill window, historical documents are partitioned
+by @timestamp into day, week or month windows and the data stream is rolled
+over whenever the window changes. Each backing index then holds a single
+window; Elasticsearch records the @timestamp range of every shard and skips
+shards outside a query's time range, so historical queries only touch the
+indices of the windows they cover.
+
+When the backfill ends, the data stream is rolled over once more so live
+writes do not land in the index of the last historical window.
+
+Windows are written in the order they are met. Input that is not in time
+order (files or rows) produces more than one index for a window, which is
+logged; pass files in chronological order.
+"""
+
+import logging
+import re
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+
+from bulk_load import write_data_stream
+from lazy_imports import lazy_import
+
+pd = lazy_import('pandas')
+
+logger = logging.getLogger(__name__)
+
+WINDOW_DAY = 'day'
+WINDOW_WEEK = 'week'
+WINDOW_MONTH = 'month'
+WINDOW_CHOICES = [WINDOW_DAY, WINDOW_WEEK, WINDOW_MONTH]
+
+# A UTC offset other than Z at the end of an ISO 8601 timestamp
+UTC_OFFSET = re.compile(r'[+-]\d{2}:?\d{2}$')
+
+
+def window_key(timestamp, window):
+    """Window label ("2024-03-05", "2024-W10" or "2024-03") of an ISO 8601
+    string or epoch milliseconds value, in UTC"""
+    if isinstance(timestamp, str) and UTC_OFFSET.search(timestamp, 10):
+        # The local date differs from the UTC one near midnight
+        timestamp = pd.to_datetime(timestamp, utc=True).value // 1_000_000
+    if isinstance(timestamp, str):
+        if window == WINDOW_MONTH:
+            return timestamp[:7]
+        if window == WINDOW_DAY:
+            return timestamp[:10]
+        day = datetime.strptime(timestamp[:10], '%Y-%m-%d')
+    else:
+        day = datetime.fromtimestamp(timestamp / 1000, tz=timezone.utc)
+        if window == WINDOW_MONTH:
+            return day.strftime('%Y-%m')
+        if window == WINDOW_DAY:
+            return day.strftime('%Y-%m-%d')
+    year, week, _ = day.isocalendar()
+    return f"{year}-W{week:02d}"
+
+
+def window_start(moment, window):
+    """Start of the window containing a datetime"""
+    day = moment.replace(hour=0, minute=0, second=0, microsecond=0)
+    if window == WINDOW_MONTH:
+        return day.replace(day=1)
+    if window == WINDOW_WEEK:
+        return day - timedelta(days=day.weekday())
+    return day
+
+
+def window_ranges(first, last, window):
+    """[(window, start, end)] covering epoch milliseconds first..last, with
+    UTC datetime bounds (end exclusive)"""
+    ranges = []
+    start = window_start(datetime.fromtimestamp(first / 1000, tz=timezone.utc), window)
+    last = datetime.fromtimestamp(last / 1000, tz=timezone.utc)
+    while start <= last:
+        if window == WINDOW_MONTH:
+            end = start.replace(year=start.year + start.month // 12, month=start.month % 12 + 1)
+        else:
+            end = start + timedelta(days=7 if window == WINDOW_WEEK else 1)
+        ranges.append((window_key(start.timestamp() * 1000, window), start, end))
+        start = end
+    return ranges
+
+
+def partition_documents(documents, window):
+    """[(window, documents)] in chronological window order"""
+    partitions = defaultdict(list)
+    for doc in documents:
+        partitions[window_key(doc['@timestamp'], window)].append(doc)
+    return sorted(partitions.items())
+
+
+class BackfillRouter:
+    """Rolls a data stream over so that each time window gets its own backing index"""
+
+    def __init__(self, es, data_stream, window, on_rollover=None):
+        self.es = es
+        self.data_stream = data_stream
+        self.window = window
+        # Called with the new write index after every rollover between windows
+        self.on_rollover = on_rollover
+        self.current = None
+        self.indices = {}  # window -> backing indices written for it
+        self.write_index = self._prepare()
+
+    def _prepare(self):
+        """Create the data stream if needed and return its write index"""
+        from elasticsearch import NotFoundError
+        # Roll over the data stream behind an alias, not the alias
+        self.data_stream = write_data_stream(self.es, self.data_stream)
+        try:
+            data_streams = self.es.indices.get_data_stream(name=self.data_stream)['data_streams']
+        except NotFoundError:
+            # Needs the index template (setup_elasticsearch.py)
+            self.es.indices.create_data_stream(name=self.data_stream)
+            logger.info(f"Created data stream {self.data_stream}")
+            data_streams = self.es.indices.get_data_stream(name=self.data_stream)['data_streams']
+        return data_streams[0]['indices'][-1]['index_name']
+
+    def _is_empty(self, index):
+        stats = self.es.indices.stats(index=index, metric='docs,indexing')['indices'][index]['primaries']
+        return stats['docs']['count'] == 0 and stats['indexing']['index_total'] == 0
+
+    def rollover(self):
+        self.write_index = self.es.indices.rollover(alias=self.data_stream)['new_index']
+        return self.write_index
+
+    def route(self, window):
+        """Make sure the next writes land in an index of their own for window"""
+        if window == self.current:
+            return self.write_index
+        # The first window reuses the write index only if nothing was ever written to it
+        if self.current is not None or not self._is_empty(self.write_index):
+            self.rollover()
+            if self.on_rollover:
+                self.on_rollover(self.write_index)
+        if window in self.indices:
+            logger.warning(f"Window {window} seen again (input not in time order); "
+                           f"writing it to another index, {self.write_index}")
+        self.indices.setdefault(window, []).append(self.write_index)
+        logger.info(f"Backfill window {window} -> {self.write_index}")
+        self.current = window
+        return self.write_index
+
+    def finish(self):
+        """Roll over once more so live data gets a fresh write index"""
+        if self.current is None:
+            return
+        index = self.rollover()
+        logger.info(f"Backfill wrote {len(self.indices)} windows into "
+                    f"{sum(len(indices) for indices in self.indices.values())} backing indices; "
+                    f"live writes now go to {index}")
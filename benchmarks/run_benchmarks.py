@@ -0,0 +1,349 @@
+#!/usr/bin/env python3
+"""
+Benchmark Suite
+
+Measures the ingestion, query and status paths and stores the results as
+JSON so runs can be compared between releases:
+
+- prepare: timestamp conversion + document preparation throughput
+- serialize: NDJSON bulk body serialization throughput
+- bulk: bulk ingestion throughput for each batch size and worker count
+- status: /status latency of the web app under concurrent requests
+- query: aggregation query latency
+
+By default the Elasticsearch benchmarks run against an in-process stand-in
+cluster (see stand_in_cluster.py). Pass --es-host to benchmark a real
+cluster instead; the bulk benchmark writes documents, so use a disposable
+cluster.
+
+Usage (from the repository root):
+    python -m benchmarks.run_benchmarks
+    python -m benchmarks.run_benchmarks --es-host http://localhost:9200 --rows 200000
+    python -m benchmarks.run_benchmarks --compare benchmarks/results/baseline.json
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import pandas as pd
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+# Configure logging before importing repository modules, which configure it too
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger('benchmarks')
+
+from elasticsearch import helpers  # noqa: E402
+
+from benchmarks.stand_in_cluster import StandInCluster  # noqa: E402
+from client_factory import create_client  # noqa: E402
+from compressed_io import bulk_body  # noqa: E402
+from sample_data_generator import generate_temperature_data  # noqa: E402
+from schema_mapping import cached_plan  # noqa: E402
+from timestamp_conversion import TimestampConverter, add_timestamp_column  # noqa: E402
+
+BENCHMARKS = ['prepare', 'serialize', 'bulk', 'status', 'query']
+DEFAULT_INDEX = 'temperaturesensor-ds'
+DEFAULT_RESULTS_DIR = os.path.join(REPO_ROOT, 'benchmarks', 'results')
+
+
+def parse_arguments():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description='Run the ingestion, query and status benchmarks')
+    parser.add_argument('--only', nargs='+', choices=BENCHMARKS, default=BENCHMARKS,
+                        help='Benchmarks to run (default: all)')
+    parser.add_argument('--es-host',
+                        help='Benchmark this Elasticsearch cluster instead of the stand-in')
+    parser.add_argument('--latency-ms', type=float, default=1.0,
+                        help='Artificial per-request latency of the stand-in cluster')
+    parser.add_argument('--index', default=DEFAULT_INDEX, help='Data stream used for bulk and query benchmarks')
+    parser.add_argument('--rows', type=int, default=50000, help='Rows of generated sensor data')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Repetitions of CPU-bound benchmarks; the best run is kept')
+    parser.add_argument('--batch-sizes', default='500,1000,5000',
+                        help='Comma-separated bulk batch sizes')
+    parser.add_argument('--workers', default='1,4', help='Comma-separated bulk worker counts')
+    parser.add_argument('--concurrency', default='1,8', help='Comma-separated concurrent /status clients')
+    parser.add_argument('--requests', type=int, default=200, help='Requests per status/query benchmark')
+    parser.add_argument('--seed', type=int, default=42, help='Random seed for generated data')
+    parser.add_argument('--output', help='Result file (default: benchmarks/results/<timestamp>.json)')
+    parser.add_argument('--compare', help='Earlier result file to compare against')
+    parser.add_argument('--threshold', type=float, default=0.15,
+                        help='Relative change reported as a regression (default: 0.15)')
+    return parser.parse_args()
+
+
+def int_list(value):
+    return [int(item) for item in value.split(',') if item.strip()]
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_ROOT,
+                              capture_output=True, text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def latency_summary(samples):
+    """Summarize latencies (seconds) as milliseconds"""
+    ordered = sorted(samples)
+
+    def percentile(fraction):
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] * 1000
+
+    return {
+        'requests': len(ordered),
+        'mean_ms': round(statistics.fmean(ordered) * 1000, 3),
+        'p50_ms': round(percentile(0.50), 3),
+        'p95_ms': round(percentile(0.95), 3),
+        'p99_ms': round(percentile(0.99), 3),
+        'max_ms': round(ordered[-1] * 1000, 3),
+    }
+
+
+def result(name, params, value, unit, higher_is_better, **details):
+    return {
+        'name': name,
+        'params': params,
+        'value': round(value, 3),
+        'unit': unit,
+        'higher_is_better': higher_is_better,
+        **details,
+    }
+
+
+def generate_frame(rows, seed):
+    """Generate temperature readings in the flat CSV layout"""
+    random.seed(seed)
+    records = generate_temperature_data(rows, 1, 'sensor1,sensor2,sensor3,sensor4,sensor5',
+                                        start_time=datetime(2025, 1, 1))
+    return pd.DataFrame(records)
+
+
+def prepare_documents(frame, index):
+    df = frame.copy()
+    add_timestamp_column(df, TimestampConverter())
+    return cached_plan(tuple(df.columns), index).documents(df)
+
+
+def bench_prepare(frame, args):
+    best = None
+    for _ in range(args.repeat):
+        started = time.perf_counter()
+        documents = prepare_documents(frame, args.index)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    rate = len(documents) / best
+    logger.info(f"prepare: {rate:,.0f} docs/s")
+    return [result('prepare', {'rows': len(frame)}, rate, 'docs/s', True, seconds=round(best, 4))]
+
+
+def bench_serialize(documents, args):
+    best = None
+    size = 0
+    for _ in range(args.repeat):
+        started = time.perf_counter()
+        size = len(bulk_body(documents))
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    rate = len(documents) / best
+    logger.info(f"serialize: {rate:,.0f} docs/s, {size / best / 1e6:.1f} MB/s")
+    return [result('serialize', {'rows': len(documents)}, rate, 'docs/s', True,
+                   mb_per_s=round(size / best / 1e6, 2), bytes=size)]
+
+
+def bench_bulk(es, documents, args):
+    results = []
+    for batch_size in int_list(args.batch_sizes):
+        batches = [documents[i:i + batch_size] for i in range(0, len(documents), batch_size)]
+        for workers in int_list(args.workers):
+            errors = []
+
+            def send(batch):
+                _, failed = helpers.bulk(es, batch, chunk_size=batch_size, raise_on_error=False)
+                errors.extend(failed)
+
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                list(executor.map(send, batches))
+            elapsed = time.perf_counter() - started
+            rate = len(documents) / elapsed
+            logger.info(f"bulk batch_size={batch_size} workers={workers}: {rate:,.0f} docs/s")
+            results.append(result('bulk', {'batch_size': batch_size, 'workers': workers}, rate, 'docs/s',
+                                  True, seconds=round(elapsed, 4), errors=len(errors)))
+    return results
+
+
+def timed_requests(call, total, concurrency):
+    """Run call() total times across concurrency threads; returns latencies"""
+    latencies = []
+    lock = threading.Lock()
+    per_thread = max(1, total // concurrency)
+
+    def worker():
+        local = []
+        for _ in range(per_thread):
+            started = time.perf_counter()
+            call()
+            local.append(time.perf_counter() - started)
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies
+
+
+def bench_status(es_host, args):
+    # main.py reads ES_HOST at import time and checks the connection in a
+    # background thread started by the first request
+    os.environ['ES_HOST'] = es_host
+    import main
+
+    client = main.app.test_client()
+    deadline = time.monotonic() + 30
+    while client.get('/readyz').status_code != 200 and time.monotonic() < deadline:
+        time.sleep(0.1)
+    if not main.es_reachable:
+        logger.warning("status: web app did not connect to Elasticsearch, skipping")
+        return []
+
+    sample = client.get('/status').get_json()
+    if sample.get('elasticsearch') != 'connected':
+        logger.warning(f"status: /status did not report a connected cluster: {sample}")
+    # Errors were reported once above; keep them out of the timed loop
+    logging.getLogger('status_collector').setLevel(logging.CRITICAL)
+
+    results = []
+    for concurrency in int_list(args.concurrency):
+        def call():
+            response = main.app.test_client().get('/status')
+            if response.status_code != 200:
+                raise RuntimeError(f"/status returned {response.status_code}")
+
+        summary = latency_summary(timed_requests(call, args.requests, concurrency))
+        logger.info(f"status concurrency={concurrency}: p50 {summary['p50_ms']}ms, p99 {summary['p99_ms']}ms")
+        results.append(result('status', {'concurrency': concurrency}, summary['p95_ms'], 'ms', False,
+                              response=sample.get('elasticsearch'), **summary))
+    return results
+
+
+def bench_query(es, args):
+    query = {
+        'size': 0,
+        'aggs': {
+            'per_host': {'terms': {'field': 'tag.host', 'size': 10}},
+            'over_time': {
+                'date_histogram': {'field': '@timestamp', 'fixed_interval': '1h'},
+                'aggs': {'avg_value': {'avg': {'field': 'temperaturesensor.telemetry_temperature_value'}}},
+            },
+        },
+    }
+
+    def call():
+        es.search(index=args.index, **query)
+
+    summary = latency_summary(timed_requests(call, args.requests, 1))
+    logger.info(f"query: p50 {summary['p50_ms']}ms, p99 {summary['p99_ms']}ms")
+    return [result('query', {'aggregations': 'terms+date_histogram'}, summary['p95_ms'], 'ms', False, **summary)]
+
+
+def result_key(entry):
+    return entry['name'], json.dumps(entry['params'], sort_keys=True)
+
+
+def compare_results(current, baseline_path, threshold):
+    """Log changes against a baseline; returns the list of regressions"""
+    with open(baseline_path, 'r') as f:
+        baseline = {result_key(entry): entry for entry in json.load(f)['results']}
+
+    regressions = []
+    for entry in current:
+        previous = baseline.get(result_key(entry))
+        if not previous or not previous['value']:
+            continue
+        change = (entry['value'] - previous['value']) / previous['value']
+        worse = -change if entry['higher_is_better'] else change
+        label = f"{entry['name']} {entry['params']}"
+        logger.info(f"{label}: {previous['value']} -> {entry['value']} {entry['unit']} ({change:+.1%})")
+        if worse > threshold:
+            regressions.append(label)
+    for label in regressions:
+        logger.warning(f"Regression: {label}")
+    return regressions
+
+
+def main():
+    args = parse_arguments()
+
+    cluster = None
+    es_host = args.es_host
+    if not es_host and {'bulk', 'status', 'query'} & set(args.only):
+        cluster = StandInCluster(latency_ms=args.latency_ms).start()
+        es_host = cluster.url
+        logger.info(f"Using stand-in cluster at {es_host} ({args.latency_ms}ms latency)")
+
+    results = []
+    try:
+        frame = generate_frame(args.rows, args.seed)
+        documents = prepare_documents(frame, args.index)
+        es = create_client(es_host, request_timeout=60, pool_size=16) if es_host else None
+
+        if 'prepare' in args.only:
+            results += bench_prepare(frame, args)
+        if 'serialize' in args.only:
+            results += bench_serialize(documents, args)
+        if 'bulk' in args.only:
+            results += bench_bulk(es, documents, args)
+        if 'query' in args.only:
+            results += bench_query(es, args)
+        if 'status' in args.only:
+            results += bench_status(es_host, args)
+    finally:
+        if cluster:
+            cluster.stop()
+
+    output = args.output or os.path.join(
+        DEFAULT_RESULTS_DIR, datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ') + '.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump({
+            'run': {
+                'timestamp': datetime.now(timezone.utc).isoformat(),
+                'commit': git_commit(),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'cpus': os.cpu_count(),
+                'target': args.es_host or f'stand-in ({args.latency_ms}ms latency)',
+                'rows': args.rows,
+            },
+            'results': results,
+        }, f, indent=2)
+    logger.info(f"Wrote {len(results)} results to {output}")
+
+    if args.compare and compare_results(results, args.compare, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
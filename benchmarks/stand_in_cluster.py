@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""
+Stand-in Elasticsearch Cluster
+
+A small in-process HTTP server that answers the handful of Elasticsearch
+APIs used by this project, so the benchmarks can run without a real cluster:
+
+- HEAD / and GET /                    ping and cluster info
+- GET /_cluster/health                always green
+- POST /_bulk, POST /<index>/_bulk     counts documents per index
+- GET|POST /<index>/_count             returns the counted documents
+- GET /_data_stream/<name>             streams that received documents
+- GET|POST /<index>/_search            canned aggregation response
+- GET|POST /_msearch                   one hit count per search
+- GET /_nodes/_all/http                this server as the only node (sniffing)
+
+Documents are counted, not stored. An optional per-request latency makes the
+network share of a benchmark more realistic than a loopback round trip.
+
+Run standalone with:
+    python benchmarks/stand_in_cluster.py --port 9200 --latency-ms 2
+"""
+
+import argparse
+import json
+import threading
+import time
+from fnmatch import fnmatch
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote, urlparse
+
+CLUSTER_INFO = {
+    'name': 'stand-in',
+    'cluster_name': 'benchmark',
+    'version': {'number': '8.12.0', 'build_flavor': 'default'},
+    'tagline': 'You Know, for Search',
+}
+
+
+class StandInState:
+    """Per-index document counts shared by all request threads"""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.counts = {}
+        self.requests = {}
+        self._lock = threading.Lock()
+
+    def add_documents(self, index, count):
+        with self._lock:
+            self.counts[index] = self.counts.get(index, 0) + count
+
+    def count(self, pattern):
+        with self._lock:
+            return sum(count for index, count in self.counts.items()
+                       if any(fnmatch(index, part) for part in pattern.split(',')))
+
+    def streams(self, pattern):
+        with self._lock:
+            return sorted(index for index in self.counts
+                          if any(fnmatch(index, part) for part in pattern.split(',')))
+
+    def record_request(self, api):
+        with self._lock:
+            self.requests[api] = self.requests.get(api, 0) + 1
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are written separately; avoid delayed-ACK stalls
+    disable_nagle_algorithm = True
+    state = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, body, status=200):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('X-Elastic-Product', 'Elasticsearch')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(data)
+
+    def _read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        if self.headers.get('Content-Encoding') == 'gzip':
+            import gzip
+            body = gzip.decompress(body)
+        return body
+
+    def _dispatch(self):
+        body = self._read_body()
+        if self.state.latency:
+            time.sleep(self.state.latency)
+
+        parts = [unquote(part) for part in urlparse(self.path).path.split('/') if part]
+        api = parts[-1] if parts and parts[-1].startswith('_') else (parts[0] if parts else 'info')
+        self.state.record_request(api)
+
+        if not parts:
+            return self._send(CLUSTER_INFO)
+        if parts[-1] == '_bulk':
+            return self._send(self._bulk(body, parts[0] if len(parts) > 1 else None))
+        if parts[-1] == '_count':
+            pattern = parts[0] if len(parts) > 1 else '*'
+            return self._send({'count': self.state.count(pattern),
+                               '_shards': {'total': 1, 'successful': 1, 'skipped': 0, 'failed': 0}})
+        if parts[0] == '_data_stream':
+            return self._data_stream(parts[1] if len(parts) > 1 else '*')
+        if parts[-1] == '_msearch':
+            return self._send(self._msearch(body, parts[0] if len(parts) > 1 else '*'))
+        if parts[-1] == '_search':
+            return self._send(self._search(parts[0] if len(parts) > 1 else '*', body))
+        if parts[0] == '_nodes':
+            host, port = self.server.server_address[:2]
+            return self._send({'nodes': {'stand-in': {
+                'name': 'stand-in', 'roles': ['master', 'data', 'ingest'],
+                'http': {'publish_address': f'{host}:{port}'},
+            }}})
+        if parts[:2] == ['_cluster', 'health']:
+            return self._send({'cluster_name': 'benchmark', 'status': 'green', 'timed_out': False,
+                               'number_of_nodes': 1})
+        return self._send({'error': {'type': 'stand_in_unsupported', 'reason': self.path}, 'status': 400}, 400)
+
+    do_GET = do_POST = do_PUT = do_HEAD = do_DELETE = _dispatch
+
+    def _bulk(self, body, default_index):
+        lines = [line for line in body.split(b'\n') if line.strip()]
+        items = []
+        per_index = {}
+        position = 0
+        while position < len(lines):
+            action = json.loads(lines[position])
+            op_type, meta = next(iter(action.items()))
+            index = meta.get('_index', default_index)
+            per_index[index] = per_index.get(index, 0) + 1
+            items.append({op_type: {'_index': index, 'result': 'created', 'status': 201}})
+            position += 1 if op_type == 'delete' else 2
+        for index, count in per_index.items():
+            self.state.add_documents(index, count)
+        return {'took': 1, 'errors': False, 'items': items}
+
+    def _data_stream(self, pattern):
+        names = self.state.streams(pattern)
+        if not names and '*' not in pattern:
+            return self._send({'error': {'type': 'index_not_found_exception', 'reason': pattern},
+                               'status': 404}, 404)
+        return self._send({'data_streams': [
+            {'name': name, 'status': 'GREEN', 'generation': 1,
+             'indices': [{'index_name': f'.ds-{name}-000001'}], 'template': name.split('-')[0]}
+            for name in names
+        ]})
+
+    def _msearch(self, body, default_pattern):
+        lines = [line for line in body.split(b'\n') if line.strip()]
+        responses = []
+        for header, search in zip(lines[::2], lines[1::2]):
+            pattern = json.loads(header).get('index', default_pattern)
+            if isinstance(pattern, list):
+                pattern = ','.join(pattern)
+            response = self._search(pattern, search)
+            response['status'] = 200
+            responses.append(response)
+        return {'took': 1, 'responses': responses}
+
+    def _search(self, pattern, body):
+        request = json.loads(body) if body else {}
+        response = {
+            'took': 1,
+            'timed_out': False,
+            'hits': {'total': {'value': self.state.count(pattern), 'relation': 'eq'}, 'hits': []},
+        }
+        aggregations = {}
+        for name, definition in (request.get('aggs') or request.get('aggregations') or {}).items():
+            if 'date_histogram' in definition:
+                aggregations[name] = {'buckets': [
+                    {'key': 1700000000000 + hour * 3600000, 'doc_count': 10, 'avg_value': {'value': 21.5}}
+                    for hour in range(24)
+                ]}
+            elif 'terms' in definition:
+                aggregations[name] = {'buckets': [
+                    {'key': f'sensor{host}', 'doc_count': 100} for host in range(1, 4)
+                ]}
+            else:
+                aggregations[name] = {'value': 21.5}
+        if aggregations:
+            response['aggregations'] = aggregations
+        return response
+
+
+class StandInCluster:
+    """Stand-in server running on a background thread"""
+
+    def __init__(self, host='127.0.0.1', port=0, latency_ms=0.0):
+        self.state = StandInState(latency_ms / 1000.0)
+        handler = type('BoundStandInHandler', (StandInHandler,), {'state': self.state})
+        self.server = ThreadingHTTPServer((host, port), handler)
+        self.server.daemon_threads = True
+        self._thread = threading.Thread(target=self.server.serve_forever, name='stand-in-cluster', daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+        return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run a stand-in Elasticsearch HTTP server')
+    parser.add_argument('--host', default='127.0.0.1', help='Address to listen on')
+    parser.add_argument('--port', type=int, default=9200, help='Port to listen on')
+    parser.add_argument('--latency-ms', type=float, default=0.0, help='Artificial latency per request')
+    args = parser.parse_args()
+
+    cluster = StandInCluster(args.host, args.port, args.latency_ms)
+    print(f"Stand-in cluster listening on {cluster.url}")
+    try:
+        cluster.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Bulk-Load Mode
+
+Temporarily tunes the write index of a data stream for a large backfill:
+
+- index.refresh_interval: -1 (no refreshes while loading)
+- index.number_of_replicas: 0 (every document is indexed once)
+- index.translog.durability: async (optional; fsync every 5s instead of per
+  request, so a node crash can lose the last seconds of the load)
+
+The original values are restored when the load ends, whether it succeeded
+or not, and the index is refreshed so the loaded documents become
+searchable. Restoring the replicas makes Elasticsearch copy the index to the
+replica shards, which is far cheaper than indexing every document twice.
+
+The write index is read from the data stream when the load starts; indices
+created by a rollover during the load are tuned too when the rollover is
+reported (backfill windows do this).
+"""
+
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+REFRESH_INTERVAL = 'index.refresh_interval'
+NUMBER_OF_REPLICAS = 'index.number_of_replicas'
+TRANSLOG_DURABILITY = 'index.translog.durability'
+
+BULK_LOAD_SETTINGS = {REFRESH_INTERVAL: '-1', NUMBER_OF_REPLICAS: '0'}
+ASYNC_TRANSLOG_SETTINGS = {TRANSLOG_DURABILITY: 'async'}
+
+
+def write_data_stream(es, target):
+    """The data stream (or index) that receives writes to target: the write
+    data stream of an alias such as a sensor type's, else target itself"""
+    from elasticsearch import NotFoundError
+    try:
+        aliases = es.indices.get_alias(name=target)
+    except NotFoundError:
+        return target
+    for name, entry in aliases.items():
+        if entry.get('aliases', {}).get(target, {}).get('is_write_index'):
+            return name
+    return next(iter(aliases)) if len(aliases) == 1 else target
+
+
+def write_index(es, target):
+    """The index that receives writes to target: a data stream's current
+    backing index, or target itself when it is a plain index"""
+    from elasticsearch import NotFoundError
+    target = write_data_stream(es, target)
+    try:
+        data_streams = es.indices.get_data_stream(name=target).get('data_streams', [])
+    except NotFoundError:
+        data_streams = []
+    if data_streams:
+        return data_streams[0]['indices'][-1]['index_name']
+    if es.indices.exists(index=target):
+        return target
+    return None
+
+
+def indexing_stats(es, index):
+    """(documents indexed, indexing + refresh milliseconds) of an index"""
+    stats = es.indices.stats(index=index, metric='indexing,refresh')['indices'][index]['primaries']
+    return (stats['indexing']['index_total'],
+            stats['indexing']['index_time_in_millis'] + stats['refresh']['total_time_in_millis'])
+
+
+class BulkLoadMode:
+    """Context manager applying the bulk-load settings to a data stream's write index.
+
+    Settings that were not set explicitly are restored by resetting them
+    (null), so the index goes back to the template or cluster default. Call
+    tune() with the new write index after a rollover (backfill windows) to
+    extend the mode to it. The report compares the server-side indexing cost
+    per document during the load with the index's history before it.
+    """
+
+    def __init__(self, es, target, async_translog=False):
+        self.es = es
+        self.target = target
+        self.settings = dict(BULK_LOAD_SETTINGS)
+        if async_translog:
+            self.settings.update(ASYNC_TRANSLOG_SETTINGS)
+        self.original = {}       # index -> settings before the load
+        self._stats_before = {}  # index -> indexing_stats() before the load
+        self._started = None
+
+    def tune(self, index):
+        """Apply the bulk-load settings to index, remembering its own"""
+        if index in self.original:
+            return
+        current = self.es.indices.get_settings(index=index, flat_settings=True)[index]['settings']
+        original = {name: current.get(name) for name in self.settings}
+        self._stats_before[index] = indexing_stats(self.es, index)
+        self.es.indices.put_settings(index=index, settings=self.settings)
+        self.original[index] = original
+        logger.info(f"Bulk-load mode on {index}: "
+                    + ', '.join(f"{name}={value}" for name, value in self.settings.items()))
+
+    def __enter__(self):
+        index = write_index(self.es, self.target)
+        if index is None:
+            # The data stream is created by the first bulk request with its
+            # template settings; there is nothing to tune yet
+            logger.warning(f"Bulk-load mode: {self.target} does not exist yet, loading with default settings")
+        else:
+            self.tune(index)
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        if not self.original:
+            return False
+        elapsed = time.perf_counter() - self._started
+        # Restore first: a failure to read stats must not leave an index tuned
+        for index, original in self.original.items():
+            try:
+                self.es.indices.put_settings(index=index, settings=original)
+                logger.info(f"Bulk-load mode off, restored {index}: "
+                            + ', '.join(f"{name}={value if value is not None else 'default'}"
+                                        for name, value in original.items()))
+            except Exception as e:
+                logger.error(f"Failed to restore settings of {index} {original}: {str(e)}")
+
+        try:
+            started = time.perf_counter()
+            self.es.indices.refresh(index=self.target)
+            logger.info(f"Refreshed {self.target} in {time.perf_counter() - started:.2f}s")
+        except Exception as e:
+            logger.error(f"Failed to refresh {self.target}: {str(e)}")
+
+        try:
+            self.report(elapsed)
+        except Exception as e:
+            logger.warning(f"Could not read indexing stats: {str(e)}")
+        return False
+
+    def report(self, elapsed):
+        docs = millis = 0
+        for index, (before_docs, before_millis) in self._stats_before.items():
+            after_docs, after_millis = indexing_stats(self.es, index)
+            docs += after_docs - before_docs
+            millis += after_millis - before_millis
+        if docs <= 0:
+            logger.info("Bulk-load mode: no documents indexed")
+            return
+        logger.info(f"Bulk-load mode: {docs} documents in {elapsed:.2f}s ({docs / elapsed:,.0f} docs/s)")
+        # History of the index that was the write index when the load started
+        before_docs, before_millis = next(iter(self._stats_before.values()))
+        during = millis / docs
+        if before_docs > 0 and during > 0:
+            usual = before_millis / before_docs
+            logger.info(f"Server-side indexing cost: {during:.3f} ms/doc during the load, "
+                        f"{usual:.3f} ms/doc before it ({usual / during:.1f}x speedup)")
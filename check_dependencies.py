@@ -5,7 +5,7 @@ This script checks if all required Python dependencies are installed correctly.
 """
 
 import sys
-import pkg_resources
+from importlib.metadata import PackageNotFoundError, version
 
 required_packages = [
     "elasticsearch",
@@ -14,7 +14,10 @@ required_packages = [
     "requests",
     "pandas",
     "urllib3",
-    "gunicorn"
+    "gunicorn",
+    "aiohttp",
+    "uvicorn",
+    "starlette"
 ]
 
 def check_dependencies():
@@ -24,9 +27,8 @@ def check_dependencies():
     
     for package in required_packages:
         try:
-            version = pkg_resources.get_distribution(package).version
-            installed[package] = version
-        except pkg_resources.DistributionNotFound:
+            installed[package] = version(package)
+        except PackageNotFoundError:
             missing.append(package)
     
     return missing, installed
@@ -47,8 +49,8 @@ def main():
         return 1
     else:
         print("\n✅ All required packages are installed:")
-        for package, version in installed.items():
-            print(f"  - {package}: {version}")
+        for package, installed_version in installed.items():
+            print(f"  - {package}: {installed_version}")
         return 0
 
 if __name__ == "__main__":
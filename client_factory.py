@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Elasticsearch Client Factory
+
+Single place where Elasticsearch clients and raw HTTP sessions are built, so
+every script shares the same connection settings:
+
+- ES_HOST may list several nodes separated by commas
+- ES_USERNAME / ES_PASSWORD or ES_API_KEY for authentication
+- ES_VERIFY_CERTS=false disables TLS verification for self-signed certs
+- ES_POOL_SIZE sets the persistent (keep-alive) connections kept per node
+- ES_SNIFF=true|false|auto enables node sniffing (auto: when several hosts
+  are configured); ES_SNIFF_INTERVAL limits how often nodes are re-sniffed
+- ES_NODE_SELECTOR=round_robin|least_loaded chooses how requests are spread
+  over live nodes; ES_DEAD_NODE_BACKOFF and ES_MAX_DEAD_NODE_BACKOFF set how
+  long a failed node is kept out of rotation (doubling per failure)
+
+Connections stay open between requests as long as the pool is large enough
+for the number of concurrent callers; an undersized pool makes urllib3
+discard connections and pay a new TCP (and TLS) handshake per request.
+"""
+
+import logging
+import os
+import ssl
+import threading
+from urllib.parse import urlparse
+
+from lazy_imports import lazy_import
+from metrics import instrument_client
+
+# Imported on first use; see lazy_imports
+elasticsearch = lazy_import('elasticsearch')
+node_selection = lazy_import('node_selection')
+requests = lazy_import('requests')
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HOST = 'http://localhost:9200'
+DEFAULT_POOL_SIZE = int(os.environ.get('ES_POOL_SIZE', '10'))
+DEFAULT_SNIFF_INTERVAL = float(os.environ.get('ES_SNIFF_INTERVAL', '60'))
+DEFAULT_NODE_SELECTOR = os.environ.get('ES_NODE_SELECTOR')  # None: round robin
+DEAD_NODE_BACKOFF = float(os.environ.get('ES_DEAD_NODE_BACKOFF', '1.0'))
+MAX_DEAD_NODE_BACKOFF = float(os.environ.get('ES_MAX_DEAD_NODE_BACKOFF', '30.0'))
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def parse_hosts(hosts=None):
+    """Return a list of node URLs from a list or a comma-separated string"""
+    if hosts is None:
+        hosts = os.environ.get('ES_HOST', DEFAULT_HOST)
+    if isinstance(hosts, str):
+        hosts = hosts.split(',')
+    return [host.strip().rstrip('/') for host in hosts if host and host.strip()]
+
+
+def verify_certs():
+    return os.environ.get('ES_VERIFY_CERTS', 'true').lower() != 'false'
+
+
+def create_ssl_context():
+    """SSL context honouring ES_VERIFY_CERTS"""
+    ssl_context = ssl.create_default_context()
+    # If using self-signed certs, you can disable verification
+    if not verify_certs():
+        ssl_context.check_hostname = False
+        ssl_context.verify_mode = ssl.CERT_NONE
+    return ssl_context
+
+
+def auth_params(default_password=''):
+    """Client authentication parameters from the environment"""
+    username = os.environ.get('ES_USERNAME', 'elastic')
+    password = os.environ.get('ES_PASSWORD', default_password)
+    api_key = os.environ.get('ES_API_KEY', '')
+    if api_key:
+        return {'api_key': api_key}
+    if password:
+        return {'basic_auth': (username, password)}
+    return {}
+
+
+def sniffing_enabled(hosts):
+    """ES_SNIFF: off unless asked for, since sniffed nodes are reached through
+    their publish_address, which is often unreachable from outside the cluster
+    (Docker, Kubernetes, cloud load balancers)"""
+    setting = os.environ.get('ES_SNIFF', 'false').lower()
+    if setting == 'auto':
+        return len(hosts) > 1
+    return setting == 'true'
+
+
+def client_params(hosts=None, request_timeout=30, max_retries=3, retry_on_timeout=True,
+                  pool_size=None, http_compress=False, sniff=None, node_selector=None,
+                  default_password='', asynchronous=False, **client_options):
+    """Keyword arguments for Elasticsearch() / AsyncElasticsearch()"""
+    hosts = parse_hosts(hosts)
+    conn_params = {
+        'hosts': hosts,
+        'request_timeout': request_timeout,
+        'retry_on_timeout': retry_on_timeout,
+        # Allow one attempt per node so a request fails over to every other
+        # node before giving up
+        'max_retries': max(max_retries, len(hosts) - 1),
+        # Persistent connections per node; size it to the number of concurrent callers
+        'connections_per_node': pool_size or DEFAULT_POOL_SIZE,
+        'dead_node_backoff_factor': DEAD_NODE_BACKOFF,
+        'max_dead_node_backoff': MAX_DEAD_NODE_BACKOFF,
+    }
+    conn_params.update(auth_params(default_password))
+
+    if any(urlparse(host).scheme == 'https' for host in hosts):
+        conn_params['ssl_context'] = create_ssl_context()
+
+    # Gzip request bodies; Elasticsearch decompresses them transparently
+    if http_compress:
+        conn_params['http_compress'] = True
+
+    sniffing = sniff if sniff is not None else sniffing_enabled(hosts)
+    if sniffing:
+        # Discover the other nodes lazily (never at construction time, so a
+        # cluster that is still starting does not make client creation fail)
+        conn_params.update({
+            'sniff_before_requests': True,
+            'sniff_on_node_failure': True,
+            'min_delay_between_sniffing': DEFAULT_SNIFF_INTERVAL,
+            'sniff_timeout': min(request_timeout, 10),
+        })
+
+    if len(hosts) > 1 or sniffing:
+        selector = node_selector or DEFAULT_NODE_SELECTOR or node_selection.SELECTOR_ROUND_ROBIN
+        conn_params.update(node_selection.selector_options(selector, asynchronous))
+
+    conn_params.update(client_options)
+    return conn_params
+
+
+def create_client(hosts=None, **options):
+    """Build an instrumented Elasticsearch client.
+
+    The client is created without any network I/O; call ping() or info() to
+    check connectivity. Keyword arguments are those of client_params(); extra
+    ones are passed to Elasticsearch().
+    """
+    return instrument_client(elasticsearch.Elasticsearch(**client_params(hosts, **options)))
+
+
+def create_async_client(hosts=None, **options):
+    """Build an instrumented AsyncElasticsearch client (requires aiohttp).
+
+    Same settings as create_client(); pool_size is the number of aiohttp
+    connections kept per node. Close it with ``await client.close()``.
+    """
+    return instrument_client(elasticsearch.AsyncElasticsearch(**client_params(hosts, asynchronous=True, **options)))
+
+
+def es_request_kwargs(default_password=''):
+    """headers, auth and verify arguments for raw HTTP requests to Elasticsearch"""
+    params = auth_params(default_password)
+    kwargs = {'headers': {}, 'auth': None, 'verify': verify_certs()}
+    if 'api_key' in params:
+        kwargs['headers']['Authorization'] = f"ApiKey {params['api_key']}"
+    else:
+        kwargs['auth'] = params.get('basic_auth')
+    if not kwargs['verify']:
+        # Suppress SSL warning messages if verification is disabled
+        import urllib3
+        urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+    return kwargs
+
+
+def http_session(pool_size=None):
+    """Shared requests.Session with a keep-alive connection pool.
+
+    Used for raw HTTP calls (cluster health, Kibana APIs, Pushgateway) so
+    repeated calls reuse connections instead of opening a new one each time.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=pool_size or DEFAULT_POOL_SIZE)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _session = session
+        return _session
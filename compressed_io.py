@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Compressed Input and Bulk Compression Helpers
+
+- Streaming, transparent decompression of .gz, .bz2 and .zst CSV inputs
+  and compression of exported files (zstd support needs the optional
+  'zstandard' package)
+- Measurement of the gzip compression ratio achieved on bulk request bodies
+"""
+
+import bz2
+import gzip
+import io
+import json
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# File suffix -> compression name
+COMPRESSION_SUFFIXES = {
+    '.gz': 'gzip',
+    '.gzip': 'gzip',
+    '.bz2': 'bz2',
+    '.zst': 'zstd',
+    '.zstd': 'zstd',
+}
+
+
+def detect_compression(path):
+    """Return the compression used by a file based on its suffix, or None"""
+    lower = str(path).lower()
+    for suffix, compression in COMPRESSION_SUFFIXES.items():
+        if lower.endswith(suffix):
+            return compression
+    return None
+
+
+def open_binary(path):
+    """Open a possibly compressed file as a decompressed binary stream"""
+    compression = detect_compression(path)
+    if compression == 'gzip':
+        return gzip.open(path, 'rb')
+    if compression == 'bz2':
+        return bz2.open(path, 'rb')
+    if compression == 'zstd':
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError("Reading .zst files requires the 'zstandard' package (pip install zstandard)")
+        return zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True)
+    return open(path, 'rb')
+
+
+def open_text(path, encoding='utf-8'):
+    """Open a possibly compressed file as a decompressed text stream"""
+    return io.TextIOWrapper(open_binary(path), encoding=encoding, newline='')
+
+
+def open_binary_output(path):
+    """Open a file for writing, compressed according to its suffix"""
+    compression = detect_compression(path)
+    if compression == 'gzip':
+        return gzip.open(path, 'wb')
+    if compression == 'bz2':
+        return bz2.open(path, 'wb')
+    if compression == 'zstd':
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError("Writing .zst files requires the 'zstandard' package (pip install zstandard)")
+        return zstandard.ZstdCompressor().stream_writer(open(path, 'wb'), closefd=True)
+    return open(path, 'wb')
+
+
+def open_text_output(path, encoding='utf-8'):
+    """Open a file for writing text, compressed according to its suffix"""
+    return io.TextIOWrapper(open_binary_output(path), encoding=encoding, newline='')
+
+
+def bulk_body(actions):
+    """Serialize bulk actions the way the client does and return the NDJSON bytes"""
+    lines = []
+    for action in actions:
+        source = dict(action)
+        index = source.pop('_index', None)
+        op_type = source.pop('_op_type', 'index')
+        lines.append(json.dumps({op_type: {'_index': index}}, separators=(',', ':')))
+        lines.append(json.dumps(source, separators=(',', ':'), default=str))
+    return ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+class CompressionMeter:
+    """Estimate the gzip ratio of bulk request bodies.
+
+    Compression itself is done by the Elasticsearch client (http_compress);
+    this only re-compresses a sample of batches with the same gzip settings
+    to report how much traffic is saved.
+    """
+
+    def __init__(self, sample_every=10):
+        self.sample_every = max(1, sample_every)
+        self.raw_bytes = 0
+        self.compressed_bytes = 0
+        self._batches = 0
+        self._lock = threading.Lock()
+
+    def observe(self, actions):
+        """Record a batch of bulk actions, compressing every Nth one"""
+        with self._lock:
+            sampled = self._batches % self.sample_every == 0
+            self._batches += 1
+        if not sampled:
+            return
+
+        body = bulk_body(actions)
+        compressed = gzip.compress(body)
+        with self._lock:
+            self.raw_bytes += len(body)
+            self.compressed_bytes += len(compressed)
+
+    @property
+    def ratio(self):
+        """Raw bytes per compressed byte for the sampled batches"""
+        if not self.compressed_bytes:
+            return None
+        return self.raw_bytes / self.compressed_bytes
+
+    def log_report(self):
+        """Log the measured compression ratio"""
+        if self.ratio is None:
+            return
+        saved = 100 * (1 - self.compressed_bytes / self.raw_bytes)
+        logger.info(
+            f"Bulk request compression: {self.ratio:.1f}x ({saved:.0f}% smaller) "
+            f"on {self.raw_bytes} sampled bytes"
+        )
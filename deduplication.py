@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+Replay Deduplication
+
+Gateways resend readings after a reconnect, and every copy would become a
+separate document. The deduplicator drops rows whose key was seen recently,
+before any document is built or serialized. The key is the reading's source
+uuid when the CSV has one, else its host and timestamp.
+
+Recent keys are held in one of two memory-bounded caches:
+
+- lru: the exact keys of the most recent readings that fit in the memory
+  budget; never drops a reading wrongly
+- bloom: two generations of Bloom filters sized from the memory budget and
+  the false-positive rate; holds many more keys per MB, but a new reading
+  is dropped with that (small) probability. A generation is retired when it
+  is full or, with a window, when it is older than the window, so the
+  filter remembers between one and two windows of readings.
+
+Rows without a key (no uuid and no timestamp) are always kept; a blank uuid
+counts as no uuid, and such rows fall back to their host and timestamp.
+
+Filtering a batch reserves the keys of the rows it keeps, so a concurrent
+batch with the same readings (another worker's file) is dropped while the
+first one is in flight. The caller records the reserved keys once their
+documents are indexed, or releases them when indexing failed, so a batch
+that is retried (the follower does this) is not dropped as its own replay.
+"""
+
+import hashlib
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from schema_mapping import SchemaMappingError
+
+logger = logging.getLogger(__name__)
+
+CACHE_LRU = 'lru'
+CACHE_BLOOM = 'bloom'
+CACHE_CHOICES = [CACHE_LRU, CACHE_BLOOM]
+
+KEY_AUTO = 'auto'                      # uuid when the header has one, else host-timestamp
+KEY_UUID = 'uuid'
+KEY_HOST_TIMESTAMP = 'host-timestamp'
+KEY_CHOICES = [KEY_AUTO, KEY_UUID, KEY_HOST_TIMESTAMP]
+
+DEFAULT_MEMORY_MB = 64
+DEFAULT_FALSE_POSITIVE_RATE = 0.001
+
+# Approximate size of one LRU entry: a 36-character key string (~85 bytes)
+# plus its OrderedDict slot and link node
+LRU_ENTRY_BYTES = 160
+
+
+class LruCache:
+    """Exact set of the most recently seen keys"""
+
+    def __init__(self, memory_bytes):
+        self.capacity = max(1, memory_bytes // LRU_ENTRY_BYTES)
+        self.keys = OrderedDict()
+
+    def describe(self):
+        return f"LRU cache of the last {self.capacity:,} keys"
+
+    def contains(self, key):
+        """True if key was recorded recently"""
+        if key in self.keys:
+            self.keys.move_to_end(key)
+            return True
+        return False
+
+    def add(self, key):
+        self.keys[key] = None
+        self.keys.move_to_end(key)
+        if len(self.keys) > self.capacity:
+            self.keys.popitem(last=False)
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter using double hashing"""
+
+    def __init__(self, bits, hashes):
+        self.bits = bits
+        self.hashes = hashes
+        self.array = bytearray((bits + 7) // 8)
+        self.count = 0
+        self.created = time.monotonic()
+
+    def _positions(self, digest):
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.bits for i in range(self.hashes)]
+
+    def contains(self, digest):
+        array = self.array
+        return all(array[position >> 3] & (1 << (position & 7)) for position in self._positions(digest))
+
+    def add(self, digest):
+        array = self.array
+        for position in self._positions(digest):
+            array[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+
+class RotatingBloomCache:
+    """Two generations of Bloom filters: keys are checked against both and
+    added to the current one, which replaces the previous one when it holds
+    its capacity (or is older than window seconds)"""
+
+    def __init__(self, memory_bytes, false_positive_rate=DEFAULT_FALSE_POSITIVE_RATE, window=None):
+        if not 0 < false_positive_rate < 1:
+            raise ValueError("The false-positive rate must be between 0 and 1")
+        # Half the budget per generation; optimal sizing for the target rate
+        self.bits = max(64, memory_bytes * 8 // 2)
+        self.capacity = max(1, int(-self.bits * math.log(2) ** 2 / math.log(false_positive_rate)))
+        self.hashes = max(1, round(self.bits / self.capacity * math.log(2)))
+        self.false_positive_rate = false_positive_rate
+        self.window = window
+        self.current = BloomFilter(self.bits, self.hashes)
+        self.previous = None
+        self.rotations = 0
+
+    def describe(self):
+        window = f", rotating every {self.window:g}s" if self.window else ""
+        return (f"Bloom filter of 2 x {self.bits / 8 / 1024 ** 2:.3g} MB, {self.capacity:,} keys per generation "
+                f"at a {self.false_positive_rate:g} false-positive rate ({self.hashes} hashes){window}")
+
+    def _rotate(self):
+        self.previous = self.current
+        self.current = BloomFilter(self.bits, self.hashes)
+        self.rotations += 1
+
+    @staticmethod
+    def _digest(key):
+        return hashlib.blake2b(key.encode(), digest_size=16).digest()
+
+    def contains(self, key):
+        """True if key was (probably) recorded recently"""
+        digest = self._digest(key)
+        return self.current.contains(digest) or (self.previous is not None and self.previous.contains(digest))
+
+    def add(self, key):
+        if self.current.count >= self.capacity or (
+                self.window and time.monotonic() - self.current.created >= self.window):
+            self._rotate()
+        digest = self._digest(key)
+        if not self.current.contains(digest):
+            self.current.add(digest)
+
+
+def create_cache(kind, memory_mb=DEFAULT_MEMORY_MB, false_positive_rate=DEFAULT_FALSE_POSITIVE_RATE,
+                 window=None):
+    memory_bytes = int(memory_mb * 1024 ** 2)
+    if kind == CACHE_BLOOM:
+        return RotatingBloomCache(memory_bytes, false_positive_rate, window)
+    if kind == CACHE_LRU:
+        return LruCache(memory_bytes)
+    raise ValueError(f"Unknown deduplication cache: {kind}")
+
+
+class Deduplicator:
+    """Drops rows of CSV batches whose key is in the recent-key cache.
+
+    One deduplicator is shared by all files (and workers) of a run, so a
+    reading replayed into another file is dropped too. Keys kept by filter()
+    stay reserved until record() or release() settles them.
+    """
+
+    def __init__(self, cache, key=KEY_AUTO):
+        if key not in KEY_CHOICES:
+            raise ValueError(f"Unknown deduplication key: {key}")
+        self.cache = cache
+        self.key = key
+        self.rows = 0
+        self.dropped = 0
+        self._reserved = set()  # keys of rows kept by filter() and not yet settled
+        self._lock = threading.Lock()
+        logger.info(f"Deduplicating on {key} keys with a {cache.describe()}")
+
+    def _keys(self, plan, df):
+        """Key of every row (None for rows without one), from the columns a
+        document plan maps onto uuid, tag.host and @timestamp"""
+        sources = {spec.path: column for spec, column in zip(plan.fields, plan.sources)}
+        uuid_column = sources.get('uuid')
+        timestamp_column = sources.get('@timestamp')
+        keys = None
+        if timestamp_column:
+            host_column = sources.get('tag.host')
+            hosts = df[host_column].astype(str) if host_column else 'unknown'
+            keys = hosts + '|' + df[timestamp_column].astype(str)
+            keys = keys.where(df[timestamp_column].notna())
+        if self.key == KEY_UUID or (self.key == KEY_AUTO and uuid_column):
+            if not uuid_column:
+                raise SchemaMappingError(f"No uuid column to deduplicate on (columns: {', '.join(plan.header)})")
+            uuids = df[uuid_column].astype('string').str.strip()
+            present = uuids.fillna('') != ''
+            # Rows with a blank uuid fall back to host and timestamp
+            keys = uuids.where(present, keys) if keys is not None else uuids.where(present)
+        if keys is None:
+            return [None] * len(df)
+        return [key if isinstance(key, str) else None for key in keys.astype(object).tolist()]
+
+    def filter(self, plan, df):
+        """(df without the rows recorded or reserved before or repeated within
+        df, the keys of the rows kept). The kept keys are reserved; record()
+        them once the rows are indexed, or release() them if that failed."""
+        keys = self._keys(plan, df)
+        kept = []
+        with self._lock:
+            contains = self.cache.contains
+            reserved = self._reserved
+            duplicate = []
+            for key in keys:
+                flag = key is not None and (key in reserved or contains(key))
+                if key is not None and not flag:
+                    reserved.add(key)
+                    kept.append(key)
+                duplicate.append(flag)
+            dropped = sum(duplicate)
+            self.rows += len(keys)
+            self.dropped += dropped
+        if not dropped:
+            return df, kept
+        logger.info(f"Dropped {dropped} duplicate readings of {len(keys)}")
+        return df[[not flag for flag in duplicate]].reset_index(drop=True), kept
+
+    def record(self, keys):
+        """Remember the reserved keys of rows that were indexed"""
+        with self._lock:
+            add = self.cache.add
+            for key in keys:
+                self._reserved.discard(key)
+                add(key)
+
+    def release(self, keys):
+        """Drop the reservation of keys whose rows were not indexed, so a
+        retry of the same readings is kept"""
+        with self._lock:
+            self._reserved.difference_update(keys)
+
+    def log_report(self):
+        if not self.rows:
+            return
+        logger.info(f"Deduplication dropped {self.dropped} of {self.rows} rows "
+                    f"({self.dropped / self.rows:.1%})"
+                    + (f"; the Bloom filter rotated {self.cache.rotations} times"
+                       if isinstance(self.cache, RotatingBloomCache) else ""))
@@ -0,0 +1,421 @@
+#!/usr/bin/env python3
+"""
+Sensor Data Export
+
+Streams documents out of a sensor data stream (or any index pattern) into
+CSV, NDJSON or Parquet for offline analysis:
+
+    python export_sensor_data.py --index temperaturesensor-ds --output temperature.csv.gz
+    python export_sensor_data.py --index airqualitysensor-ds --format parquet --output air.parquet \\
+        --start 2024-01-01 --end 2024-02-01 --slices 8
+
+- a point in time (PIT) gives every page the same consistent view of the
+  data, however long the export runs
+- the PIT is split into --slices slices read in parallel, each paging with
+  search_after; pages are sorted by _shard_doc, the cheapest sort there is
+- responses are trimmed with filter_path to the sources and sort values
+- pages go through a bounded queue to a single writer, so memory stays at a
+  few pages per slice whatever the size of the export
+
+Slices are written as their pages arrive, so the output is not in time
+order; use --sorted (one slice, sorted by @timestamp) when order matters.
+Outputs ending in .gz, .bz2 or .zst are compressed; Parquet output needs the
+optional 'pyarrow' package.
+"""
+
+import argparse
+import csv
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+
+from dotenv import load_dotenv
+
+from client_factory import create_client
+from compressed_io import open_text_output
+
+# Load environment variables
+load_dotenv()
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+FORMAT_CSV = 'csv'
+FORMAT_NDJSON = 'ndjson'
+FORMAT_PARQUET = 'parquet'
+FORMAT_CHOICES = [FORMAT_CSV, FORMAT_NDJSON, FORMAT_PARQUET]
+
+DEFAULT_PAGE_SIZE = 5000
+DEFAULT_SLICES = 4
+KEEP_ALIVE = '5m'
+PROGRESS_INTERVAL = 10  # seconds between progress reports
+# Only what the export needs from each search response
+FILTER_PATH = 'pit_id,hits.hits._source,hits.hits.sort'
+
+# Parquet column types of Elasticsearch field types; dates stay strings, as
+# they are in _source. Other types take the type of their first values.
+INTEGER_TYPES = {'long', 'integer', 'short', 'byte'}
+FLOAT_TYPES = {'double', 'float', 'half_float', 'scaled_float'}
+STRING_TYPES = {'keyword', 'constant_keyword', 'wildcard', 'text', 'match_only_text', 'ip', 'version',
+                'date', 'date_nanos'}
+
+
+def parse_arguments():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description='Export sensor data from Elasticsearch')
+    parser.add_argument('--index', required=True, help='Data stream, index or pattern to export')
+    parser.add_argument('--output', required=True,
+                        help="Output file ('-' for stdout; .gz, .bz2 and .zst are compressed)")
+    parser.add_argument('--format', choices=FORMAT_CHOICES,
+                        help='Output format (default: from the output file name, else csv)')
+    parser.add_argument('--host', default=os.environ.get('ES_HOST', 'http://localhost:9200'),
+                        help='Elasticsearch host URL')
+    parser.add_argument('--start', help='Export documents with @timestamp >= this date')
+    parser.add_argument('--end', help='Export documents with @timestamp < this date')
+    parser.add_argument('--query', help='Lucene query string to filter documents')
+    parser.add_argument('--fields', help='Comma-separated fields to export (default: all)')
+    parser.add_argument('--slices', type=int, default=DEFAULT_SLICES,
+                        help='Slices of the point in time read in parallel')
+    parser.add_argument('--page-size', type=int, default=DEFAULT_PAGE_SIZE,
+                        help='Documents per search request')
+    parser.add_argument('--sorted', action='store_true',
+                        help='Write documents in @timestamp order (reads with a single slice)')
+    return parser.parse_args()
+
+
+def output_format(path, requested=None):
+    if requested:
+        return requested
+    name = path.lower()
+    for suffix in ('.gz', '.gzip', '.bz2', '.zst', '.zstd'):
+        if name.endswith(suffix):
+            name = name[:-len(suffix)]
+    if name.endswith('.parquet'):
+        return FORMAT_PARQUET
+    if name.endswith(('.ndjson', '.jsonl', '.json')):
+        return FORMAT_NDJSON
+    return FORMAT_CSV
+
+
+def build_query(start=None, end=None, query_string=None):
+    filters = []
+    if start or end:
+        bounds = {}
+        if start:
+            bounds['gte'] = start
+        if end:
+            bounds['lt'] = end
+        filters.append({'range': {'@timestamp': bounds}})
+    if query_string:
+        filters.append({'query_string': {'query': query_string}})
+    return {'bool': {'filter': filters}} if filters else {'match_all': {}}
+
+
+def mapped_types(mappings, prefix=''):
+    """{'tag': {'properties': {'host': {'type': 'keyword'}}}} -> {'tag.host': 'keyword'}"""
+    types = {}
+    for name, field in mappings.items():
+        path = f"{prefix}{name}"
+        if 'properties' in field:
+            types.update(mapped_types(field['properties'], f"{path}."))
+        elif 'type' in field:
+            types[path] = field['type']
+    return types
+
+
+def fetch_field_types(es, index):
+    """Field types of the index (all backing indices of a data stream or
+    pattern); a field mapped as integer in one and float in another is float,
+    any other conflict makes it a keyword"""
+    try:
+        response = es.indices.get_mapping(index=index)
+    except Exception as e:
+        logger.warning(f"Could not read the mapping of {index}, Parquet types come from the data: {str(e)}")
+        return {}
+    types = {}
+    for mapping in response.values():
+        for path, field_type in mapped_types(mapping.get('mappings', {}).get('properties', {})).items():
+            known = types.setdefault(path, field_type)
+            if known == field_type:
+                continue
+            numeric = INTEGER_TYPES | FLOAT_TYPES
+            types[path] = 'double' if known in numeric and field_type in numeric else 'keyword'
+    return types
+
+
+def flatten(doc, prefix=''):
+    """{'tag': {'host': 'a'}} -> {'tag.host': 'a'}"""
+    flat = {}
+    for key, value in doc.items():
+        path = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{path}."))
+        else:
+            flat[path] = value
+    return flat
+
+
+class CsvOutput:
+    """CSV with the columns of the first page (or --fields)"""
+
+    def __init__(self, path, fields=None):
+        self.file = sys.stdout if path == '-' else open_text_output(path)
+        self.fields = fields
+        self.writer = None
+        self._warned = False
+
+    def write(self, sources):
+        rows = [flatten(source) for source in sources]
+        if self.writer is None:
+            if not self.fields:
+                self.fields = list(dict.fromkeys(key for row in rows for key in row))
+            self.writer = csv.DictWriter(self.file, fieldnames=self.fields, extrasaction='ignore')
+            self.writer.writeheader()
+        if not self._warned and any(key not in self.writer.fieldnames for row in rows for key in row):
+            logger.warning("Some documents have fields missing from the CSV header; they are not exported. "
+                           "List them with --fields.")
+            self._warned = True
+        self.writer.writerows(rows)
+
+    def close(self):
+        if self.file is not sys.stdout:
+            self.file.close()
+
+
+class NdjsonOutput:
+    """One JSON document (the _source) per line"""
+
+    def __init__(self, path, fields=None):
+        self.file = sys.stdout if path == '-' else open_text_output(path)
+
+    def write(self, sources):
+        self.file.write(''.join(json.dumps(source, separators=(',', ':')) + '\n' for source in sources))
+
+    def close(self):
+        if self.file is not sys.stdout:
+            self.file.close()
+
+
+class ParquetOutput:
+    """Parquet with one row group per page.
+
+    Column types come from the index mapping (field_types), and from the
+    first page for fields the mapping does not type; there, numbers are
+    doubles and a column with no values on the first page is a string. Every page is cast to that
+    schema, and fields that are not in it are dropped with a warning.
+    """
+
+    def __init__(self, path, fields=None, field_types=None):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ImportError("Parquet output requires the 'pyarrow' package (pip install pyarrow)")
+        if path == '-':
+            raise ValueError("Parquet output cannot be written to stdout")
+        self.pa = pyarrow
+        self.pq = pyarrow.parquet
+        self.path = path
+        self.fields = fields
+        self.field_types = field_types or {}
+        self.writer = None
+        self.dropped = set()
+
+    def _arrow_type(self, field_type):
+        pa = self.pa
+        if field_type in INTEGER_TYPES:
+            return pa.int64()
+        if field_type == 'unsigned_long':
+            return pa.uint64()
+        if field_type in FLOAT_TYPES:
+            return pa.float64()
+        if field_type == 'boolean':
+            return pa.bool_()
+        if field_type in STRING_TYPES:
+            return pa.string()
+        return None
+
+    def _schema(self, table):
+        """Mapped fields first, then the other fields of the first page"""
+        types = {}
+        for path, field_type in self.field_types.items():
+            arrow_type = self._arrow_type(field_type)
+            if arrow_type is not None:
+                types[path] = arrow_type
+        for field in table.schema:
+            if field.name in types:
+                continue
+            if self.pa.types.is_null(field.type):
+                types[field.name] = self.pa.string()
+            elif self.pa.types.is_integer(field.type):
+                # A JSON number that happens to be whole on the first page
+                types[field.name] = self.pa.float64()
+            else:
+                types[field.name] = field.type
+        names = [name for name in self.fields if name in types] if self.fields else list(types)
+        return self.pa.schema([(name, types[name]) for name in names])
+
+    def _conform(self, table, schema):
+        columns = []
+        for field in schema:
+            if field.name not in table.column_names:
+                columns.append(self.pa.nulls(len(table), field.type))
+                continue
+            column = table[field.name]
+            if column.type != field.type:
+                try:
+                    column = column.cast(field.type)
+                except (self.pa.ArrowInvalid, self.pa.ArrowNotImplementedError) as e:
+                    raise ValueError(f"Field {field.name} does not fit the Parquet type {field.type}: {str(e)}")
+            columns.append(column)
+        return self.pa.Table.from_arrays(columns, schema=schema)
+
+    def write(self, sources):
+        table = self.pa.Table.from_pylist([flatten(source) for source in sources])
+        if self.writer is None:
+            self.writer = self.pq.ParquetWriter(self.path, self._schema(table), compression='zstd')
+        schema = self.writer.schema
+        dropped = set(table.column_names) - set(schema.names) - self.dropped
+        if dropped and not self.fields:
+            logger.warning(f"Fields missing from the Parquet schema are not exported: {', '.join(sorted(dropped))}. "
+                           "List them with --fields.")
+        self.dropped |= dropped
+        self.writer.write_table(self._conform(table, schema))
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+OUTPUTS = {
+    FORMAT_CSV: CsvOutput,
+    FORMAT_NDJSON: NdjsonOutput,
+    FORMAT_PARQUET: ParquetOutput,
+}
+
+
+def read_slice(es, pit, query, page_size, pages, stop, slice_id=None, slices=1, sort=None, fields=None):
+    """Page through one slice of the PIT with search_after, putting lists of
+    _source documents on the pages queue and None when the slice is done.
+    pit['id'] is shared by the slices and kept at the latest PIT id."""
+    search_after = None
+    try:
+        while not stop.is_set():
+            request = {
+                'pit': {'id': pit['id'], 'keep_alive': KEEP_ALIVE},
+                'query': query,
+                'sort': sort or [{'_shard_doc': 'asc'}],
+                'size': page_size,
+                'track_total_hits': False,
+                'filter_path': FILTER_PATH,
+            }
+            if slices > 1:
+                request['slice'] = {'id': slice_id, 'max': slices}
+            if search_after is not None:
+                request['search_after'] = search_after
+            if fields:
+                request['source'] = fields
+            response = es.search(**request)
+            # The PIT id may change between requests; always use the latest
+            pit['id'] = response.get('pit_id', pit['id'])
+            hits = response.get('hits', {}).get('hits', [])
+            if not hits:
+                break
+            search_after = hits[-1]['sort']
+            # Blocks while the writer is behind, which bounds memory
+            pages.put([hit.get('_source', {}) for hit in hits])
+            if len(hits) < page_size:
+                break
+        pages.put(None)
+    except Exception as e:
+        pages.put(e)
+
+
+def export(es, index, output, query, slices=DEFAULT_SLICES, page_size=DEFAULT_PAGE_SIZE,
+           sort=None, fields=None):
+    """Export every matching document to output; returns the number exported"""
+    pit = {'id': es.open_point_in_time(index=index, keep_alive=KEEP_ALIVE)['id']}
+    logger.info(f"Opened point in time on {index}, reading {slices} slice(s) of {page_size} documents")
+    # A few pages per slice in flight at most
+    pages = queue.Queue(maxsize=2 * slices)
+    stop = threading.Event()
+    threads = [
+        threading.Thread(target=read_slice, name=f'export-slice-{slice_id}', daemon=True,
+                         args=(es, pit, query, page_size, pages, stop, slice_id, slices, sort, fields))
+        for slice_id in range(slices)
+    ]
+    for thread in threads:
+        thread.start()
+
+    started = last_report = time.monotonic()
+    exported = 0
+    running = len(threads)
+    try:
+        while running:
+            page = pages.get()
+            if page is None:
+                running -= 1
+                continue
+            if isinstance(page, Exception):
+                raise page
+            output.write(page)
+            exported += len(page)
+            now = time.monotonic()
+            if now - last_report >= PROGRESS_INTERVAL:
+                logger.info(f"Exported {exported} documents ({exported / (now - started):,.0f} docs/s)")
+                last_report = now
+    finally:
+        stop.set()
+        # Unblock slices waiting on a full queue so they can see the stop flag
+        while any(thread.is_alive() for thread in threads):
+            try:
+                pages.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        try:
+            es.close_point_in_time(id=pit['id'])
+        except Exception as e:
+            logger.warning(f"Could not close point in time: {str(e)}")
+
+    elapsed = time.monotonic() - started
+    logger.info(f"Exported {exported} documents in {elapsed:.1f}s ({exported / max(elapsed, 1e-9):,.0f} docs/s)")
+    return exported
+
+
+def main():
+    """Main function to run the export"""
+    args = parse_arguments()
+    fmt = output_format(args.output, args.format)
+    fields = [field.strip() for field in args.fields.split(',') if field.strip()] if args.fields else None
+    slices = 1 if args.sorted else max(1, args.slices)
+    sort = [{'@timestamp': 'asc'}, {'_shard_doc': 'asc'}] if args.sorted else None
+
+    es = create_client(args.host, request_timeout=120, pool_size=slices + 2, default_password='changeme')
+    # Parquet columns are typed from the mapping, not just the first page
+    options = {'field_types': fetch_field_types(es, args.index)} if fmt == FORMAT_PARQUET else {}
+    try:
+        output = OUTPUTS[fmt](args.output, fields, **options)
+    except (ImportError, ValueError, OSError) as e:
+        logger.error(str(e))
+        sys.exit(1)
+
+    try:
+        export(es, args.index, output, build_query(args.start, args.end, args.query),
+               slices=slices, page_size=args.page_size, sort=sort, fields=fields)
+    except Exception as e:
+        logger.error(f"Export failed: {str(e)}")
+        sys.exit(1)
+    finally:
+        output.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+File-level Work Scheduler
+
+Expands --input arguments (files, directories and glob patterns) into a list
+of CSV files, spreads them over a pool of worker threads largest-first, and
+keeps a JSON-lines manifest of files that were ingested successfully so that
+reruns skip them.
+"""
+
+import glob
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+logger = logging.getLogger(__name__)
+
+# File name suffixes picked up when a directory is given as input
+INPUT_SUFFIXES = ('.csv', '.csv.gz', '.csv.bz2', '.csv.zst')
+
+
+def _is_input_file(path):
+    return os.path.isfile(path) and path.lower().endswith(INPUT_SUFFIXES)
+
+
+def expand_inputs(inputs):
+    """Expand files, directories and glob patterns into a de-duplicated file list"""
+    files = []
+    seen = set()
+
+    def add(path):
+        key = os.path.abspath(path)
+        if key not in seen:
+            seen.add(key)
+            files.append(path)
+
+    for entry in inputs:
+        if os.path.isdir(entry):
+            for root, _, names in os.walk(entry):
+                for name in sorted(names):
+                    path = os.path.join(root, name)
+                    if _is_input_file(path):
+                        add(path)
+        elif glob.has_magic(entry):
+            matches = [path for path in sorted(glob.glob(entry, recursive=True)) if os.path.isfile(path)]
+            if not matches:
+                logger.warning(f"No files match pattern: {entry}")
+            for path in matches:
+                add(path)
+        else:
+            # Plain paths are passed through so a missing file is reported by the reader
+            add(entry)
+
+    return files
+
+
+def order_largest_first(files):
+    """Sort files by size, largest first, so long files do not finish last"""
+    def size(path):
+        try:
+            return os.path.getsize(path)
+        except OSError:
+            return 0
+    return sorted(files, key=size, reverse=True)
+
+
+class IngestManifest:
+    """Append-only record of files that were ingested successfully.
+
+    A file is considered done when its absolute path, size and modification
+    time all match a manifest entry, so a file that was rewritten after it
+    was ingested is picked up again.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._done = set()
+        self._load()
+
+    @staticmethod
+    def _file_key(path):
+        stat = os.stat(path)
+        return (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'r') as f:
+            for line_number, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entry = json.loads(line)
+                    self._done.add((entry['path'], entry['size'], entry['mtime_ns']))
+                except (ValueError, KeyError):
+                    logger.warning(f"Ignoring malformed manifest line {line_number} in {self.path}")
+        logger.info(f"Loaded {len(self._done)} completed files from manifest {self.path}")
+
+    def is_done(self, path):
+        """Return True if the file was already ingested in its current state"""
+        try:
+            return self._file_key(path) in self._done
+        except OSError:
+            return False
+
+    def record(self, path, **details):
+        """Record a successfully ingested file"""
+        abs_path, size, mtime_ns = self._file_key(path)
+        entry = {
+            'path': abs_path,
+            'size': size,
+            'mtime_ns': mtime_ns,
+            'completed_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        }
+        entry.update(details)
+        with self._lock:
+            with open(self.path, 'a') as f:
+                f.write(json.dumps(entry) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            self._done.add((abs_path, size, mtime_ns))
+
+
+def run_scheduled(files, ingest_file, workers=1, manifest=None, order=order_largest_first):
+    """Run ingest_file(path) for every file and return {path: result}.
+
+    ingest_file must return a (success, details) tuple; details is stored in
+    the manifest for successful files. Files already in the manifest are
+    skipped. order(files) gives the submission order (largest first by
+    default; backfills pass sorted to go through files by name).
+    """
+    pending = []
+    for path in order(files):
+        if manifest and manifest.is_done(path):
+            logger.info(f"Skipping {path}: already ingested according to manifest")
+        else:
+            pending.append(path)
+
+    results = {}
+    if not pending:
+        return results
+
+    logger.info(f"Scheduling {len(pending)} files across {workers} workers")
+
+    def run(path):
+        try:
+            return ingest_file(path)
+        except Exception as e:
+            logger.error(f"Unexpected error ingesting {path}: {str(e)}")
+            return False, {}
+
+    # Submission order is largest-first by default; the pool hands work to whichever
+    # worker frees up next, which keeps the tail of the run short.
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = {executor.submit(run, path): path for path in pending}
+        for future in as_completed(futures):
+            path = futures[future]
+            success, details = future.result()
+            results[path] = success
+            if success and manifest:
+                manifest.record(path, **details)
+
+    return results
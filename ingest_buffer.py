@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+Ingest Buffer
+
+In-process ring buffer and background flusher used by the HTTP push
+endpoint. Requests only validate documents and append them to the buffer;
+a single flusher thread drains the buffer into bulk requests once
+`flush_size` documents are waiting or `flush_interval` seconds have passed,
+turning many small client requests into a few large bulk calls.
+
+AsyncBulkFlusher is the asyncio counterpart used by the ASGI service: the
+same buffer and batching rules, drained by a task on the event loop with
+AsyncElasticsearch.
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+
+from elasticsearch import helpers
+
+logger = logging.getLogger(__name__)
+
+
+class BufferFull(Exception):
+    """Raised when a batch does not fit in the remaining buffer capacity"""
+
+
+class RingBuffer:
+    """Bounded, thread-safe FIFO of documents waiting to be flushed"""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._items = deque()
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._items)
+
+    def offer(self, docs):
+        """Append all docs or none of them; returns the new depth"""
+        with self._lock:
+            if len(self._items) + len(docs) > self.capacity:
+                raise BufferFull(
+                    f"Ingest buffer full ({len(self._items)}/{self.capacity} documents queued)"
+                )
+            self._items.extend(docs)
+            self._not_empty.notify()
+            return len(self._items)
+
+    def requeue(self, docs):
+        """Put docs back at the front after a failed flush, dropping what does not fit"""
+        with self._lock:
+            room = max(0, self.capacity - len(self._items))
+            kept = docs[:room]
+            self._items.extendleft(reversed(kept))
+            return len(docs) - len(kept)
+
+    def wait(self, min_items, timeout):
+        """Block until min_items are queued or the timeout expires"""
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            while len(self._items) < min_items:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._not_empty.wait(remaining)
+            return len(self._items)
+
+    def drain(self, max_items):
+        """Remove and return up to max_items documents"""
+        with self._lock:
+            count = min(max_items, len(self._items))
+            return [self._items.popleft() for _ in range(count)]
+
+
+class BulkFlusher:
+    """Background thread draining a RingBuffer into bulk requests"""
+
+    def __init__(self, buffer, get_client, flush_size=1000, flush_interval=1.0):
+        self.buffer = buffer
+        self.get_client = get_client
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.stats = {'flushed': 0, 'failed': 0, 'dropped': 0, 'bulk_requests': 0}
+        self._stopping = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='ingest-flusher', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=10):
+        """Stop the thread after a final flush"""
+        self._stopping.set()
+        self._thread.join(timeout)
+
+    def _run(self):
+        while not self._stopping.is_set():
+            self.buffer.wait(self.flush_size, self.flush_interval)
+            if self.flush() is False:
+                # No client or a failed request: back off before retrying
+                self._stopping.wait(self.flush_interval)
+        # Final drain on shutdown
+        while len(self.buffer) and self.flush():
+            pass
+
+    def flush(self):
+        """Send one bulk request.
+
+        Returns True if a request was sent, False if it could not be sent
+        (no client or a connection failure) and None if the buffer is empty.
+        """
+        if not len(self.buffer):
+            return None
+        es = self.get_client()
+        if es is None:
+            return False
+
+        docs = self.buffer.drain(self.flush_size)
+        if not docs:
+            return None
+
+        try:
+            # Documents target sensor aliases; a missing alias must not
+            # silently become a plain index
+            success, errors = helpers.bulk(es, docs, raise_on_error=False, require_alias=True)
+        except Exception as e:
+            # Connection-level failure: keep the documents for the next attempt
+            dropped = self.buffer.requeue(docs)
+            self.stats['dropped'] += dropped
+            logger.warning(f"Bulk flush of {len(docs)} buffered documents failed, will retry: {str(e)}")
+            return False
+
+        self.stats['bulk_requests'] += 1
+        self.stats['flushed'] += success
+        self.stats['failed'] += len(errors)
+        if errors:
+            logger.warning(f"{len(errors)} buffered documents were rejected, first error: {errors[0]}")
+        logger.debug(f"Flushed {success} buffered documents")
+        return True
+
+
+class AsyncBulkFlusher:
+    """asyncio task draining a RingBuffer into bulk requests"""
+
+    def __init__(self, buffer, get_client, flush_size=1000, flush_interval=1.0):
+        self.buffer = buffer
+        self.get_client = get_client
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.stats = {'flushed': 0, 'failed': 0, 'dropped': 0, 'bulk_requests': 0}
+        self._wakeup = asyncio.Event()
+        self._stopping = asyncio.Event()
+        self._task = None
+
+    def start(self):
+        """Start the flusher task on the running event loop"""
+        self._task = asyncio.get_running_loop().create_task(self._run(), name='ingest-flusher')
+        return self
+
+    def notify(self):
+        """Wake the flusher early once a full batch is waiting"""
+        if len(self.buffer) >= self.flush_size:
+            self._wakeup.set()
+
+    async def stop(self, timeout=10):
+        """Stop the task after a final flush"""
+        self._stopping.set()
+        self._wakeup.set()
+        if self._task is None:
+            return
+        try:
+            await asyncio.wait_for(self._task, timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Ingest flusher did not finish within {timeout}s, "
+                           f"{len(self.buffer)} documents left in the buffer")
+
+    async def _wait(self, event, timeout):
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _run(self):
+        while not self._stopping.is_set():
+            if len(self.buffer) < self.flush_size:
+                self._wakeup.clear()
+                await self._wait(self._wakeup, self.flush_interval)
+            if await self.flush() is False:
+                # No client or a failed request: back off before retrying
+                await self._wait(self._stopping, self.flush_interval)
+        # Final drain on shutdown
+        while len(self.buffer) and await self.flush():
+            pass
+
+    async def flush(self):
+        """Send one bulk request; same return values as BulkFlusher.flush()"""
+        if not len(self.buffer):
+            return None
+        es = self.get_client()
+        if es is None:
+            return False
+
+        docs = self.buffer.drain(self.flush_size)
+        if not docs:
+            return None
+
+        try:
+            success, errors = await helpers.async_bulk(es, docs, raise_on_error=False, require_alias=True)
+        except Exception as e:
+            # Connection-level failure: keep the documents for the next attempt
+            dropped = self.buffer.requeue(docs)
+            self.stats['dropped'] += dropped
+            logger.warning(f"Bulk flush of {len(docs)} buffered documents failed, will retry: {str(e)}")
+            return False
+
+        self.stats['bulk_requests'] += 1
+        self.stats['flushed'] += success
+        self.stats['failed'] += len(errors)
+        if errors:
+            logger.warning(f"{len(errors)} buffered documents were rejected, first error: {errors[0]}")
+        logger.debug(f"Flushed {success} buffered documents")
+        return True
@@ -7,22 +7,47 @@ It supports temperature and air quality sensor data formats.
 """
 
 import argparse
+import contextlib
 import csv
 import json
 import logging
 import os
 import sys
-import uuid
-import ssl
-from datetime import datetime
-from urllib.parse import urlparse
-
-import pandas as pd
-import requests
-from elasticsearch import Elasticsearch, helpers
-from elasticsearch.exceptions import ApiError, ConnectionError as ESConnectionError
+
 from dotenv import load_dotenv
 
+from timestamp_conversion import (
+    OUTPUT_CHOICES,
+    OUTPUT_ISO,
+    TimestampConverter,
+    add_timestamp_column,
+)
+from schema_mapping import LAYOUT_CHOICES, LAYOUT_NESTED, SchemaMappingError, cached_plan
+from file_scheduler import IngestManifest, expand_inputs, order_largest_first, run_scheduled
+from compressed_io import CompressionMeter, detect_compression, open_text
+from tail_follower import DEFAULT_LINGER, DEFAULT_POLL_INTERVAL, START_BEGINNING, START_CHOICES, follow
+from metrics import Counter, push_metrics, write_metrics_file
+from client_factory import create_client
+from bulk_load import BulkLoadMode
+from backfill import WINDOW_CHOICES, BackfillRouter, partition_documents
+from pre_aggregation import MODE_CHOICES, MODE_REPLACE, MODE_SUMMARY, PreAggregator, interval_seconds
+from sensor_registry import sensor_for_index
+from deduplication import (
+    CACHE_CHOICES,
+    DEFAULT_FALSE_POSITIVE_RATE,
+    DEFAULT_MEMORY_MB,
+    KEY_AUTO,
+    KEY_CHOICES,
+    Deduplicator,
+    create_cache,
+)
+from pipeline_profiler import HOTTEST_PHASE, NullProfiler, PipelineProfiler
+from lazy_imports import lazy_import, preload
+
+# Imported on first use, so --help and argument errors return immediately
+pd = lazy_import('pandas')
+helpers = lazy_import('elasticsearch.helpers')
+
 # Load environment variables
 load_dotenv()
 
@@ -33,63 +58,99 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+INGEST_DOCUMENTS = Counter(
+    'ingest_documents', 'Documents processed by the bulk ingestion script', ['index', 'result']
+)
+
 def parse_arguments():
     """Parse command line arguments"""
     parser = argparse.ArgumentParser(description='Ingest CSV data into Elasticsearch')
-    parser.add_argument('--csv', required=True, help='Path to the CSV file')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--csv', help='Path to the CSV file')
+    source.add_argument('--input', nargs='+',
+                        help='CSV files, directories or glob patterns to ingest')
     parser.add_argument('--index', required=True, help='Target Elasticsearch data stream')
     parser.add_argument('--host', default=os.environ.get('ES_HOST', 'http://localhost:9200'), 
                         help='Elasticsearch host URL')
     parser.add_argument('--batch-size', type=int, default=1000, 
                         help='Batch size for bulk ingestion')
     parser.add_argument('--timestamp-field', default='timestamp', 
-                        help='Field name for timestamp in the CSV')
+                        help='Field name for timestamp in the CSV (falls back to @timestamp '
+                             'or a *.timestamp column when missing)')
     parser.add_argument('--timestamp-format', default='%Y-%m-%d %H:%M:%S', 
-                        help='Format for parsing timestamps')
+                        help='Format for parsing timestamps that are not ISO 8601 or epoch values')
+    parser.add_argument('--timestamp-output', default=OUTPUT_ISO, choices=OUTPUT_CHOICES,
+                        help='Representation of @timestamp in the ingested documents')
+    parser.add_argument('--document-layout', default=LAYOUT_NESTED, choices=LAYOUT_CHOICES,
+                        help='Emit nested objects or flattened dotted field names')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Number of files ingested in parallel')
+    parser.add_argument('--manifest',
+                        help='JSON-lines manifest of ingested files; listed files are skipped on reruns')
+    parser.add_argument('--compress-requests', action='store_true',
+                        help='Gzip-compress bulk request bodies (for bandwidth-limited links)')
+    parser.add_argument('--follow', action='store_true',
+                        help='Keep running and ingest rows as they are appended to the input files')
+    parser.add_argument('--offsets-file', default='.ingest_offsets.json',
+                        help='Where --follow persists file offsets between restarts')
+    parser.add_argument('--linger', type=float, default=DEFAULT_LINGER,
+                        help='Seconds --follow waits for more rows before flushing a partial batch')
+    parser.add_argument('--poll-interval', type=float, default=DEFAULT_POLL_INTERVAL,
+                        help='Seconds between checks for new rows when inotify is unavailable')
+    parser.add_argument('--start-at', default=START_BEGINNING, choices=START_CHOICES,
+                        help='Where --follow starts in files without a saved offset')
+    parser.add_argument('--metrics-file',
+                        help='Write Prometheus metrics to this file when the run ends')
+    parser.add_argument('--metrics-push-url', default=os.environ.get('METRICS_PUSHGATEWAY_URL'),
+                        help='Push metrics to this Prometheus Pushgateway when the run ends')
+    parser.add_argument('--profile', action='store_true',
+                        help='Report wall/CPU time, rows and bytes per pipeline phase')
+    parser.add_argument('--trace-file',
+                        help='Write a Chrome trace (chrome://tracing) of the pipeline phases; implies --profile')
+    parser.add_argument('--cprofile-out',
+                        help='Write cProfile data of one phase to this file; implies --profile')
+    parser.add_argument('--cprofile-phase', default=HOTTEST_PHASE,
+                        choices=[HOTTEST_PHASE, 'read_csv', 'timestamps', 'dedup', 'prepare_documents',
+                                 'pre_aggregate', 'bulk'],
+                        help="Phase profiled for --cprofile-out ('auto' dumps the slowest phase)")
+    parser.add_argument('--backfill-window', choices=WINDOW_CHOICES,
+                        help='Backfill historical data: roll the data stream over per day, week or month '
+                             'so each time window gets its own backing index')
+    parser.add_argument('--bulk-load-mode', action='store_true',
+                        help='Disable refreshes and replicas on the write index during the run, '
+                             'then restore them and refresh')
+    parser.add_argument('--async-translog', action='store_true',
+                        help='With --bulk-load-mode, also fsync the translog asynchronously '
+                             '(faster, but a node crash can lose the last seconds of the load)')
+    parser.add_argument('--pre-aggregate', metavar='INTERVAL',
+                        help='Summarize rows into min/max/avg/count documents per host and interval '
+                             '(e.g. 1m, 30s, 1h)')
+    parser.add_argument('--pre-aggregate-mode', default=MODE_SUMMARY, choices=MODE_CHOICES,
+                        help="'summary': raw documents in --index plus summaries in --summary-index; "
+                             "'replace': only the summaries, in --summary-index")
+    parser.add_argument('--summary-index',
+                        help='Data stream for summary documents (default: <sensor type>_summary-ds)')
+    parser.add_argument('--dedup', choices=CACHE_CHOICES,
+                        help="Drop replayed readings seen recently: 'lru' keeps exact keys, "
+                             "'bloom' many more keys per MB with a small false-positive rate")
+    parser.add_argument('--dedup-key', default=KEY_AUTO, choices=KEY_CHOICES,
+                        help="Reading key: the source uuid, or host and timestamp ('auto': uuid if present)")
+    parser.add_argument('--dedup-memory', type=float, default=DEFAULT_MEMORY_MB,
+                        help='Memory budget of the recent-key cache in MB')
+    parser.add_argument('--dedup-fp-rate', type=float, default=DEFAULT_FALSE_POSITIVE_RATE,
+                        help='False-positive rate of the Bloom filter (new readings wrongly dropped)')
+    parser.add_argument('--dedup-window', type=float,
+                        help='With --dedup bloom, also start a new filter generation every this many seconds')
     parser.add_argument('--dry-run', action='store_true', 
                         help='Print documents instead of ingesting')
     return parser.parse_args()
 
-def connect_to_elasticsearch(host):
+def connect_to_elasticsearch(host, pool_size=None, http_compress=False):
     """Connect to Elasticsearch cluster with 8.x compatibility"""
     try:
-        # Get credentials from environment variables
-        username = os.environ.get('ES_USERNAME', 'elastic')
-        password = os.environ.get('ES_PASSWORD', 'changeme')
-        api_key = os.environ.get('ES_API_KEY', '')
-        
-        # Parse URL to determine if SSL is needed
-        parsed_url = urlparse(host)
-        use_ssl = parsed_url.scheme == 'https'
-        
-        # Setup SSL context if using HTTPS
-        ssl_context = None
-        if use_ssl:
-            ssl_context = ssl.create_default_context()
-            # If using self-signed certs, you can disable verification
-            if os.environ.get('ES_VERIFY_CERTS', 'true').lower() == 'false':
-                ssl_context.check_hostname = False
-                ssl_context.verify_mode = ssl.CERT_NONE
-        
-        # Configure connection options for Elasticsearch 8.x
-        conn_params = {
-            'hosts': [host],
-            'request_timeout': 30,
-            'retry_on_timeout': True
-        }
-        
-        # Add authentication
-        if api_key:
-            conn_params['api_key'] = api_key
-        elif password:
-            conn_params['basic_auth'] = (username, password)
-        
-        # Add SSL if needed
-        if ssl_context:
-            conn_params['ssl_context'] = ssl_context
-            
-        # Create the Elasticsearch client with appropriate parameters
-        es = Elasticsearch(**conn_params)
+        # One pooled client is shared by all workers; size the pool to match
+        es = create_client(host, request_timeout=30, pool_size=pool_size,
+                           http_compress=http_compress, default_password='changeme')
         
         # Test the connection
         if not es.ping():
@@ -106,69 +167,53 @@ def connect_to_elasticsearch(host):
         logger.error(f"Error connecting to Elasticsearch: {str(e)}")
         return None
 
-def prepare_temperature_document(row, index_name):
-    """Prepare a temperature sensor document for ingestion"""
-    doc = {
-        "_index": index_name,
-        "@timestamp": row.get("timestamp"),
-        "measurement_name": "temperature",
-        "tag": {
-            "host": row.get("host", "unknown"),
-            "sensor_type": "temperature"
-        },
-        "uuid": str(uuid.uuid4()),
-        "temperaturesensor": {
-            "telemetry_temperature_value": float(row.get("temperature_value", 0)),
-            "telemetry_temperature_unit": row.get("temperature_unit", "C")
-        }
-    }
-    return doc
-
-def prepare_air_quality_document(row, index_name):
-    """Prepare an air quality sensor document for ingestion"""
-    doc = {
-        "_index": index_name,
-        "@timestamp": row.get("timestamp"),
-        "measurement_name": "air_quality",
-        "tag": {
-            "host": row.get("host", "unknown"),
-            "sensor_type": "air_quality"
-        },
-        "uuid": str(uuid.uuid4()),
-        "airqualitysensor": {
-            "telemetry_co_value": float(row.get("co_value", 0)),
-            "telemetry_no2_value": float(row.get("no2_value", 0)),
-            "telemetry_o3_value": float(row.get("o3_value", 0)),
-            "telemetry_pm10_value": float(row.get("pm10_value", 0)),
-            "telemetry_pm25_value": float(row.get("pm25_value", 0)),
-            "telemetry_so2_value": float(row.get("so2_value", 0))
-        }
-    }
-    return doc
-
-def prepare_documents(df, index_name):
+def prepare_documents(df, index_name, layout=LAYOUT_NESTED):
     """Prepare documents for bulk ingestion based on index type"""
-    docs = []
-    
-    if "temperaturesensor" in index_name.lower():
-        for _, row in df.iterrows():
-            doc = prepare_temperature_document(row, index_name)
-            docs.append(doc)
-    elif "airqualitysensor" in index_name.lower():
-        for _, row in df.iterrows():
-            doc = prepare_air_quality_document(row, index_name)
-            docs.append(doc)
-    else:
-        logger.error(f"Unknown index type: {index_name}")
-        return []
-    
-    return docs
+    plan = cached_plan(tuple(df.columns), index_name, layout)
+    return plan.documents(df)
+
+def create_aggregator(args):
+    """PreAggregator for --pre-aggregate, or None"""
+    if not args.pre_aggregate:
+        return None
+    # Summaries always go to a stream whose template maps their min/max,
+    # count and interval fields, also when they replace the raw documents
+    sensor = sensor_for_index(args.index)
+    target = args.summary_index or sensor.summary_stream
+    return PreAggregator(sensor, args.pre_aggregate, target, args.document_layout)
+
+def aggregate_documents(aggregator, df, args, profiler):
+    """Raw documents (unless replaced) plus the summaries completed by a batch"""
+    documents = []
+    if aggregator is None or args.pre_aggregate_mode != MODE_REPLACE:
+        with profiler.phase('prepare_documents') as phase:
+            documents = prepare_documents(df, args.index, args.document_layout)
+            phase.rows = len(documents)
+    if aggregator is not None:
+        with profiler.phase('pre_aggregate', rows=len(df)):
+            plan = cached_plan(tuple(df.columns), args.index, args.document_layout)
+            documents += aggregator.add(plan, df)
+    return documents
 
-def bulk_ingest(es, documents, batch_size, dry_run):
+def drop_duplicates(deduplicator, df, args, profiler):
+    """(df without the readings the deduplicator has seen recently, the keys
+    to record once the remaining readings are indexed)"""
+    if deduplicator is None:
+        return df, []
+    with profiler.phase('dedup', rows=len(df)):
+        plan = cached_plan(tuple(df.columns), args.index, args.document_layout)
+        before = len(df)
+        df, keys = deduplicator.filter(plan, df)
+    if len(df) < before:
+        INGEST_DOCUMENTS.labels(args.index, 'duplicate').inc(before - len(df))
+    return df, keys
+
+def bulk_ingest(es, documents, batch_size, dry_run, compression_meter=None, profiler=None):
     """Perform bulk ingestion of documents into Elasticsearch"""
+    profiler = profiler or NullProfiler()
     if dry_run:
         for doc in documents[:5]:  # Print first 5 documents as a sample
-            logger.info(f"Document sample (dry run): {json.dumps(doc, indent=2)}")
+            logger.info(f"Document sample (dry run): {json.dumps(doc, indent=2, default=str)}")
         logger.info(f"Dry run complete. Would have ingested {len(documents)} documents")
         return True
 
@@ -178,14 +223,20 @@ def bulk_ingest(es, documents, batch_size, dry_run):
     
     for i in range(0, len(documents), batch_size):
         batch = documents[i:i+batch_size]
+        if compression_meter:
+            compression_meter.observe(batch)
+        index_name = batch[0].get('_index', '')
         try:
-            resp = helpers.bulk(es, batch)
+            with profiler.phase('bulk', rows=len(batch)):
+                resp = helpers.bulk(es, batch)
             success_count += resp[0]
             error_count += len(resp[1]) if len(resp) > 1 else 0
+            INGEST_DOCUMENTS.labels(index_name, 'success').inc(resp[0])
             logger.info(f"Ingested batch {i//batch_size + 1}/{(total_docs//batch_size) + 1}")
         except Exception as e:
             logger.error(f"Error during bulk ingestion: {str(e)}")
             error_count += len(batch)
+            INGEST_DOCUMENTS.labels(index_name, 'error').inc(len(batch))
     
     logger.info(f"Ingestion complete. Successfully ingested {success_count}/{total_docs} documents")
     if error_count > 0:
@@ -193,57 +244,298 @@ def bulk_ingest(es, documents, batch_size, dry_run):
     
     return error_count == 0
 
-def main():
-    """Main function to run the ingestion process"""
-    args = parse_arguments()
-    
-    # Connect to Elasticsearch
-    es = connect_to_elasticsearch(args.host)
-    if not es:
-        sys.exit(1)
-    
-    # Read CSV file
+def add_timestamps(df, args, converter, source):
+    """Add the "timestamp" column used for @timestamp to a DataFrame"""
+    # Columns that are already ISO 8601 or epoch values are passed through
+    timestamp_column = add_timestamp_column(df, converter, args.timestamp_field)
+    if not timestamp_column:
+        logger.warning(f"Timestamp field '{args.timestamp_field}' not found in {source}. Using current time.")
+    elif timestamp_column != args.timestamp_field:
+        logger.debug(f"Using timestamp column '{timestamp_column}' in {source}")
+
+def ingest_file(es, path, args, compression_meter=None, profiler=None, router=None, deduplicator=None,
+                aggregator=None):
+    """Ingest a single CSV file and return (success, details).
+
+    An aggregator is shared by the files of a run, which must then go
+    through it one at a time in time order; its open buckets are written
+    by flush_summaries() at the end.
+    """
+    profiler = profiler or NullProfiler()
+    keys = []
+    stored = False
     try:
-        logger.info(f"Reading data from {args.csv}")
-        df = pd.read_csv(args.csv)
+        logger.info(f"Reading data from {path}")
+        # Compressed inputs (.gz, .bz2, .zst) are decompressed while reading
+        with profiler.phase('read_csv') as phase:
+            with open_text(path) as f:
+                df = pd.read_csv(f)
+            phase.rows = len(df)
+            phase.bytes = os.path.getsize(path)
         
-        # Convert timestamp column to proper format
-        if args.timestamp_field in df.columns:
-            df[args.timestamp_field] = pd.to_datetime(df[args.timestamp_field], 
-                                                    format=args.timestamp_format)
-            # Convert to ISO format for Elasticsearch
-            df["timestamp"] = df[args.timestamp_field].dt.strftime('%Y-%m-%dT%H:%M:%S.%fZ')
-        else:
-            logger.warning(f"Timestamp field '{args.timestamp_field}' not found in CSV. Using current time.")
-            df["timestamp"] = datetime.now().strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+        converter = TimestampConverter(output=args.timestamp_output,
+                                       timestamp_format=args.timestamp_format)
+        with profiler.phase('timestamps', rows=len(df)):
+            add_timestamps(df, args, converter, path)
+        converter.log_report()
+        
+        # Replayed readings are dropped before any document is built
+        df, keys = drop_duplicates(deduplicator, df, args, profiler)
+        if df.empty and deduplicator:
+            logger.info(f"Every reading in {path} is a duplicate; nothing to ingest")
+            stored = True
+            return True, {'index': args.index, 'documents': 0}
         
         # Prepare documents for ingestion
-        logger.info(f"Preparing documents for ingestion into {args.index}")
-        documents = prepare_documents(df, args.index)
+        logger.info(f"Preparing documents from {path} for ingestion into {args.index}")
+        aggregated = aggregator.rows if aggregator else 0
+        documents = aggregate_documents(aggregator, df, args, profiler)
         
         if not documents:
-            logger.error("No valid documents to ingest")
-            sys.exit(1)
+            if aggregator and aggregator.rows > aggregated:
+                logger.info(f"The rows of {path} are all in buckets that are still open")
+                stored = True
+                return True, {'index': args.index, 'documents': 0}
+            logger.error(f"No valid documents to ingest in {path}")
+            return False, {}
         
         # Perform bulk ingestion
-        logger.info(f"Starting bulk ingestion of {len(documents)} documents")
-        success = bulk_ingest(es, documents, args.batch_size, args.dry_run)
-        
-        if not success and not args.dry_run:
-            logger.error("Ingestion completed with errors")
-            sys.exit(1)
-        
-        logger.info("Ingestion completed successfully")
+        logger.info(f"Starting bulk ingestion of {len(documents)} documents from {path}")
+        if router:
+            # Backfill: one rollover-separated backing index per time window
+            success = True
+            for window, window_documents in partition_documents(documents, args.backfill_window):
+                router.route(window)
+                success = bulk_ingest(es, window_documents, args.batch_size, args.dry_run,
+                                      compression_meter, profiler) and success
+        else:
+            success = bulk_ingest(es, documents, args.batch_size, args.dry_run, compression_meter, profiler)
+        stored = success
+        return success, {'index': args.index, 'documents': len(documents)}
         
     except FileNotFoundError:
-        logger.error(f"CSV file not found: {args.csv}")
-        sys.exit(1)
+        logger.error(f"CSV file not found: {path}")
+    except SchemaMappingError as e:
+        logger.error(f"Schema mapping error in {path}: {str(e)}")
     except pd.errors.ParserError as e:
-        logger.error(f"Error parsing CSV file: {str(e)}")
+        logger.error(f"Error parsing CSV file {path}: {str(e)}")
+    except (ImportError, OSError, EOFError) as e:
+        logger.error(f"Error reading {path}: {str(e)}")
+    finally:
+        if deduplicator:
+            # Only indexed readings count as seen, so a failed file can be retried
+            (deduplicator.record if stored else deduplicator.release)(keys)
+    return False, {}
+
+def flush_summaries(es, aggregator, args, profiler, router=None):
+    """Write the buckets a shared aggregator still holds open; True on success"""
+    summaries = aggregator.flush()
+    success = True
+    if summaries:
+        logger.info(f"Writing {len(summaries)} summaries of the buckets still open")
+    if summaries and router:
+        for window, window_documents in partition_documents(summaries, args.backfill_window):
+            router.route(window)
+            success = bulk_ingest(es, window_documents, args.batch_size, args.dry_run,
+                                  profiler=profiler) and success
+    elif summaries:
+        success = bulk_ingest(es, summaries, args.batch_size, args.dry_run, profiler=profiler)
+    aggregator.log_report()
+    return success
+
+def follow_files(es, files, args, profiler=None, deduplicator=None):
+    """Tail the input files and ingest appended rows until interrupted"""
+    compressed = [path for path in files if detect_compression(path)]
+    if compressed:
+        logger.error(f"Compressed files cannot be followed: {', '.join(compressed)}")
+        return False
+    
+    profiler = profiler or NullProfiler()
+    # One converter per file keeps the detected timestamp kind and its cache
+    converters = {}
+    # Open buckets are carried between batches and files; a bucket of a
+    # host whose rows continue in a rotated file gets a single summary
+    aggregator = create_aggregator(args)
+    
+    def handle_batch(path, header, rows):
+        valid = [row for row in rows if len(row) == len(header)]
+        if len(valid) < len(rows):
+            logger.warning(f"Skipping {len(rows) - len(valid)} malformed rows in {path}")
+        if not valid:
+            return True
+        
+        if path not in converters:
+            converters[path] = TimestampConverter(output=args.timestamp_output,
+                                                  timestamp_format=args.timestamp_format)
+        df = pd.DataFrame(valid, columns=header)
+        with profiler.phase('timestamps', rows=len(df)):
+            add_timestamps(df, args, converters[path], path)
+        df, keys = drop_duplicates(deduplicator, df, args, profiler)
+        if df.empty:
+            return True
+        documents = aggregate_documents(aggregator, df, args, profiler)
+        stored = not documents or bulk_ingest(es, documents, args.batch_size, args.dry_run, profiler=profiler)
+        if deduplicator:
+            # A batch that failed is retried by follow(); its keys must not count as seen yet
+            (deduplicator.record if stored else deduplicator.release)(keys)
+        return stored
+    
+    discover = (lambda: expand_inputs(args.input)) if args.input else None
+    try:
+        follow(files, handle_batch, args.offsets_file, batch_size=args.batch_size,
+               linger=args.linger, poll_interval=args.poll_interval, start_at=args.start_at,
+               discover=discover)
+    except SchemaMappingError as e:
+        # A header that cannot be mapped will not fix itself; stop loudly
+        logger.error(f"Schema mapping error: {str(e)}")
+        return False
+    
+    # The follower stopped cleanly; write the buckets that are still open
+    return flush_summaries(es, aggregator, args, profiler) if aggregator else True
+
+def export_metrics(args):
+    """Write and/or push the metrics collected during the run"""
+    if args.metrics_file:
+        write_metrics_file(args.metrics_file)
+    if args.metrics_push_url:
+        push_metrics(args.metrics_push_url, 'ingest_bulk')
+
+def export_profile(args, profiler):
+    """Log the per-phase report and write the trace and cProfile files"""
+    profiler.log_report()
+    if args.trace_file:
+        profiler.write_trace(args.trace_file)
+    if args.cprofile_out:
+        profiler.write_cprofile(args.cprofile_out)
+
+def run_ingestion(args, profiler):
+    """Ingest the selected files; exits with status 1 on failure"""
+    files = [args.csv] if args.csv else expand_inputs(args.input)
+    if not files:
+        logger.error("No input files found")
         sys.exit(1)
+    
+    if args.pre_aggregate:
+        try:
+            interval_seconds(args.pre_aggregate)
+        except ValueError as e:
+            logger.error(str(e))
+            sys.exit(1)
+        if sensor_for_index(args.index) is None:
+            logger.error(f"--pre-aggregate needs a known sensor type; none matches {args.index}")
+            sys.exit(1)
+    
+    deduplicator = None
+    if args.dedup:
+        try:
+            if args.dedup_memory <= 0:
+                raise ValueError("The deduplication memory budget must be positive")
+            cache = create_cache(args.dedup, args.dedup_memory, args.dedup_fp_rate, args.dedup_window)
+        except ValueError as e:
+            logger.error(str(e))
+            sys.exit(1)
+        # Shared by every file and worker, so replays across files are caught too
+        deduplicator = Deduplicator(cache, args.dedup_key)
+    
+    # Connect once; the client's connection pool is shared by all workers
+    es = connect_to_elasticsearch(args.host, pool_size=max(args.workers, 10),
+                                  http_compress=args.compress_requests)
+    if not es:
+        sys.exit(1)
+    profiler.instrument_serializer(es)
+    sensor = sensor_for_index(args.index)
+    if sensor and args.index == sensor.alias and not args.dry_run and not es.indices.exists_alias(name=args.index):
+        # Writing to a missing alias would create a plain index of that name
+        logger.error(f"Alias {args.index} does not exist; create it with setup_elasticsearch.py")
+        sys.exit(1)
+    
+    if args.follow:
+        if args.bulk_load_mode or args.backfill_window:
+            # A follower never finishes, so settings would never be restored
+            # and live rows would land in historical windows
+            logger.error("--bulk-load-mode and --backfill-window cannot be combined with --follow")
+            sys.exit(1)
+        success = follow_files(es, files, args, profiler, deduplicator)
+        if deduplicator:
+            deduplicator.log_report()
+        if not success:
+            sys.exit(1)
+        logger.info("Follower stopped")
+        return
+    
+    try:
+        # Dry runs never mark files as done
+        manifest = IngestManifest(args.manifest) if args.manifest and not args.dry_run else None
+        compression_meter = CompressionMeter() if args.compress_requests else None
+        # Buckets carry over from one file to the next, so summarized files
+        # go through a single worker in name (usually time) order
+        aggregator = create_aggregator(args)
+        if aggregator and args.workers > 1:
+            logger.info("--pre-aggregate reads the files one at a time, in name order")
+        summaries_written = True
+        # Settings are restored and the index refreshed even if the run fails
+        tuning = (BulkLoadMode(es, args.index, args.async_translog)
+                  if args.bulk_load_mode and not args.dry_run else contextlib.nullcontext())
+        with tuning:
+            if args.backfill_window and not args.dry_run:
+                # Windows must be written one after another, so files go
+                # through a single worker in name (usually time) order
+                router = BackfillRouter(es, args.index, args.backfill_window,
+                                        on_rollover=tuning.tune if args.bulk_load_mode else None)
+                try:
+                    results = run_scheduled(files, lambda path: ingest_file(es, path, args, compression_meter,
+                                                                            profiler, router, deduplicator,
+                                                                            aggregator),
+                                            manifest=manifest, order=sorted)
+                    if aggregator:
+                        summaries_written = flush_summaries(es, aggregator, args, profiler, router)
+                finally:
+                    router.finish()
+            else:
+                results = run_scheduled(files, lambda path: ingest_file(es, path, args, compression_meter, profiler,
+                                                                        deduplicator=deduplicator,
+                                                                        aggregator=aggregator),
+                                        workers=1 if aggregator else args.workers, manifest=manifest,
+                                        order=sorted if aggregator else order_largest_first)
+                if aggregator:
+                    summaries_written = flush_summaries(es, aggregator, args, profiler)
+        if compression_meter:
+            compression_meter.log_report()
+        if deduplicator:
+            deduplicator.log_report()
     except Exception as e:
         logger.error(f"Unexpected error: {str(e)}")
         sys.exit(1)
+    
+    failed = [path for path, success in results.items() if not success]
+    if len(files) > 1:
+        logger.info(f"Processed {len(results)} files ({len(files) - len(results)} skipped), {len(failed)} failed")
+    
+    if (failed or not summaries_written) and not args.dry_run:
+        for path in failed:
+            logger.error(f"Ingestion failed for {path}")
+        if not summaries_written:
+            logger.error("Writing the summaries of the last open buckets failed")
+        logger.error("Ingestion completed with errors")
+        sys.exit(1)
+    
+    logger.info("Ingestion completed successfully")
+
+def main():
+    """Main function to run the ingestion process"""
+    args = parse_arguments()
+    if args.profile or args.trace_file or args.cprofile_out:
+        # Import pandas before the clock starts, or it lands in read_csv
+        preload('pandas')
+        profiler = PipelineProfiler(trace=bool(args.trace_file),
+                                    cprofile_phase=args.cprofile_phase if args.cprofile_out else None)
+    else:
+        profiler = NullProfiler()
+    try:
+        run_ingestion(args, profiler)
+    finally:
+        export_metrics(args)
+        export_profile(args, profiler)
 
 if __name__ == "__main__":
     main()
@@ -3,23 +3,34 @@
 Kibana Setup Script
 
 This script configures Kibana with index patterns and dashboards for sensor telemetry data:
-- Creates index patterns for temperature and air quality sensors
+- Creates an index pattern for every sensor type in the sensor registry
 - Imports dashboard configurations
+
+Everything is sent as one NDJSON bundle through the saved objects _import
+API with overwrite semantics. The bundle's hash is cached per Kibana host so
+an unchanged bundle is not imported again.
 """
 
 import argparse
+import hashlib
 import json
 import logging
 import os
 import sys
-import time
-import ssl
-from urllib.parse import urlparse
 
-import requests
-from elasticsearch import Elasticsearch
 from dotenv import load_dotenv
 
+from client_factory import create_client, http_session
+from lazy_imports import lazy_import
+from readiness import add_wait_arguments, wait_for_services
+from sensor_registry import sensor_types
+from status_collector import count_searches
+
+requests = lazy_import('requests')
+
+# Seconds to wait for a Kibana API response; imports can take a while on a busy Kibana
+KIBANA_REQUEST_TIMEOUT = 60
+
 # Load environment variables
 load_dotenv()
 
@@ -38,498 +49,341 @@ def parse_arguments():
     parser.add_argument('--es-host', default=os.environ.get('ES_HOST', 'http://localhost:9200'),
                       help='Elasticsearch host URL')
     parser.add_argument('--wait', action='store_true', 
-                      help='Wait for Kibana to be available')
+                      help='Wait for Kibana and Elasticsearch to be available')
+    add_wait_arguments(parser)
     parser.add_argument('--dashboard-file', default='static/kibana_telemetry_dashboard.json',
                       help='Path to Kibana dashboard JSON file')
     parser.add_argument('--force', action='store_true',
-                      help='Force recreate existing components')
+                      help='Import saved objects even when they are unchanged')
+    parser.add_argument('--import-cache', default=os.environ.get('KIBANA_IMPORT_CACHE', '.kibana_import_cache.json'),
+                      help='File recording the hash of the last imported bundle (empty to disable)')
     return parser.parse_args()
 
-def wait_for_kibana(host, max_retries=12, delay=5):
-    """Wait for Kibana to become available"""
-    logger.info(f"Waiting for Kibana at {host} to be available...")
-    api_url = f"{host}/api/status"
-    
-    for i in range(max_retries):
-        try:
-            response = requests.get(api_url)
-            if response.status_code == 200:
-                status = response.json()
-                if status.get('status', {}).get('overall', {}).get('state') == 'green':
-                    logger.info("Kibana is available!")
-                    return True
-                else:
-                    logger.warning(f"Kibana status is not green, waiting...")
-            else:
-                logger.warning(f"Kibana returned status code: {response.status_code}")
-        except requests.exceptions.RequestException as e:
-            logger.warning(f"Kibana not yet available, retry {i+1}/{max_retries}")
-        
-        time.sleep(delay)
-    
-    logger.error("Timed out waiting for Kibana")
-    return False
+class ImportCache:
+    """JSON file holding the hash of the last bundle imported into each Kibana"""
 
-def create_index_pattern(kibana_host, pattern_title, time_field="@timestamp"):
-    """Create an index pattern in Kibana"""
-    api_url = f"{kibana_host}/api/saved_objects/index-pattern"
-    
-    # Check if pattern already exists
-    search_url = f"{api_url}/_find?type=index-pattern&search_fields=title&search={pattern_title}"
-    try:
-        response = requests.get(search_url)
-        if response.status_code == 200:
-            data = response.json()
-            if data.get('total', 0) > 0:
-                logger.info(f"Index pattern '{pattern_title}' already exists")
-                return True
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Error checking for existing index pattern: {str(e)}")
-        return False
-    
-    # Create the index pattern
-    headers = {'Content-Type': 'application/json', 'kbn-xsrf': 'true'}
-    payload = {
+    def __init__(self, path):
+        self.path = path
+        self.hashes = {}
+        if path and os.path.exists(path):
+            try:
+                with open(path, 'r') as f:
+                    self.hashes = json.load(f)
+            except ValueError:
+                logger.warning(f"Ignoring unreadable import cache {path}")
+
+    def get(self, kibana_host):
+        return self.hashes.get(kibana_host.rstrip('/'))
+
+    def record(self, kibana_host, digest):
+        """Record an imported bundle and write the cache atomically"""
+        self.hashes[kibana_host.rstrip('/')] = digest
+        if not self.path:
+            return
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.hashes, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+def index_pattern_object(sensor, time_field="@timestamp"):
+    """Index pattern saved object for a sensor type"""
+    return {
+        "type": "index-pattern",
+        "id": sensor.index_pattern_id,
         "attributes": {
-            "title": pattern_title,
+            # The alias, not the <sensor>-* pattern, so the copy and the
+            # source of a data stream migration are not counted twice
+            "title": sensor.alias,
             "timeFieldName": time_field
-        }
+        },
+        "references": []
     }
-    
+
+def dashboard_file_objects(dashboard_file):
+    """Saved objects in a dashboard file.
+
+    Accepts an export ({"objects": [...]}) or a single saved object; objects
+    without a type are dashboards and objects without an id are named after
+    the file.
+    """
+    with open(dashboard_file, 'r') as f:
+        content = json.load(f)
+    objects = content.get('objects', [content])
+    default_id = os.path.splitext(os.path.basename(dashboard_file))[0].replace('_', '-')
+    return [
+        {
+            "type": obj.get('type', 'dashboard'),
+            "id": obj.get('id') or (default_id if len(objects) == 1 else f"{default_id}-{position}"),
+            "attributes": obj.get('attributes', {}),
+            "references": obj.get('references', [])
+        }
+        for position, obj in enumerate(objects, 1)
+    ]
+
+def bundle_ndjson(objects):
+    """Serialize saved objects as an _import bundle (deterministic, for hashing)"""
+    return ''.join(json.dumps(obj, sort_keys=True) + '\n' for obj in objects).encode('utf-8')
+
+def import_saved_objects(kibana_host, bundle):
+    """Push an NDJSON bundle through the saved objects _import API, overwriting existing objects"""
+    api_url = f"{kibana_host}/api/saved_objects/_import"
     try:
-        response = requests.post(api_url, headers=headers, json=payload)
-        if response.status_code in [200, 201]:
-            logger.info(f"Successfully created index pattern: {pattern_title}")
-            return True
-        else:
-            logger.error(f"Failed to create index pattern: {response.status_code} - {response.text}")
-            return False
+        response = http_session().post(
+            api_url,
+            params={'overwrite': 'true'},
+            headers={'kbn-xsrf': 'true'},
+            files={'file': ('sensor-telemetry.ndjson', bundle, 'application/ndjson')},
+            timeout=KIBANA_REQUEST_TIMEOUT
+        )
     except requests.exceptions.RequestException as e:
-        logger.error(f"Error creating index pattern: {str(e)}")
+        logger.error(f"Error importing saved objects: {str(e)}")
         return False
 
-def import_kibana_dashboard(kibana_host, dashboard_file):
-    """Import Kibana dashboard from JSON file"""
-    api_url = f"{kibana_host}/api/kibana/dashboards/import"
-    headers = {'Content-Type': 'application/json', 'kbn-xsrf': 'true'}
-    
-    try:
-        with open(dashboard_file, 'r') as f:
-            dashboard_json = json.load(f)
-        
-        # Make POST request to import dashboard
-        response = requests.post(api_url, headers=headers, json=dashboard_json)
-        
-        if response.status_code in [200, 201]:
-            logger.info(f"Successfully imported dashboard from {dashboard_file}")
-            return True
-        else:
-            logger.error(f"Failed to import dashboard: {response.status_code} - {response.text}")
-            return False
-    except FileNotFoundError:
-        logger.error(f"Dashboard file not found: {dashboard_file}")
-        return False
-    except json.JSONDecodeError:
-        logger.error(f"Invalid JSON in dashboard file: {dashboard_file}")
-        return False
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Error importing dashboard: {str(e)}")
+    if response.status_code != 200:
+        logger.error(f"Failed to import saved objects: {response.status_code} - {response.text}")
         return False
+    result = response.json()
+    for error in result.get('errors', []):
+        logger.error(f"Failed to import {error.get('type')}/{error.get('id')}: {error.get('error')}")
+    logger.info(f"Imported {result.get('successCount', 0)} saved objects")
+    return result.get('success', False)
 
-def create_sample_dashboard(kibana_host):
-    """Create a sample telemetry dashboard if no dashboard file is available"""
-    # First, check if data exists in Elasticsearch
-    # Connect to Elasticsearch with 8.x compatibility
-    host = os.environ.get('ES_HOST', 'http://localhost:9200')
-    username = os.environ.get('ES_USERNAME', 'elastic')
-    password = os.environ.get('ES_PASSWORD', 'changeme')
-    api_key = os.environ.get('ES_API_KEY', '')
-    
-    # Parse URL to determine if SSL is needed
-    parsed_url = urlparse(host)
-    use_ssl = parsed_url.scheme == 'https'
-    
-    # Configure connection options for Elasticsearch 8.x
-    conn_params = {
-        'hosts': [host],
-        'request_timeout': 30,
-        'retry_on_timeout': True
-    }
-    
-    # Add authentication
-    if api_key:
-        conn_params['api_key'] = api_key
-    elif password:
-        conn_params['basic_auth'] = (username, password)
-    
-    # Add SSL if needed
-    if use_ssl:
-        ssl_context = ssl.create_default_context()
-        # If using self-signed certs, you can disable verification
-        if os.environ.get('ES_VERIFY_CERTS', 'true').lower() == 'false':
-            ssl_context.check_hostname = False
-            ssl_context.verify_mode = ssl.CERT_NONE
-        conn_params['ssl_context'] = ssl_context
-        
-    es = Elasticsearch(**conn_params)
-    
-    temperature_exists = False
-    airquality_exists = False
-    
+def saved_object_exists(kibana_host, object_type, object_id):
     try:
-        temp_resp = es.count(index="temperaturesensor-ds")
-        temp_count = temp_resp.get('count', 0)
-        temperature_exists = temp_count > 0
-        
-        air_resp = es.count(index="airqualitysensor-ds")
-        air_count = air_resp.get('count', 0)
-        airquality_exists = air_count > 0
-    except Exception as e:
-        logger.warning(f"Error checking for existing data: {str(e)}")
-    
-    # If neither data stream has data, we can't create visualizations
-    if not temperature_exists and not airquality_exists:
-        logger.warning("No data found in data streams. Please ingest data before creating visualizations.")
+        response = http_session().get(f"{kibana_host}/api/saved_objects/{object_type}/{object_id}",
+                                      headers={'kbn-xsrf': 'true'}, timeout=KIBANA_REQUEST_TIMEOUT)
+        return response.status_code == 200
+    except requests.exceptions.RequestException:
         return False
-    
-    # Create visualizations
-    visualizations = []
-    dashboard_panels = []
-    panel_index = 0
-    
-    # Headers for kbn requests
-    headers = {
-        'Content-Type': 'application/json',
-        'kbn-xsrf': 'true'
-    }
-    
-    # Create temperature visualization if data exists
-    if temperature_exists:
-        try:
-            temp_vis = {
-                "attributes": {
-                    "title": "Temperature Over Time",
-                    "visState": json.dumps({
-                        "title": "Temperature Over Time",
-                        "type": "line",
-                        "params": {
+
+def sensor_visualization(sensor):
+    """Line chart of the sensor type's charted metrics averaged over time"""
+    series = sensor.chart_series()
+    return {
+        "type": "visualization",
+        "id": sensor.visualization_id,
+        "attributes": {
+            "title": sensor.chart_title,
+            "visState": json.dumps({
+                "title": sensor.chart_title,
+                "type": "line",
+                "params": {
+                    "type": "line",
+                    "grid": {"categoryLines": False},
+                    "categoryAxes": [{
+                        "id": "CategoryAxis-1",
+                        "type": "category",
+                        "position": "bottom",
+                        "show": True,
+                        "scale": {"type": "linear"},
+                        "labels": {"show": True, "truncate": 100},
+                        "title": {}
+                    }],
+                    "valueAxes": [{
+                        "id": "ValueAxis-1",
+                        "name": "LeftAxis-1",
+                        "type": "value",
+                        "position": "left",
+                        "show": True,
+                        "scale": {"type": "linear", "mode": "normal"},
+                        "labels": {"show": True, "rotate": 0, "filter": False, "truncate": 100},
+                        "title": {"text": sensor.axis_title}
+                    }],
+                    "seriesParams": [
+                        {
+                            "show": "true",
                             "type": "line",
-                            "grid": {"categoryLines": False},
-                            "categoryAxes": [{
-                                "id": "CategoryAxis-1",
-                                "type": "category",
-                                "position": "bottom",
-                                "show": True,
-                                "scale": {"type": "linear"},
-                                "labels": {"show": True, "truncate": 100},
-                                "title": {}
-                            }],
-                            "valueAxes": [{
-                                "id": "ValueAxis-1",
-                                "name": "LeftAxis-1",
-                                "type": "value",
-                                "position": "left",
-                                "show": True,
-                                "scale": {"type": "linear", "mode": "normal"},
-                                "labels": {"show": True, "rotate": 0, "filter": False, "truncate": 100},
-                                "title": {"text": "Temperature (°C)"}
-                            }],
-                            "seriesParams": [{
-                                "show": "true",
-                                "type": "line",
-                                "mode": "normal",
-                                "data": {"label": "Average Temperature", "id": "1"},
-                                "valueAxis": "ValueAxis-1",
-                                "drawLinesBetweenPoints": True,
-                                "showCircles": True
-                            }],
-                            "addTooltip": True,
-                            "addLegend": True,
-                            "legendPosition": "right",
-                            "times": [],
-                            "addTimeMarker": False
-                        },
-                        "aggs": [
-                            {
-                                "id": "1",
-                                "enabled": True,
-                                "type": "avg",
-                                "schema": "metric",
-                                "params": {"field": "temperature_value"}
-                            },
-                            {
-                                "id": "2",
-                                "enabled": True,
-                                "type": "date_histogram",
-                                "schema": "segment",
-                                "params": {
-                                    "field": "@timestamp",
-                                    "timeRange": {"from": "now-7d", "to": "now"},
-                                    "useNormalizedEsInterval": True,
-                                    "interval": "auto",
-                                    "drop_partials": False,
-                                    "min_doc_count": 1,
-                                    "extended_bounds": {}
-                                }
-                            }
-                        ]
-                    }),
-                    "uiStateJSON": "{}",
-                    "description": "",
-                    "version": 1,
-                    "kibanaSavedObjectMeta": {
-                        "searchSourceJSON": json.dumps({
-                            "index": "temperaturesensor-*",
-                            "filter": [],
-                            "query": {"query": "", "language": "kuery"}
-                        })
+                            "mode": "normal",
+                            "data": {"label": label, "id": str(position)},
+                            "valueAxis": "ValueAxis-1",
+                            "drawLinesBetweenPoints": True,
+                            "showCircles": True
+                        }
+                        for position, (field, label) in enumerate(series, 1)
+                    ],
+                    "addTooltip": True,
+                    "addLegend": True,
+                    "legendPosition": "right",
+                    "times": [],
+                    "addTimeMarker": False
+                },
+                "aggs": [
+                    {
+                        "id": str(position),
+                        "enabled": True,
+                        "type": "avg",
+                        "schema": "metric",
+                        "params": {"field": field}
                     }
-                }
-            }
-            
-            temp_vis_url = f"{kibana_host}/api/saved_objects/visualization/temperature-over-time"
-            temp_vis_response = requests.post(temp_vis_url, headers=headers, json=temp_vis)
-            
-            if temp_vis_response.status_code in [200, 201]:
-                logger.info("Created temperature visualization")
-                dashboard_panels.append({
-                    "panelIndex": panel_index,
-                    "gridData": {
-                        "x": 0,
-                        "y": 0,
-                        "w": 24,
-                        "h": 15,
-                        "i": str(panel_index)
-                    },
-                    "embeddableConfig": {},
-                    "type": "visualization",
-                    "id": "temperature-over-time"
-                })
-                panel_index += 1
-            else:
-                logger.error(f"Failed to create temperature visualization: {temp_vis_response.status_code} - {temp_vis_response.text}")
-        
-        except Exception as e:
-            logger.error(f"Error creating temperature visualization: {str(e)}")
-    
-    # Create air quality visualization if data exists
-    if airquality_exists:
-        try:
-            air_vis = {
-                "attributes": {
-                    "title": "Air Quality Metrics",
-                    "visState": json.dumps({
-                        "title": "Air Quality Metrics",
-                        "type": "line",
+                    for position, (field, label) in enumerate(series, 1)
+                ] + [
+                    {
+                        "id": str(len(series) + 1),
+                        "enabled": True,
+                        "type": "date_histogram",
+                        "schema": "segment",
                         "params": {
-                            "type": "line",
-                            "grid": {"categoryLines": False},
-                            "categoryAxes": [{
-                                "id": "CategoryAxis-1",
-                                "type": "category",
-                                "position": "bottom",
-                                "show": True,
-                                "scale": {"type": "linear"},
-                                "labels": {"show": True, "truncate": 100},
-                                "title": {}
-                            }],
-                            "valueAxes": [{
-                                "id": "ValueAxis-1",
-                                "name": "LeftAxis-1",
-                                "type": "value",
-                                "position": "left",
-                                "show": True,
-                                "scale": {"type": "linear", "mode": "normal"},
-                                "labels": {"show": True, "rotate": 0, "filter": False, "truncate": 100},
-                                "title": {"text": "Concentration"}
-                            }],
-                            "seriesParams": [
-                                {
-                                    "show": "true",
-                                    "type": "line",
-                                    "mode": "normal",
-                                    "data": {"label": "Average PM2.5", "id": "1"},
-                                    "valueAxis": "ValueAxis-1",
-                                    "drawLinesBetweenPoints": True,
-                                    "showCircles": True
-                                },
-                                {
-                                    "show": "true",
-                                    "type": "line",
-                                    "mode": "normal",
-                                    "data": {"label": "Average CO", "id": "2"},
-                                    "valueAxis": "ValueAxis-1",
-                                    "drawLinesBetweenPoints": True,
-                                    "showCircles": True
-                                },
-                                {
-                                    "show": "true",
-                                    "type": "line",
-                                    "mode": "normal",
-                                    "data": {"label": "Average NO2", "id": "3"},
-                                    "valueAxis": "ValueAxis-1",
-                                    "drawLinesBetweenPoints": True,
-                                    "showCircles": True
-                                }
-                            ],
-                            "addTooltip": True,
-                            "addLegend": True,
-                            "legendPosition": "right",
-                            "times": [],
-                            "addTimeMarker": False
-                        },
-                        "aggs": [
-                            {
-                                "id": "1",
-                                "enabled": True,
-                                "type": "avg",
-                                "schema": "metric",
-                                "params": {"field": "pm25"}
-                            },
-                            {
-                                "id": "2",
-                                "enabled": True,
-                                "type": "avg",
-                                "schema": "metric",
-                                "params": {"field": "co"}
-                            },
-                            {
-                                "id": "3",
-                                "enabled": True,
-                                "type": "avg",
-                                "schema": "metric",
-                                "params": {"field": "no2"}
-                            },
-                            {
-                                "id": "4",
-                                "enabled": True,
-                                "type": "date_histogram",
-                                "schema": "segment",
-                                "params": {
-                                    "field": "@timestamp",
-                                    "timeRange": {"from": "now-7d", "to": "now"},
-                                    "useNormalizedEsInterval": True,
-                                    "interval": "auto",
-                                    "drop_partials": False,
-                                    "min_doc_count": 1,
-                                    "extended_bounds": {}
-                                }
-                            }
-                        ]
-                    }),
-                    "uiStateJSON": "{}",
-                    "description": "",
-                    "version": 1,
-                    "kibanaSavedObjectMeta": {
-                        "searchSourceJSON": json.dumps({
-                            "index": "airqualitysensor-*",
-                            "filter": [],
-                            "query": {"query": "", "language": "kuery"}
-                        })
+                            "field": "@timestamp",
+                            "timeRange": {"from": "now-7d", "to": "now"},
+                            "useNormalizedEsInterval": True,
+                            "interval": "auto",
+                            "drop_partials": False,
+                            "min_doc_count": 1,
+                            "extended_bounds": {}
+                        }
                     }
-                }
+                ]
+            }),
+            "uiStateJSON": "{}",
+            "description": "",
+            "version": 1,
+            "kibanaSavedObjectMeta": {
+                "searchSourceJSON": json.dumps({
+                    "indexRefName": "kibanaSavedObjectMeta.searchSourceJSON.index",
+                    "filter": [],
+                    "query": {"query": "", "language": "kuery"}
+                })
             }
-            
-            air_vis_url = f"{kibana_host}/api/saved_objects/visualization/air-quality-metrics"
-            air_vis_response = requests.post(air_vis_url, headers=headers, json=air_vis)
-            
-            if air_vis_response.status_code in [200, 201]:
-                logger.info("Created air quality visualization")
-                dashboard_panels.append({
-                    "panelIndex": panel_index,
-                    "gridData": {
-                        "x": 0,
-                        "y": 15,
-                        "w": 24,
-                        "h": 15,
-                        "i": str(panel_index)
-                    },
-                    "embeddableConfig": {},
-                    "type": "visualization",
-                    "id": "air-quality-metrics"
+        },
+        "references": [{
+            "name": "kibanaSavedObjectMeta.searchSourceJSON.index",
+            "type": "index-pattern",
+            "id": sensor.index_pattern_id
+        }]
+    }
+
+def sensors_with_data(es):
+    """Sensor types whose data stream holds documents, counted with one msearch"""
+    sensors = sensor_types()
+    response = es.msearch(searches=count_searches([sensor.alias for sensor in sensors]))
+    with_data = []
+    for sensor, result in zip(sensors, response.get('responses', [])):
+        if 'error' in result:
+            logger.warning(f"Error checking for existing {sensor.title.lower()} data: {result['error']}")
+        elif result['hits']['total']['value'] > 0:
+            with_data.append(sensor)
+    return with_data
+
+def sample_dashboard_objects(sensors):
+    """A visualization per sensor type, stacked vertically on one dashboard"""
+    dashboard_panels = [
+        {
+            "panelIndex": str(panel_index),
+            "gridData": {
+                "x": 0,
+                "y": 15 * panel_index,
+                "w": 24,
+                "h": 15,
+                "i": str(panel_index)
+            },
+            "embeddableConfig": {},
+            "panelRefName": f"panel_{panel_index}"
+        }
+        for panel_index, sensor in enumerate(sensors)
+    ]
+    dashboard = {
+        "type": "dashboard",
+        "id": "sensor-telemetry-dashboard",
+        "attributes": {
+            "title": "Sensor Telemetry Dashboard",
+            "hits": 0,
+            "description": "Dashboard for sensor telemetry data",
+            "panelsJSON": json.dumps(dashboard_panels),
+            "optionsJSON": json.dumps({
+                "useMargins": True,
+                "hidePanelTitles": False
+            }),
+            "version": 1,
+            "timeRestore": True,
+            "timeTo": "now",
+            "timeFrom": "now-7d",
+            "refreshInterval": {
+                "pause": True,
+                "value": 0
+            },
+            "kibanaSavedObjectMeta": {
+                "searchSourceJSON": json.dumps({
+                    "query": {"query": "", "language": "kuery"},
+                    "filter": []
                 })
-                panel_index += 1
-            else:
-                logger.error(f"Failed to create air quality visualization: {air_vis_response.status_code} - {air_vis_response.text}")
-        
-        except Exception as e:
-            logger.error(f"Error creating air quality visualization: {str(e)}")
-    
-    # Create dashboard to hold visualizations
-    if dashboard_panels:
-        try:
-            dashboard = {
-                "attributes": {
-                    "title": "Sensor Telemetry Dashboard",
-                    "hits": 0,
-                    "description": "Dashboard for sensor telemetry data",
-                    "panelsJSON": json.dumps(dashboard_panels),
-                    "optionsJSON": json.dumps({
-                        "useMargins": True,
-                        "hidePanelTitles": False
-                    }),
-                    "version": 1,
-                    "timeRestore": True,
-                    "timeTo": "now",
-                    "timeFrom": "now-7d",
-                    "refreshInterval": {
-                        "pause": True,
-                        "value": 0
-                    },
-                    "kibanaSavedObjectMeta": {
-                        "searchSourceJSON": json.dumps({
-                            "query": {"query": "", "language": "kuery"},
-                            "filter": []
-                        })
-                    }
-                }
             }
-            
-            dashboard_url = f"{kibana_host}/api/saved_objects/dashboard/sensor-telemetry-dashboard"
-            dashboard_response = requests.post(dashboard_url, headers=headers, json=dashboard)
-            
-            if dashboard_response.status_code in [200, 201]:
-                logger.info("Created sensor telemetry dashboard")
-                return True
-            else:
-                logger.error(f"Failed to create dashboard: {dashboard_response.status_code} - {dashboard_response.text}")
-                return False
-        
-        except Exception as e:
-            logger.error(f"Error creating dashboard: {str(e)}")
-            return False
-    
-    return False
+        },
+        "references": [
+            {"name": f"panel_{panel_index}", "type": "visualization", "id": sensor.visualization_id}
+            for panel_index, sensor in enumerate(sensors)
+        ]
+    }
+    return [sensor_visualization(sensor) for sensor in sensors] + [dashboard]
+
+def build_bundle(dashboard_file=None):
+    """Index patterns for every sensor type plus the dashboard file's objects,
+    or a sample dashboard for the sensor types that have data.
+
+    The index patterns come from the sensor registry only; dashboard files
+    reference them by sensor.index_pattern_id instead of shipping their own.
+    """
+    objects = [index_pattern_object(sensor) for sensor in sensor_types()]
+
+    if dashboard_file and os.path.exists(dashboard_file):
+        try:
+            return objects + dashboard_file_objects(dashboard_file)
+        except ValueError:
+            logger.error(f"Invalid JSON in dashboard file: {dashboard_file}")
+            return objects
+
+    if dashboard_file:
+        logger.warning(f"Dashboard file not found: {dashboard_file}")
+    logger.info("Creating sample dashboard...")
+    # Connect to Elasticsearch with 8.x compatibility
+    es = create_client(request_timeout=30, default_password='changeme')
+    try:
+        sensors = sensors_with_data(es)
+    except Exception as e:
+        logger.error(f"Error checking for existing data: {str(e)}")
+        return objects
+
+    # If no data stream has data, we can't create visualizations
+    if not sensors:
+        logger.warning("No data found in data streams. Please ingest data before creating visualizations.")
+        return objects
+    return objects + sample_dashboard_objects(sensors)
+
+def setup_saved_objects(kibana_host, objects, cache, force=False):
+    """Import the bundle unless this Kibana already has exactly this bundle"""
+    bundle = bundle_ndjson(objects)
+    digest = hashlib.sha256(bundle).hexdigest()
+    # The last object is the dashboard (or an index pattern); if it is gone,
+    # Kibana was reset since the cached import
+    last = objects[-1]
+    if (not force and cache.get(kibana_host) == digest
+            and saved_object_exists(kibana_host, last['type'], last['id'])):
+        logger.info(f"Saved objects unchanged since the last import ({digest[:12]}), skipping")
+        return True
+
+    logger.info(f"Importing {len(objects)} saved objects ({len(bundle)} bytes)...")
+    if not import_saved_objects(kibana_host, bundle):
+        return False
+    cache.record(kibana_host, digest)
+    return True
 
 def main():
     """Main function to run the Kibana setup process"""
     args = parse_arguments()
     
-    # Wait for Kibana if requested
-    if args.wait and not wait_for_kibana(args.kibana_host):
+    # Wait for Kibana (and Elasticsearch, checked in parallel) if requested
+    if (args.wait or args.retry) and not wait_for_services(args.es_host, args.kibana_host,
+                                                            args.wait_timeout, args.retry):
         sys.exit(1)
     
-    # Create index patterns
-    logger.info("Creating index patterns...")
-    temp_pattern_created = create_index_pattern(args.kibana_host, "temperaturesensor-*")
-    air_pattern_created = create_index_pattern(args.kibana_host, "airqualitysensor-*")
-    
-    if not temp_pattern_created or not air_pattern_created:
-        logger.warning("Some index patterns could not be created")
-    
-    # Import dashboard or create sample dashboard
-    logger.info("Setting up dashboards...")
-    dashboard_imported = False
-    
-    if os.path.exists(args.dashboard_file):
-        dashboard_imported = import_kibana_dashboard(args.kibana_host, args.dashboard_file)
-    else:
-        logger.warning(f"Dashboard file not found: {args.dashboard_file}")
-        logger.info("Creating sample dashboard...")
-        dashboard_imported = create_sample_dashboard(args.kibana_host)
+    # Index patterns and dashboard go to Kibana as one bundle
+    logger.info("Setting up index patterns and dashboards...")
+    objects = build_bundle(args.dashboard_file)
+    cache = ImportCache(args.import_cache)
     
-    if not dashboard_imported:
-        logger.warning("Dashboard could not be imported/created")
+    if not setup_saved_objects(args.kibana_host, objects, cache, args.force):
+        logger.warning("Saved objects could not be imported")
     
     logger.info("Kibana setup completed")
 
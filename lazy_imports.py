@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+Lazy Imports
+
+pandas, numpy, requests and the Elasticsearch client take most of a
+script's start-up time, more than a second on a cold container. Modules that
+use them import them through lazy_import(), so the import only happens
+when an attribute is first used:
+
+    pd = lazy_import('pandas')
+    helpers = lazy_import('elasticsearch.helpers')
+
+`--help`, argument errors and commands that never touch the dependency
+(sensorctl.py check, for instance) therefore start in a fraction of the
+time.
+"""
+
+import importlib
+import sys
+import threading
+
+
+class LazyModule:
+    """Stand-in for a module that is imported on first attribute access"""
+
+    def __init__(self, name):
+        self.__dict__['_lazy_name'] = name
+        self.__dict__['_lazy_lock'] = threading.Lock()
+
+    def __getattr__(self, attr):
+        # Only called for attributes missing from __dict__, i.e. until the
+        # module is loaded; afterwards its attributes are plain lookups
+        with self._lazy_lock:
+            if '__name__' not in self.__dict__:
+                self.__dict__.update(vars(importlib.import_module(self._lazy_name)))
+        return getattr(importlib.import_module(self._lazy_name), attr)
+
+    def __repr__(self):
+        return f"<lazy module {self._lazy_name!r}>"
+
+
+def lazy_import(name):
+    """Return the module if it is already imported, else a LazyModule"""
+    module = sys.modules.get(name)
+    return module if module is not None else LazyModule(name)
+
+
+def preload(*names):
+    """Import modules now, e.g. so the import is not charged to whatever
+    phase of a profiled run happens to touch them first"""
+    for name in names:
+        importlib.import_module(name)
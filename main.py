@@ -1,14 +1,21 @@
-from flask import Flask, render_template, redirect, url_for, flash, request
+from flask import Flask, Response, render_template, redirect, url_for, flash, request, g
+import atexit
+import json
 import os
 import logging
 import threading
 import time
-import ssl
-from urllib.parse import urlparse
-from elasticsearch import Elasticsearch
 from datetime import datetime
 from dotenv import load_dotenv
 
+from ingest_buffer import BufferFull, BulkFlusher, RingBuffer
+from metrics import CONTENT_TYPE, REGISTRY, Counter, Gauge, Histogram
+from client_factory import create_client
+from sensor_registry import sensor_types
+from status_collector import collect_status, configured_streams
+from schema_mapping import SchemaMappingError, cached_plan, records_to_frame
+from timestamp_conversion import TimestampConverter, add_timestamp_column
+
 # Load environment variables
 load_dotenv()
 
@@ -21,92 +28,158 @@ app = Flask(__name__)
 app.secret_key = os.environ.get("SESSION_SECRET", "default-secret-key")
 
 # Elasticsearch configuration
-ES_HOST = os.environ.get("ES_HOST", "http://localhost:9200")
+ES_HOST = os.environ.get("ES_HOST", "http://localhost:9200")  # comma-separated for several nodes
+ES_REQUEST_TIMEOUT = float(os.environ.get("ES_REQUEST_TIMEOUT", "10"))
+ES_HEALTH_CHECK_INTERVAL = float(os.environ.get("ES_HEALTH_CHECK_INTERVAL", "15"))
 es_client = None
+es_client_lock = threading.Lock()
+
+# Connection state maintained by the background checker and served by /readyz
+es_reachable = False  # result of the last connection check
+es_checked_at = None  # time.monotonic() of the last connection check
+es_checker = None
+es_checker_lock = threading.Lock()
+
+# Push ingestion: sensor type name or data stream -> the sensor type's alias,
+# which keeps pointing at the live data stream across a migration
+INGEST_STREAMS = {name: sensor.alias for sensor in sensor_types() for name in (sensor.name, sensor.stream)}
+# Data streams reported by /status; STATUS_STREAMS overrides the list
+STATUS_STREAMS = configured_streams()
+INGEST_BUFFER_SIZE = int(os.environ.get("INGEST_BUFFER_SIZE", "100000"))
+INGEST_FLUSH_SIZE = int(os.environ.get("INGEST_FLUSH_SIZE", "1000"))
+INGEST_FLUSH_INTERVAL = float(os.environ.get("INGEST_FLUSH_INTERVAL", "1.0"))
+
+ingest_buffer = RingBuffer(INGEST_BUFFER_SIZE)
+ingest_flusher = None
+ingest_flusher_lock = threading.Lock()
+
+# Application metrics, exposed on /metrics
+HTTP_REQUEST_SECONDS = Histogram(
+    'http_request_duration_seconds', 'Latency of HTTP requests', ['endpoint', 'method', 'status']
+)
+ES_CONNECTION_FAILURES = Counter(
+    'es_connection_check_failures', 'Periodic Elasticsearch connection checks that failed'
+)
+ES_CONNECTED = Gauge('es_connected', 'Whether the last Elasticsearch connection check succeeded')
+INGEST_QUEUE_DEPTH = Gauge('ingest_buffer_documents', 'Documents waiting in the push ingestion buffer')
+INGEST_QUEUE_DEPTH.set_function(lambda: len(ingest_buffer))
+INGEST_FLUSHER_DOCUMENTS = Gauge(
+    'ingest_flusher_documents', 'Buffered documents handled by the bulk flusher', ['result']
+)
+for _result in ('flushed', 'failed', 'dropped'):
+    INGEST_FLUSHER_DOCUMENTS.labels(_result).set_function(
+        lambda result=_result: ingest_flusher.stats[result] if ingest_flusher else 0
+    )
+SCHEMA_PLAN_CACHE = Gauge('schema_plan_cache', 'Compiled schema plan cache lookups', ['result'])
+SCHEMA_PLAN_CACHE.labels('hit').set_function(lambda: cached_plan.cache_info().hits)
+SCHEMA_PLAN_CACHE.labels('miss').set_function(lambda: cached_plan.cache_info().misses)
 
 def create_elasticsearch_client():
     """Create Elasticsearch client with 8.x compatibility settings"""
-    # Get credentials from environment variables
-    username = os.environ.get('ES_USERNAME', 'elastic')
-    password = os.environ.get('ES_PASSWORD', '')
-    api_key = os.environ.get('ES_API_KEY', '')
-    
-    # Parse URL to determine if SSL is needed
-    parsed_url = urlparse(ES_HOST)
-    use_ssl = parsed_url.scheme == 'https'
-    
-    # Setup connection params
-    conn_params = {
-        'hosts': [ES_HOST],
-        'request_timeout': 10,  # Reduce timeout to avoid long waits
-        'retry_on_timeout': True,
-        'max_retries': 2  # Limit retries to avoid excessive delays
-    }
-    
-    # Add authentication
-    if api_key:
-        conn_params['api_key'] = api_key
-    elif password:
-        conn_params['basic_auth'] = (username, password)
-    
-    # Setup SSL if needed
-    if use_ssl:
-        ssl_context = ssl.create_default_context()
-        # If using self-signed certs, you can disable verification
-        if os.environ.get('ES_VERIFY_CERTS', 'true').lower() == 'false':
-            ssl_context.check_hostname = False
-            ssl_context.verify_mode = ssl.CERT_NONE
-        conn_params['ssl_context'] = ssl_context
+    # Short timeouts and few retries keep dashboard requests from hanging;
+    # with several nodes a failed request moves on to the next live node
+    return create_client(ES_HOST, request_timeout=ES_REQUEST_TIMEOUT, max_retries=2)
+
+def get_es_client():
+    """Return the shared client, creating it on first use.
     
-    return Elasticsearch(**conn_params)
+    Creating the client does no network I/O. It is kept when the cluster is
+    unreachable: it fails over between the configured nodes and retries dead
+    nodes after a backoff on its own, so replacing or blanking it would only
+    throw that state away.
+    """
+    global es_client
+    if es_client is None:
+        with es_client_lock:
+            if es_client is None:
+                es_client = create_elasticsearch_client()
+    return es_client
 
 def connect_elasticsearch():
-    """Connect to Elasticsearch with retry logic and 8.x compatibility"""
-    global es_client
-    max_retries = 2  # Reduce retries to avoid excessive delays
-    retry_count = 0
-    
-    while retry_count < max_retries:
-        try:
-            # Create new client
-            es_client = create_elasticsearch_client()
-            if es_client.ping():
+    """Check that the cluster answers and record the result"""
+    global es_reachable, es_checked_at
+    es = get_es_client()
+    reachable = False
+    try:
+        if es.ping():
+            if not es_reachable:
                 logger.info("Connected to Elasticsearch")
-                info = es_client.info()
+                info = es.info()
                 logger.info(f"Elasticsearch version: {info.get('version', {}).get('number', 'unknown')}")
-                return es_client
-            else:
-                raise Exception("Elasticsearch ping failed")
-        except Exception as e:
-            retry_count += 1
-            wait_time = retry_count * 5
-            logger.warning(f"Connection to Elasticsearch failed, retrying in {wait_time} seconds... ({retry_count}/{max_retries})")
-            logger.warning(f"Error: {str(e)}")
-            time.sleep(wait_time)
+            reachable = True
+        else:
+            logger.warning("Elasticsearch ping failed on all configured nodes")
+    except Exception as e:
+        logger.warning(f"Error checking Elasticsearch connection: {str(e)}")
     
-    logger.error("Failed to connect to Elasticsearch after multiple attempts")
-    return None
+    if not reachable:
+        ES_CONNECTION_FAILURES.inc()
+    es_reachable = reachable
+    es_checked_at = time.monotonic()
+    ES_CONNECTED.set(1 if reachable else 0)
+    return es
 
 def check_es_connection_async():
     """Check Elasticsearch connection in a separate thread"""
-    global es_client
-    
     # Initial connection attempt
-    es_client = connect_elasticsearch()
+    connect_elasticsearch()
     
-    # Setup periodic connection check (every 60 seconds)
+    # Periodic check; only updates the connection state, requests keep
+    # using the client (and its node failover) in the meantime
     while True:
-        time.sleep(60)
-        try:
-            if not es_client or not es_client.ping():
-                logger.info("Elasticsearch connection lost or not established, attempting to reconnect...")
-                es_client = connect_elasticsearch()
-        except Exception as e:
-            logger.warning(f"Error checking Elasticsearch connection: {str(e)}")
-            es_client = None
-
-# Start ES connection in background thread
-threading.Thread(target=check_es_connection_async, daemon=True).start()
+        time.sleep(ES_HEALTH_CHECK_INTERVAL)
+        connect_elasticsearch()
+
+def start_connection_checker():
+    """Start the background connection check once per process.
+    
+    Started on the first request rather than at import time, so importing
+    the app never waits on the cluster and every gunicorn worker (forked
+    after import) runs its own checker.
+    """
+    global es_checker
+    if es_checker is None:
+        with es_checker_lock:
+            if es_checker is None:
+                es_checker = threading.Thread(target=check_es_connection_async,
+                                              name='es-connection-check', daemon=True)
+                es_checker.start()
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    start_connection_checker()
+
+@app.after_request
+def record_request_metrics(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        # Label by route rule, not raw path, to keep label cardinality bounded
+        endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+        HTTP_REQUEST_SECONDS.labels(endpoint, request.method, response.status_code).observe(
+            time.perf_counter() - started
+        )
+    return response
+
+@app.route('/healthz')
+def healthz():
+    """Liveness probe: the process is serving requests (no I/O)"""
+    return {"status": "ok"}
+
+@app.route('/readyz')
+def readyz():
+    """Readiness probe: cached result of the background connection check"""
+    if es_checked_at is None:
+        return {"status": "starting"}, 503
+    age = round(time.monotonic() - es_checked_at, 1)
+    if es_reachable:
+        return {"status": "ready", "elasticsearch": "reachable", "checked_seconds_ago": age}
+    return {"status": "not ready", "elasticsearch": "unreachable", "checked_seconds_ago": age}, 503
+
+@app.route('/metrics')
+def metrics():
+    """Expose application and Elasticsearch client metrics for Prometheus"""
+    return Response(REGISTRY.render(), mimetype=None, content_type=CONTENT_TYPE)
 
 @app.route('/')
 def index():
@@ -121,67 +194,96 @@ def dashboard():
 
 @app.route('/status')
 def status():
-    """Check the Elasticsearch connection status"""
-    # If Elasticsearch client exists, attempt to get status
-    if es_client:
-        try:
-            # Try to ping Elasticsearch
-            if es_client.ping():
-                try:
-                    # Check if the data streams exist
-                    temp_ds_exists = es_client.indices.exists_data_stream(name="temperaturesensor-ds")
-                    air_ds_exists = es_client.indices.exists_data_stream(name="airqualitysensor-ds")
-                    
-                    # Get basic stats about the data streams
-                    status_data = {
-                        "elasticsearch": "connected",
-                        "temperaturesensor_ds": "available" if temp_ds_exists else "not found",
-                        "airqualitysensor_ds": "available" if air_ds_exists else "not found"
-                    }
-                    
-                    # If data streams exist, get document counts
-                    if temp_ds_exists:
-                        temp_count = es_client.count(index="temperaturesensor-ds")
-                        status_data["temperaturesensor_count"] = temp_count.get("count", 0)
-                        
-                    if air_ds_exists:
-                        air_count = es_client.count(index="airqualitysensor-ds")
-                        status_data["airqualitysensor_count"] = air_count.get("count", 0)
-                        
-                    return status_data
-                except Exception as e:
-                    logger.error(f"Error checking data streams: {str(e)}")
-                    return {
-                        "elasticsearch": "error", 
-                        "error": str(e),
-                        "temperaturesensor_ds": "unknown",
-                        "airqualitysensor_ds": "unknown"
-                    }
-            else:
-                # Ping failed
-                return {
-                    "elasticsearch": "disconnected", 
-                    "message": "Elasticsearch is running but ping failed",
-                    "temperaturesensor_ds": "unknown",
-                    "airqualitysensor_ds": "unknown"
-                }
-        except Exception as e:
-            # Connection error
-            logger.error(f"Error connecting to Elasticsearch: {str(e)}")
-            return {
-                "elasticsearch": "error", 
-                "error": str(e),
-                "temperaturesensor_ds": "unknown",
-                "airqualitysensor_ds": "unknown"
-            }
+    """Check the Elasticsearch connection and the sensor data streams"""
+    return collect_status(get_es_client(), STATUS_STREAMS)
+
+def get_ingest_flusher():
+    """Start the background bulk flusher on first use"""
+    global ingest_flusher
+    with ingest_flusher_lock:
+        if ingest_flusher is None:
+            ingest_flusher = BulkFlusher(
+                ingest_buffer,
+                get_es_client,
+                flush_size=INGEST_FLUSH_SIZE,
+                flush_interval=INGEST_FLUSH_INTERVAL
+            ).start()
+            atexit.register(ingest_flusher.stop)
+    return ingest_flusher
+
+def parse_ingest_payload(body, mimetype):
+    """Parse a JSON object, JSON array or NDJSON request body into records"""
+    if mimetype in ('application/x-ndjson', 'application/ndjson'):
+        records = [json.loads(line) for line in body.splitlines() if line.strip()]
     else:
-        # No client at all
-        return {
-            "elasticsearch": "disconnected",
-            "message": "Elasticsearch client not initialized",
-            "temperaturesensor_ds": "unknown",
-            "airqualitysensor_ds": "unknown"
-        }
+        payload = json.loads(body)
+        records = payload if isinstance(payload, list) else [payload]
+    
+    if not all(isinstance(record, dict) for record in records):
+        raise ValueError("each reading must be a JSON object")
+    return records
+
+def ingest_stream(sensor):
+    """Write alias for a sensor name (or its data stream name), or None"""
+    return INGEST_STREAMS.get(sensor)
+
+class InvalidTimestampError(ValueError):
+    """Readings whose timestamp is missing or cannot be parsed"""
+
+    def __init__(self, rows, values):
+        super().__init__(f"Invalid or missing timestamp in {len(rows)} readings, e.g. {values[0]!r}")
+        self.rows = rows
+
+def build_ingest_documents(records, stream):
+    """Validate records and build bulk documents; only valid readings are kept.
+
+    Timestamps are normalized to ISO 8601 here, so nothing Elasticsearch
+    would reject reaches the buffer; readings with a bad timestamp raise
+    InvalidTimestampError listing their positions.
+    """
+    df = records_to_frame(records)
+    # The conversion may replace the source column; keep the raw values for the error
+    raw = df.copy(deep=False)
+    source = add_timestamp_column(df, TimestampConverter())
+    if source:
+        bad = df['timestamp'].isna().to_numpy().nonzero()[0]
+        if len(bad):
+            raise InvalidTimestampError(bad.tolist(), raw[source].iloc[bad].tolist())
+    return cached_plan(tuple(df.columns), stream).documents(df)
+
+@app.route('/api/ingest/<sensor>', methods=['POST'])
+def ingest(sensor):
+    """Accept sensor readings and queue them for bulk ingestion"""
+    stream = ingest_stream(sensor)
+    if stream is None:
+        return {"error": f"Unknown sensor type: {sensor}"}, 404
+    
+    try:
+        records = parse_ingest_payload(request.get_data(as_text=True), request.mimetype)
+    except ValueError as e:
+        return {"error": f"Invalid payload: {str(e)}"}, 400
+    if not records:
+        return {"error": "No readings in request"}, 400
+    
+    # Validate and build documents up front; only valid documents are queued
+    try:
+        documents = build_ingest_documents(records, stream)
+    except InvalidTimestampError as e:
+        return {"error": str(e), "rows": e.rows}, 400
+    except (SchemaMappingError, ValueError) as e:
+        return {"error": str(e)}, 400
+    
+    rejected = len(records) - len(documents)
+    if not documents:
+        return {"error": "No valid readings in request", "rejected": rejected}, 400
+    
+    get_ingest_flusher()
+    try:
+        depth = ingest_buffer.offer(documents)
+    except BufferFull as e:
+        return {"error": str(e), "queue_depth": len(ingest_buffer)}, 429, {"Retry-After": "1"}
+    
+    return {"accepted": len(documents), "rejected": rejected, "queue_depth": depth}, 202
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=True)
@@ -0,0 +1,367 @@
+#!/usr/bin/env python3
+"""
+Metrics
+
+Minimal, dependency-free counters, gauges and histograms rendered in the
+Prometheus text exposition format, plus a wrapper that times every API call
+made through an Elasticsearch client.
+
+Used by the web application's /metrics endpoint and by the CLI scripts,
+which can write the same metrics to a file or push them to a Pushgateway at
+the end of a run.
+"""
+
+import bisect
+import inspect
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    """Base class handling label children and registration"""
+
+    kind = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._children[()] = self._new_child()
+        (registry if registry is not None else REGISTRY).register(self)
+
+    def labels(self, *values):
+        """Return the child metric for a set of label values"""
+        key = tuple(str(value) for value in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _default(self):
+        return self._children[()]
+
+    def samples(self):
+        """Yield (suffix, label string, value) tuples"""
+        for key, child in list(self._children.items()):
+            for suffix, extra, value in child.samples():
+                yield suffix, _format_labels(self.labelnames, key, extra), value
+
+
+class _CounterChild:
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def samples(self):
+        yield '_total', None, self.value
+
+
+class Counter(_Metric):
+    """Monotonically increasing count"""
+
+    kind = 'counter'
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        self._default().inc(amount)
+
+
+class _GaugeChild:
+    def __init__(self):
+        self.value = 0.0
+        self.function = None
+
+    def set(self, value):
+        self.value = value
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def set_function(self, function):
+        """Compute the value when metrics are rendered"""
+        self.function = function
+
+    def samples(self):
+        yield '', None, self.function() if self.function else self.value
+
+
+class Gauge(_Metric):
+    """Value that can go up and down, or be computed at render time"""
+
+    kind = 'gauge'
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value):
+        self._default().set(value)
+
+    def inc(self, amount=1):
+        self._default().inc(amount)
+
+    def set_function(self, function):
+        self._default().set_function(function)
+
+
+class _HistogramChild:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        position = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[position] += 1
+            self.sum += value
+
+    def time(self):
+        """Context manager observing the duration of its block"""
+        return _Timer(self)
+
+    def samples(self):
+        with self._lock:
+            counts, total = list(self.counts), self.sum
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += count
+            yield '_bucket', ('le', _format_value(bound)), cumulative
+        yield '_sum', None, total
+        yield '_count', None, cumulative
+
+
+class Histogram(_Metric):
+    """Distribution of observed values over fixed buckets"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS, registry=None):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self._default().observe(value)
+
+    def time(self):
+        return self._default().time()
+
+
+class _Timer:
+    def __init__(self, child):
+        self.child = child
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.child.observe(time.perf_counter() - self.started)
+        return False
+
+
+class Registry:
+    """Collection of metrics rendered together"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric already registered: {metric.name}")
+            self._metrics[metric.name] = metric
+
+    def render(self):
+        """Render all metrics in the Prometheus text exposition format"""
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for suffix, labels, value in metric.samples():
+                lines.append(f"{metric.name}{suffix}{labels} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+# Shared Elasticsearch client metrics
+ES_REQUEST_SECONDS = Histogram(
+    'es_request_duration_seconds', 'Latency of Elasticsearch API calls', ['api']
+)
+ES_REQUEST_ERRORS = Counter(
+    'es_request_errors', 'Elasticsearch API calls that raised an error', ['api']
+)
+TIMESTAMP_CACHE_HITS = Counter(
+    'timestamp_conversion_cache_hits', 'Distinct timestamp values served from the conversion cache'
+)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Client attributes that are returned unwrapped
+_PASSTHROUGH_ATTRIBUTES = {'transport', 'close'}
+
+
+class InstrumentedClient:
+    """Proxy around an Elasticsearch client that times every API call.
+
+    Works for Elasticsearch and AsyncElasticsearch. Namespaced APIs
+    (es.indices, es.ingest, ...) are wrapped too, and the clients returned
+    by options() stay instrumented, so helpers.bulk() and similar helpers
+    are covered as well. Calls are labelled with their API
+    name, e.g. "ping", "count", "indices.exists_data_stream" or "bulk".
+    Attribute writes (helpers set es._client_meta, for one) go to the
+    wrapped client.
+    """
+
+    _OWN_ATTRIBUTES = frozenset({'_client', '_prefix', '_wrapped'})
+
+    def __init__(self, client, prefix=''):
+        object.__setattr__(self, '_client', client)
+        object.__setattr__(self, '_prefix', prefix)
+        object.__setattr__(self, '_wrapped', {})
+
+    def __setattr__(self, name, value):
+        if name in self._OWN_ATTRIBUTES:
+            object.__setattr__(self, name, value)
+            return
+        self._wrapped.pop(name, None)
+        setattr(self._client, name, value)
+
+    def __delattr__(self, name):
+        if name in self._OWN_ATTRIBUTES:
+            object.__delattr__(self, name)
+            return
+        self._wrapped.pop(name, None)
+        delattr(self._client, name)
+
+    def __getattr__(self, name):
+        wrapped = self._wrapped.get(name)
+        if wrapped is not None:
+            return wrapped
+
+        attribute = getattr(self._client, name)
+        if name.startswith('_') or name in _PASSTHROUGH_ATTRIBUTES:
+            return attribute
+
+        if name == 'options':
+            def wrapped(*args, **kwargs):
+                return InstrumentedClient(attribute(*args, **kwargs), self._prefix)
+        elif callable(attribute):
+            wrapped = _timed_call(attribute, f"{self._prefix}{name}")
+        elif hasattr(attribute, 'perform_request'):
+            wrapped = InstrumentedClient(attribute, f"{self._prefix}{name}.")
+        else:
+            return attribute
+
+        self._wrapped[name] = wrapped
+        return wrapped
+
+
+def _timed_call(function, api):
+    histogram = ES_REQUEST_SECONDS.labels(api)
+    errors = ES_REQUEST_ERRORS.labels(api)
+
+    def call(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            result = function(*args, **kwargs)
+        except Exception:
+            errors.inc()
+            histogram.observe(time.perf_counter() - started)
+            raise
+        # AsyncElasticsearch methods return coroutines; time them until awaited
+        if inspect.isawaitable(result):
+            return _timed_await(result, started, histogram, errors)
+        histogram.observe(time.perf_counter() - started)
+        return result
+
+    return call
+
+
+async def _timed_await(awaitable, started, histogram, errors):
+    try:
+        return await awaitable
+    except Exception:
+        errors.inc()
+        raise
+    finally:
+        histogram.observe(time.perf_counter() - started)
+
+
+def instrument_client(client):
+    """Wrap an Elasticsearch client so its API calls are recorded"""
+    if client is None or isinstance(client, InstrumentedClient):
+        return client
+    return InstrumentedClient(client)
+
+
+def write_metrics_file(path, registry=None):
+    """Write the current metrics to a file in the text exposition format"""
+    with open(path, 'w') as f:
+        f.write((registry or REGISTRY).render())
+    logger.info(f"Wrote metrics to {path}")
+
+
+def push_metrics(gateway_url, job, registry=None):
+    """Push the current metrics to a Prometheus Pushgateway"""
+    from client_factory import http_session
+
+    url = f"{gateway_url.rstrip('/')}/metrics/job/{job}"
+    try:
+        response = http_session().put(
+            url,
+            data=(registry or REGISTRY).render().encode('utf-8'),
+            headers={'Content-Type': CONTENT_TYPE},
+            timeout=10
+        )
+        if response.status_code >= 300:
+            logger.warning(f"Pushgateway returned {response.status_code}: {response.text}")
+            return False
+    except Exception as e:
+        logger.warning(f"Error pushing metrics to {url}: {str(e)}")
+        return False
+    logger.info(f"Pushed metrics to {url}")
+    return True
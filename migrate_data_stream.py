@@ -0,0 +1,394 @@
+#!/usr/bin/env python3
+"""
+Data Stream Migration
+
+Copies a data stream into a new one created from the current index template,
+so mapping changes that existing backing indices cannot take (a field type
+change, flattened fields, a new index mode) do not mean deleting the data:
+
+    python setup_elasticsearch.py --components templates   # push the new template
+    python migrate_data_stream.py --source temperaturesensor-ds --dest temperaturesensor-v2-ds
+
+The destination must match the sensor type's index pattern
+(temperaturesensor-*) to pick up its template.
+
+1. The documents already in the source are copied window by window (one
+   week by default) with throttled, sliced _reindex tasks. Progress comes
+   from the task API.
+2. The alias (the sensor type name, e.g. temperaturesensor) is moved from
+   the source to the destination in one atomic _aliases call and becomes
+   the destination's write alias. setup_elasticsearch.py creates the alias,
+   and the push API, the Kibana index patterns and /status go through it,
+   so they switch over without downtime and never see both copies; the
+   batch ingester should be given the alias as --index too.
+3. Documents the source received while the copy ran (by ingested_at) are
+   copied too, and the document counts are compared.
+
+Progress is saved to a state file after every window. Ctrl-C, SIGTERM or
+`--pause` from another shell cancels the running task; running the same
+command again resumes from the first unfinished window. Documents keep
+their _id and are created with op_type create, so a window that is copied
+again skips the documents it already copied. --rethrottle changes the rate
+of the running task.
+
+Source documents have already been through the ingest pipeline, so the
+destination's default pipeline is skipped; --pipeline names a pipeline to
+transform documents on the way instead. The source is kept unless
+--delete-source is given and the counts match.
+"""
+
+import argparse
+import json
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from dotenv import load_dotenv
+
+from backfill import WINDOW_CHOICES, WINDOW_WEEK, window_ranges
+from client_factory import create_client
+from sensor_registry import sensor_for_index
+
+# Load environment variables
+load_dotenv()
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+DEFAULT_REQUESTS_PER_SECOND = 5000  # documents per second; -1 is unthrottled
+DEFAULT_SLICES = 'auto'             # one slice per shard
+POLL_INTERVAL = 2                   # seconds between task status requests
+PROGRESS_INTERVAL = 10              # seconds between progress reports
+# Documents ingested this long before the migration started are copied
+# again by the catch-up, in case of clock skew between hosts
+CATCH_UP_MARGIN = timedelta(minutes=5)
+CATCH_UP = 'catch-up'
+
+
+class MigrationPaused(Exception):
+    """The running reindex task was cancelled to pause the migration"""
+
+
+def parse_arguments():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description='Migrate a data stream to a new index template')
+    parser.add_argument('--source', required=True, help='Data stream to migrate')
+    parser.add_argument('--dest', required=True,
+                        help='New data stream (must match the index pattern of the template)')
+    parser.add_argument('--alias',
+                        help='Alias to move to the new data stream (default: the sensor type name)')
+    parser.add_argument('--host', default=os.environ.get('ES_HOST', 'http://localhost:9200'),
+                        help='Elasticsearch host URL')
+    parser.add_argument('--requests-per-second', type=float, default=DEFAULT_REQUESTS_PER_SECOND,
+                        help='Reindex throttle in documents per second (-1: unthrottled)')
+    parser.add_argument('--slices', type=parse_slices, default=DEFAULT_SLICES,
+                        help="Slices per reindex task ('auto': one per shard)")
+    parser.add_argument('--window', choices=WINDOW_CHOICES, default=WINDOW_WEEK,
+                        help='@timestamp range copied by each reindex task')
+    parser.add_argument('--pipeline', help='Ingest pipeline to run on the copied documents (default: none)')
+    parser.add_argument('--state-file',
+                        help='Progress file for pausing and resuming (default: .migration-<source>-<dest>.json)')
+    parser.add_argument('--delete-source', action='store_true',
+                        help='Delete the source data stream once the counts match')
+    parser.add_argument('--pause', action='store_true',
+                        help='Pause a running migration (cancels its reindex task)')
+    parser.add_argument('--rethrottle', type=float, metavar='REQUESTS_PER_SECOND',
+                        help='Change the throttle of a running migration')
+    return parser.parse_args()
+
+
+def parse_slices(value):
+    if value == 'auto':
+        return value
+    try:
+        slices = int(value)
+    except ValueError:
+        slices = 0
+    if slices < 1:
+        raise argparse.ArgumentTypeError("slices must be 'auto' or a positive integer")
+    return slices
+
+
+class MigrationState:
+    """JSON file holding the windows of a migration and how far it got"""
+
+    def __init__(self, path):
+        self.path = path
+        self.data = {}
+        if os.path.exists(path):
+            try:
+                with open(path, 'r') as f:
+                    self.data = json.load(f)
+                logger.info(f"Loaded migration state from {path}")
+            except ValueError:
+                logger.warning(f"Ignoring unreadable migration state {path}")
+
+    def get(self, key, default=None):
+        return self.data.get(key, default)
+
+    def update(self, **values):
+        """Record values and write the state atomically"""
+        self.data.update(values)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.data, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+
+def task_progress(status):
+    """(documents processed, documents to process) of a reindex task status"""
+    done = status.get('created', 0) + status.get('updated', 0) + status.get('version_conflicts', 0)
+    return done, status.get('total', 0)
+
+
+class Migration:
+    """Copies source into dest window by window, then moves the alias over"""
+
+    def __init__(self, es, source, dest, alias, state, window=WINDOW_WEEK,
+                 requests_per_second=DEFAULT_REQUESTS_PER_SECOND, slices=DEFAULT_SLICES, pipeline=None):
+        self.es = es
+        self.source = source
+        self.dest = dest
+        self.alias = alias
+        self.state = state
+        self.window = window
+        self.requests_per_second = requests_per_second
+        self.slices = slices
+        self.pipeline = pipeline
+        self.stop = threading.Event()
+
+    def _prepare(self):
+        """Create dest if needed and plan the windows on the first run"""
+        from elasticsearch import NotFoundError
+        if not self.es.indices.exists(index=self.source):
+            raise ValueError(f"Source data stream {self.source} does not exist")
+        if not self.state.get('swapped') and not self.es.indices.exists_alias(name=self.alias, index=self.source):
+            # Writers would keep writing to source after the swap
+            raise ValueError(f"Alias {self.alias} does not point to {self.source}; "
+                             f"create it with setup_elasticsearch.py --components datastreams")
+        try:
+            self.es.indices.get_data_stream(name=self.dest)
+        except NotFoundError:
+            # Needs an index template matching dest (setup_elasticsearch.py)
+            self.es.indices.create_data_stream(name=self.dest)
+            logger.info(f"Created data stream {self.dest}")
+
+        if self.state.get('windows') is not None:
+            if (self.state.get('source'), self.state.get('dest')) != (self.source, self.dest):
+                raise ValueError(f"State file {self.state.path} belongs to the migration of "
+                                 f"{self.state.get('source')} to {self.state.get('dest')}")
+            done = len(self.state.get('done', []))
+            logger.info(f"Resuming migration of {self.source} to {self.dest}: "
+                        f"{done} of {len(self.state.get('windows'))} windows copied")
+            return
+
+        started_at = datetime.now(timezone.utc).isoformat()
+        query = self._existing_query(started_at)
+        response = self.es.search(index=self.source, size=0, query=query, track_total_hits=True, aggs={
+            'first': {'min': {'field': '@timestamp'}},
+            'last': {'max': {'field': '@timestamp'}},
+        })
+        total = response['hits']['total']['value']
+        aggs = response['aggregations']
+        windows = []
+        if total:
+            windows = [(label, start.isoformat(), end.isoformat())
+                       for label, start, end in window_ranges(aggs['first']['value'], aggs['last']['value'],
+                                                              self.window)]
+        self.state.update(source=self.source, dest=self.dest, started_at=started_at, total=total,
+                          windows=windows, done=[], copied=0, task=None, swapped=False, caught_up=False)
+        logger.info(f"Migrating {total} documents from {self.source} to {self.dest} in {len(windows)} windows")
+
+    def _existing_query(self, started_at):
+        """Documents ingested before the migration started (or without ingested_at)"""
+        return {'bool': {'must_not': [{'range': {'ingested_at': {'gte': started_at}}}]}}
+
+    def _window_query(self, start, end):
+        query = self._existing_query(self.state.get('started_at'))
+        query['bool']['filter'] = [{'range': {'@timestamp': {'gte': start, 'lt': end}}}]
+        return query
+
+    def _catch_up_query(self):
+        since = datetime.fromisoformat(self.state.get('started_at')) - CATCH_UP_MARGIN
+        return {'range': {'ingested_at': {'gte': since.isoformat()}}}
+
+    def _start_task(self, label, query):
+        dest = {'index': self.dest, 'op_type': 'create', 'pipeline': self.pipeline or '_none'}
+        response = self.es.reindex(source={'index': self.source, 'query': query}, dest=dest,
+                                   conflicts='proceed', slices=self.slices,
+                                   requests_per_second=self.requests_per_second,
+                                   wait_for_completion=False)
+        self.state.update(task={'id': response['task'], 'label': label})
+        logger.info(f"Started reindex task {response['task']} for {label}")
+        return response['task']
+
+    def _running_task(self, label):
+        """The task of an earlier run still copying label, if any"""
+        from elasticsearch import NotFoundError
+        task = self.state.get('task')
+        if not task or task['label'] != label:
+            return None
+        try:
+            result = self.es.tasks.get(task_id=task['id'])
+        except NotFoundError:
+            return None
+        if result.get('completed'):
+            # Finished or cancelled while no one was watching; copying the
+            # window again is cheap, every document already there conflicts
+            return None
+        logger.info(f"Reattaching to reindex task {task['id']} for {label}")
+        return task['id']
+
+    def copy(self, label, query):
+        """Copy the documents matching query; returns how many were processed"""
+        task_id = self._running_task(label) or self._start_task(label, query)
+        started = last_report = time.monotonic()
+        while True:
+            if self.stop.is_set():
+                self.es.tasks.cancel(task_id=task_id)
+                raise MigrationPaused(label)
+            result = self.es.tasks.get(task_id=task_id)
+            status = result['task']['status']
+            if result.get('completed'):
+                break
+            now = time.monotonic()
+            if now - last_report >= PROGRESS_INTERVAL:
+                self._report(label, status, now - started)
+                last_report = now
+            self.stop.wait(POLL_INTERVAL)
+
+        if 'error' in result:
+            raise RuntimeError(f"Reindex of {label} failed: {result['error'].get('reason', result['error'])}")
+        response = result.get('response', {})
+        if response.get('canceled'):
+            raise MigrationPaused(label)
+        if response.get('failures'):
+            failure = response['failures'][0]
+            raise RuntimeError(f"Reindex of {label} failed for {len(response['failures'])} documents, "
+                               f"e.g. {failure.get('cause', failure)}")
+        done, _ = task_progress(response)
+        conflicts = response.get('version_conflicts', 0)
+        logger.info(f"Copied {label}: {response.get('created', 0)} documents created"
+                    + (f", {conflicts} already there" if conflicts else "")
+                    + f" in {response.get('took', 0) / 1000:.1f}s")
+        return done
+
+    def _report(self, label, status, elapsed):
+        done, total = task_progress(status)
+        rate = status.get('requests_per_second', -1)
+        throttle = 'unthrottled' if rate in (None, -1) or rate == float('inf') else f"throttled to {rate:,.0f}/s"
+        overall = ''
+        if label != CATCH_UP:
+            overall = f"{self.state.get('copied', 0) + done}/{self.state.get('total', 0)} overall, "
+        logger.info(f"{label}: {done}/{total} documents ({done / max(total, 1):.0%}), {overall}"
+                    f"{done / max(elapsed, 1e-9):,.0f} docs/s, {throttle}")
+
+    def swap_alias(self):
+        """Move the alias from source to dest in one atomic request"""
+        actions = []
+        if self.es.indices.exists_alias(name=self.alias, index=self.source):
+            actions.append({'remove': {'index': self.source, 'alias': self.alias}})
+        actions.append({'add': {'index': self.dest, 'alias': self.alias, 'is_write_index': True}})
+        self.es.indices.update_aliases(actions=actions)
+        logger.info(f"Alias {self.alias} now points to {self.dest}")
+
+    def verify(self):
+        """Compare document counts; True when dest has every source document"""
+        self.es.indices.refresh(index=self.dest)
+        source_count = self.es.count(index=self.source)['count']
+        dest_count = self.es.count(index=self.dest)['count']
+        if dest_count < source_count:
+            logger.warning(f"{self.dest} has {dest_count} documents, {self.source} has {source_count}; "
+                           f"documents written to {self.source} after the alias moved are not copied")
+            return False
+        logger.info(f"{self.dest} has {dest_count} documents, {self.source} has {source_count}")
+        return True
+
+    def run(self, delete_source=False):
+        self._prepare()
+        done = set(self.state.get('done', []))
+        for label, start, end in self.state.get('windows'):
+            if label in done:
+                continue
+            copied = self.copy(label, self._window_query(start, end))
+            self.state.update(done=self.state.get('done') + [label],
+                              copied=self.state.get('copied', 0) + copied, task=None)
+
+        if not self.state.get('swapped'):
+            self.swap_alias()
+            self.state.update(swapped=True)
+        if not self.state.get('caught_up'):
+            self.copy(CATCH_UP, self._catch_up_query())
+            self.state.update(caught_up=True, task=None)
+
+        if self.verify() and delete_source:
+            self.es.indices.delete_data_stream(name=self.source)
+            logger.info(f"Deleted data stream {self.source}")
+        logger.info(f"Migration of {self.source} to {self.dest} completed")
+
+
+def running_task(state):
+    task = state.get('task')
+    if not task:
+        logger.error(f"No running migration task in {state.path}")
+        sys.exit(1)
+    return task
+
+
+def main():
+    """Main function to run the migration"""
+    args = parse_arguments()
+    state = MigrationState(args.state_file or f".migration-{args.source}-{args.dest}.json")
+    es = create_client(args.host, request_timeout=60, default_password='changeme')
+
+    if args.pause:
+        task = running_task(state)
+        es.tasks.cancel(task_id=task['id'])
+        logger.info(f"Cancelled reindex task {task['id']} ({task['label']}); run the migration again to resume")
+        return
+    if args.rethrottle is not None:
+        task = running_task(state)
+        es.reindex_rethrottle(task_id=task['id'], requests_per_second=args.rethrottle)
+        logger.info(f"Reindex task {task['id']} throttled to {args.rethrottle} documents per second")
+        return
+
+    alias = args.alias
+    if not alias:
+        sensor = sensor_for_index(args.source)
+        if sensor is None:
+            logger.error(f"No sensor type matches {args.source}; name the alias with --alias")
+            sys.exit(1)
+        alias = sensor.alias
+
+    migration = Migration(es, args.source, args.dest, alias, state, window=args.window,
+                          requests_per_second=args.requests_per_second, slices=args.slices,
+                          pipeline=args.pipeline)
+
+    def request_pause(signum, frame):
+        logger.info("Pausing migration...")
+        migration.stop.set()
+
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, request_pause)
+
+    try:
+        migration.run(delete_source=args.delete_source)
+    except MigrationPaused as e:
+        logger.info(f"Migration paused while copying {e}; run the same command again to resume")
+    except Exception as e:
+        logger.error(f"Migration failed: {str(e)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Node Selection
+
+Node selectors for clients that talk to several Elasticsearch nodes:
+
+- round_robin: rotate through the live nodes (the transport's default)
+- least_loaded: pick the live node with the fewest requests in flight,
+  rotating between equally loaded nodes
+
+Least-loaded selection needs to know how busy each node is, so it is paired
+with InFlightNode (AsyncInFlightNode for AsyncElasticsearch), an HTTP node
+that counts its in-flight requests. Dead
+nodes are never offered to the selector; the transport's node pool takes a
+failed node out of rotation and retries it after an exponential backoff.
+"""
+
+import itertools
+import threading
+
+from elastic_transport import NodeSelector, RoundRobinSelector, Urllib3HttpNode
+
+SELECTOR_ROUND_ROBIN = 'round_robin'
+SELECTOR_LEAST_LOADED = 'least_loaded'
+SELECTOR_CHOICES = [SELECTOR_ROUND_ROBIN, SELECTOR_LEAST_LOADED]
+
+
+class InFlightNode(Urllib3HttpNode):
+    """urllib3 node that tracks how many requests it is currently serving"""
+
+    def __init__(self, config):
+        super().__init__(config)
+        self.in_flight = 0
+        self._in_flight_lock = threading.Lock()
+
+    def perform_request(self, *args, **kwargs):
+        with self._in_flight_lock:
+            self.in_flight += 1
+        try:
+            return super().perform_request(*args, **kwargs)
+        finally:
+            with self._in_flight_lock:
+                self.in_flight -= 1
+
+
+class LeastLoadedSelector(NodeSelector):
+    """Select the node with the fewest in-flight requests"""
+
+    def __init__(self, node_configs):
+        super().__init__(node_configs)
+        self._rotation = itertools.count()
+
+    def select(self, nodes):
+        lowest = min(getattr(node, 'in_flight', 0) for node in nodes)
+        candidates = [node for node in nodes if getattr(node, 'in_flight', 0) == lowest]
+        # Rotate between ties so idle clusters still spread requests
+        return candidates[next(self._rotation) % len(candidates)]
+
+
+def async_in_flight_node_class():
+    """aiohttp node class that tracks in-flight requests (imported lazily)"""
+    global AsyncInFlightNode
+    if AsyncInFlightNode is None:
+        from elastic_transport import AiohttpHttpNode
+
+        class _AsyncInFlightNode(AiohttpHttpNode):
+            """aiohttp node that tracks how many requests it is currently serving"""
+
+            def __init__(self, config):
+                super().__init__(config)
+                # Only touched from the event loop thread, so no lock is needed
+                self.in_flight = 0
+
+            async def perform_request(self, *args, **kwargs):
+                self.in_flight += 1
+                try:
+                    return await super().perform_request(*args, **kwargs)
+                finally:
+                    self.in_flight -= 1
+
+        AsyncInFlightNode = _AsyncInFlightNode
+    return AsyncInFlightNode
+
+
+# Created on first use so the sync scripts do not need aiohttp
+AsyncInFlightNode = None
+
+
+def selector_options(name, asynchronous=False):
+    """Client keyword arguments for a selector name"""
+    if name == SELECTOR_LEAST_LOADED:
+        node_class = async_in_flight_node_class() if asynchronous else InFlightNode
+        return {'node_class': node_class, 'node_selector_class': LeastLoadedSelector}
+    if name == SELECTOR_ROUND_ROBIN:
+        return {'node_selector_class': RoundRobinSelector}
+    raise ValueError(f"Unknown node selector '{name}', expected one of {', '.join(SELECTOR_CHOICES)}")
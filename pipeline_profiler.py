@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+Pipeline Profiler
+
+Per-phase timing for the ingestion pipeline (read_csv, timestamps,
+prepare_documents, serialize, bulk). Every phase records wall time, CPU time
+of the calling thread, rows and bytes. Optionally:
+
+- a Chrome trace (chrome://tracing, Perfetto) with one event per phase
+  execution, laid out per worker thread
+- a cProfile dump of one phase, or of whichever phase was hottest
+
+JSON serialization happens inside helpers.bulk, interleaved with the network
+calls, so it is measured by wrapping the client's JSON serializer and is
+reported as a "serialize" sub-phase whose time is subtracted from "bulk".
+"""
+
+import cProfile
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Pseudo phase name selecting the phase with the most wall time
+HOTTEST_PHASE = 'auto'
+
+
+class PhaseSpan:
+    """One execution of a phase; callers may update rows and bytes while it runs"""
+
+    __slots__ = ('name', 'rows', 'bytes', 'children')
+
+    def __init__(self, name, rows=0, nbytes=0):
+        self.name = name
+        self.rows = rows
+        self.bytes = nbytes
+        self.children = {}
+
+    def add_child(self, name, wall, cpu, nbytes=0):
+        """Account time spent in a sub-phase that is not a contiguous block"""
+        child = self.children.setdefault(name, [0.0, 0.0, 0])
+        child[0] += wall
+        child[1] += cpu
+        child[2] += nbytes
+
+
+class PipelineProfiler:
+    """Collects per-phase statistics, trace events and optional cProfile data"""
+
+    def __init__(self, trace=False, cprofile_phase=None):
+        self.trace = trace
+        self.cprofile_phase = cprofile_phase
+        self.stats = {}
+        self.events = []
+        self._profiles = {}
+        self._lock = threading.Lock()
+        # Only one cProfile profiler can be active at a time
+        self._cprofile_lock = threading.Lock()
+        self._local = threading.local()
+        self._origin = time.perf_counter()
+
+    def current_span(self):
+        """Return the innermost phase running on this thread, or None"""
+        stack = getattr(self._local, 'stack', None)
+        return stack[-1] if stack else None
+
+    @contextmanager
+    def phase(self, name, rows=0, nbytes=0):
+        """Time a block of code as one execution of a pipeline phase"""
+        span = PhaseSpan(name, rows, nbytes)
+        stack = self._local.__dict__.setdefault('stack', [])
+        profile = self._start_cprofile(name)
+        stack.append(span)
+        started_wall = time.perf_counter()
+        started_cpu = time.thread_time()
+        try:
+            yield span
+        finally:
+            wall = time.perf_counter() - started_wall
+            cpu = time.thread_time() - started_cpu
+            stack.pop()
+            if profile:
+                profile.disable()
+                self._cprofile_lock.release()
+            self._finish(span, started_wall, wall, cpu)
+
+    def _start_cprofile(self, name):
+        if self.cprofile_phase not in (name, HOTTEST_PHASE):
+            return None
+        # Nested or concurrent phases are skipped instead of blocking
+        if not self._cprofile_lock.acquire(blocking=False):
+            return None
+        with self._lock:
+            profile = self._profiles.setdefault(name, cProfile.Profile())
+        profile.enable()
+        return profile
+
+    def _finish(self, span, started, wall, cpu):
+        child_wall = sum(child[0] for child in span.children.values())
+        child_cpu = sum(child[1] for child in span.children.values())
+        with self._lock:
+            self._add(span.name, wall - child_wall, cpu - child_cpu, span.rows, span.bytes, 1)
+            for name, (c_wall, c_cpu, c_bytes) in span.children.items():
+                self._add(name, c_wall, c_cpu, span.rows, c_bytes, 1)
+            if self.trace:
+                args = {'rows': span.rows, 'bytes': span.bytes, 'cpu_ms': round(cpu * 1000, 3)}
+                for name, child in span.children.items():
+                    args[f'{name}_ms'] = round(child[0] * 1000, 3)
+                    args[f'{name}_bytes'] = child[2]
+                self.events.append({
+                    'name': span.name,
+                    'cat': 'ingest',
+                    'ph': 'X',
+                    'ts': round((started - self._origin) * 1e6, 1),
+                    'dur': round(wall * 1e6, 1),
+                    'pid': os.getpid(),
+                    'tid': threading.get_ident(),
+                    'args': args,
+                })
+
+    def _add(self, name, wall, cpu, rows, nbytes, calls):
+        stats = self.stats.setdefault(name, {'calls': 0, 'wall': 0.0, 'cpu': 0.0, 'rows': 0, 'bytes': 0})
+        stats['calls'] += calls
+        stats['wall'] += wall
+        stats['cpu'] += cpu
+        stats['rows'] += rows
+        stats['bytes'] += nbytes
+
+    def instrument_serializer(self, client):
+        """Time the JSON serialization done by helpers.bulk on this client"""
+        serializers = client.transport.serializers
+        current = serializers.serializers.get('application/json')
+        if current is not None and not isinstance(current, TimedSerializer):
+            serializers.serializers['application/json'] = TimedSerializer(current, self)
+
+    def log_report(self):
+        """Log a per-phase table sorted by wall time"""
+        if not self.stats:
+            return
+        total = sum(stats['wall'] for stats in self.stats.values()) or 1.0
+        logger.info(f"{'phase':<18}{'calls':>7}{'wall s':>10}{'cpu s':>10}{'%wall':>7}"
+                    f"{'rows':>11}{'MB':>9}{'rows/s':>11}")
+        for name, stats in sorted(self.stats.items(), key=lambda item: -item[1]['wall']):
+            rate = stats['rows'] / stats['wall'] if stats['wall'] > 0 else 0
+            logger.info(
+                f"{name:<18}{stats['calls']:>7}{stats['wall']:>10.3f}{stats['cpu']:>10.3f}"
+                f"{100 * stats['wall'] / total:>6.1f}%{stats['rows']:>11}"
+                f"{stats['bytes'] / 1e6:>9.2f}{rate:>11.0f}"
+            )
+        logger.info("CPU time is per thread; wall time well above CPU time means waiting on I/O")
+
+    def write_trace(self, path):
+        """Write collected events in the Chrome trace event format"""
+        with self._lock:
+            events = list(self.events)
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+        logger.info(f"Wrote {len(events)} trace events to {path}")
+
+    def write_cprofile(self, path):
+        """Dump the cProfile data of the selected (or hottest) phase"""
+        name = self.cprofile_phase
+        if name == HOTTEST_PHASE:
+            profiled = {phase: stats for phase, stats in self.stats.items() if phase in self._profiles}
+            name = max(profiled, key=lambda phase: profiled[phase]['wall']) if profiled else None
+        profile = self._profiles.get(name)
+        if profile is None:
+            logger.warning(f"No cProfile data collected for phase {self.cprofile_phase}")
+            return None
+        profile.dump_stats(path)
+        logger.info(f"Wrote cProfile data for phase '{name}' to {path} (view with: python -m pstats {path})")
+        return name
+
+
+class TimedSerializer:
+    """Delegating serializer that reports dumps() time to the running phase"""
+
+    def __init__(self, serializer, profiler):
+        self._serializer = serializer
+        self._profiler = profiler
+        self.mimetype = serializer.mimetype
+
+    def dumps(self, data):
+        span = self._profiler.current_span()
+        if span is None:
+            return self._serializer.dumps(data)
+        started_wall = time.perf_counter()
+        started_cpu = time.thread_time()
+        result = self._serializer.dumps(data)
+        span.add_child('serialize', time.perf_counter() - started_wall,
+                       time.thread_time() - started_cpu, len(result))
+        return result
+
+    def loads(self, data):
+        return self._serializer.loads(data)
+
+    def __getattr__(self, name):
+        return getattr(self._serializer, name)
+
+
+class NullProfiler:
+    """Stand-in used when profiling is off; phases cost a single call"""
+
+    @contextmanager
+    def phase(self, name, rows=0, nbytes=0):
+        yield PhaseSpan(name, rows, nbytes)
+
+    def instrument_serializer(self, client):
+        pass
+
+    def log_report(self):
+        pass
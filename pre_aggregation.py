@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Client-Side Pre-Aggregation
+
+High-frequency sensors report far more often than the dashboards chart, so
+indexing every raw row costs index volume and query time for nothing. The
+pre-aggregator turns the rows of a sensor type into one summary document per
+host and time bucket:
+
+    {"@timestamp": "2024-03-05T10:01:00.000Z", "tag": {"host": "sensor1", ...},
+     "temperaturesensor": {"telemetry_temperature_value": 21.4},   # average
+     "temperature_value_min": 20.9, "temperature_value_max": 22.0,
+     "sample_count": 60, "summary_interval": "1m"}
+
+Summary documents go through the sensor type's ingest pipeline like raw
+ones, so the average lands in the usual metric field and the existing
+charts work on them unchanged. Keyword metrics (units) take the first value
+of the bucket.
+
+Batches are aggregated with one pandas group-by each. Partial buckets are
+carried between batches, and a host's bucket is emitted once a row for a
+later bucket of that host arrives, so memory stays at about one open bucket
+per host. Rows that arrive for a bucket already emitted (input out of time
+order) produce a second summary document for that bucket; they are counted
+in the report.
+"""
+
+import itertools
+import logging
+import re
+
+from lazy_imports import lazy_import
+from schema_mapping import LAYOUT_NESTED, document_builder
+
+pd = lazy_import('pandas')
+
+logger = logging.getLogger(__name__)
+
+MODE_SUMMARY = 'summary'  # raw documents plus summaries in a separate data stream
+MODE_REPLACE = 'replace'  # summaries only, still in the summary data stream
+MODE_CHOICES = [MODE_SUMMARY, MODE_REPLACE]
+
+INTERVAL_PATTERN = re.compile(r'^([1-9]\d*)([smhd])$')
+UNIT_SECONDS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+SUMMARY_TIMESTAMP_FORMAT = '%Y-%m-%dT%H:%M:%S.000Z'
+
+
+def interval_seconds(interval):
+    """Length of an interval such as "30s", "1m" or "1h", in seconds"""
+    match = INTERVAL_PATTERN.match(interval)
+    if not match:
+        raise ValueError(f"Invalid interval '{interval}': use a number and s, m, h or d (e.g. 1m)")
+    return int(match.group(1)) * UNIT_SECONDS[match.group(2)]
+
+
+class PreAggregator:
+    """Streaming min/max/avg/count of a sensor type's metrics per (host, time bucket)"""
+
+    def __init__(self, sensor, interval, index_name, layout=LAYOUT_NESTED):
+        self.sensor = sensor
+        self.interval = interval
+        self.bucket_size = pd.Timedelta(seconds=interval_seconds(interval))
+        self.numeric = [metric.target for metric in sensor.metrics if metric.field_type == 'float']
+        self.keywords = [metric.target for metric in sensor.metrics if metric.field_type != 'float']
+        self.paths = {metric.target: sensor.metric_path(metric) for metric in sensor.metrics}
+        self.open = None   # partial aggregates of the open buckets, indexed by (host, bucket)
+        self.emitted = {}  # host -> latest bucket emitted
+        self.rows = 0
+        self.late_rows = 0
+        self.summaries = 0
+
+        # Named aggregations of a batch, and how partial aggregates of the
+        # same bucket from different batches combine
+        self._aggregations = {}
+        self._merge = {}
+        for target in self.numeric:
+            for stat in ('min', 'max', 'sum'):
+                self._aggregations[f"{target}_{stat}"] = (target, stat)
+                self._merge[f"{target}_{stat}"] = stat
+        for target in self.keywords:
+            self._aggregations[target] = (target, 'first')
+            self._merge[target] = 'first'
+        self._aggregations['sample_count'] = ('bucket', 'size')
+        self._merge['sample_count'] = 'sum'
+
+        # Summary documents have a fixed shape; build them like CSV plans do
+        self.columns = (['@timestamp', 'measurement_name', 'tag.host', 'tag.sensor_type']
+                        + [self.paths[target] for target in self.numeric + self.keywords]
+                        + [f"{target}_{stat}" for target in self.numeric for stat in ('min', 'max')]
+                        + ['sample_count', 'summary_interval'])
+        self._builder = document_builder(self.columns, index_name, layout)
+
+    def _frame(self, plan, df):
+        """Host, bucket and metric columns of the valid rows of a batch"""
+        columns, invalid, counts = plan.validate(df)
+        for path, count in counts.items():
+            logger.warning(f"Skipping {count} rows with missing or non-numeric values for {path}")
+        values = {spec.path: column for spec, column in zip(plan.fields, columns)}
+        frame = pd.DataFrame({'host': list(values['tag.host']), 'timestamp': values['@timestamp']})
+        for target in self.numeric + self.keywords:
+            frame[target] = list(values[self.paths[target]])
+        frame = frame[~invalid]
+
+        if pd.api.types.is_numeric_dtype(frame['timestamp']):
+            timestamps = pd.to_datetime(frame['timestamp'], unit='ms', utc=True)
+        else:
+            timestamps = pd.to_datetime(frame['timestamp'], utc=True, format='ISO8601')
+        frame['bucket'] = timestamps.dt.floor(self.bucket_size)
+        return frame
+
+    def add(self, plan, df):
+        """Fold a batch of rows into the open buckets; returns the summary
+        documents of the buckets it completed"""
+        frame = self._frame(plan, df)
+        self.rows += len(frame)
+        if self.emitted:
+            emitted = frame['host'].map(self.emitted)
+            self.late_rows += int((frame['bucket'] <= emitted).sum())
+
+        partial = frame.groupby(['host', 'bucket']).agg(**self._aggregations)
+        if self.open is not None and len(self.open):
+            partial = pd.concat([self.open, partial]).groupby(level=['host', 'bucket']).agg(self._merge)
+
+        # A host's buckets before its latest one will not receive more rows
+        buckets = pd.Series(partial.index.get_level_values('bucket'), index=partial.index)
+        complete = (buckets < buckets.groupby(level='host').transform('max')).to_numpy()
+        self.open = partial[~complete]
+        return self._documents(partial[complete])
+
+    def flush(self):
+        """Summary documents of all open buckets"""
+        remaining, self.open = self.open, None
+        return self._documents(remaining) if remaining is not None else []
+
+    def _documents(self, aggregates):
+        if aggregates is None or not len(aggregates):
+            return []
+        aggregates = aggregates.reset_index()
+        for host, bucket in aggregates.groupby('host')['bucket'].max().items():
+            if host not in self.emitted or bucket > self.emitted[host]:
+                self.emitted[host] = bucket
+
+        count = len(aggregates)
+        measurement = self.sensor.measurement
+        columns = [
+            aggregates['bucket'].dt.strftime(SUMMARY_TIMESTAMP_FORMAT).tolist(),
+            itertools.repeat(measurement, count),
+            aggregates['host'].tolist(),
+            itertools.repeat(measurement, count),
+        ]
+        samples = aggregates['sample_count']
+        columns += [(aggregates[f"{target}_sum"] / samples).tolist() for target in self.numeric]
+        columns += [aggregates[target].tolist() for target in self.keywords]
+        columns += [aggregates[f"{target}_{stat}"].tolist() for target in self.numeric for stat in ('min', 'max')]
+        columns += [samples.astype(int).tolist(), itertools.repeat(self.interval, count)]
+
+        self.summaries += count
+        build = self._builder
+        return [build(values) for values in zip(*columns)]
+
+    def log_report(self):
+        if not self.rows:
+            return
+        logger.info(f"Pre-aggregated {self.rows} rows into {self.summaries} summary documents per "
+                    f"{self.interval} ({self.rows / max(self.summaries, 1):,.1f} rows per document)")
+        if self.late_rows:
+            logger.warning(f"{self.late_rows} rows arrived after their {self.interval} bucket was emitted "
+                           f"(input not in time order); they were summarized in extra documents")
@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""
+Provisioning Engine
+
+Idempotent, concurrent provisioning of Elasticsearch resources for
+setup_elasticsearch.py. Every resource knows how to read its current
+definition and how to push the desired one:
+
+- missing resources are created
+- resources whose current definition differs are updated
+- unchanged resources are left alone (--force pushes them anyway)
+
+Independent resources are provisioned in parallel; a resource waits for the
+resources it depends on (a data stream for its index template) and is
+skipped if one of them failed. Each resource reports its action and how long
+it took.
+"""
+
+import logging
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+CREATED = 'created'
+UPDATED = 'updated'
+UNCHANGED = 'unchanged'
+FAILED = 'failed'
+SKIPPED = 'skipped'
+
+DEFAULT_WORKERS = 8
+
+# key: "<kind>/<name>"; action: one of the constants above
+ProvisionResult = namedtuple('ProvisionResult', ['key', 'action', 'seconds', 'error'])
+
+
+class Resource:
+    """One provisioned object.
+
+    fetch() returns the current definition, or None when the resource does
+    not exist; push(exists) creates or updates it. matches(desired, current)
+    decides whether the current definition is up to date. Resources with
+    overwrite=False (data streams) are only ever created.
+    """
+
+    def __init__(self, kind, name, desired, fetch, push, depends_on=(), matches=None, overwrite=True):
+        self.kind = kind
+        self.name = name
+        self.desired = desired
+        self.fetch = fetch
+        self.push = push
+        self.depends_on = list(depends_on)
+        self.matches = matches or is_subset
+        self.overwrite = overwrite
+
+    @property
+    def key(self):
+        return f"{self.kind}/{self.name}"
+
+
+def is_subset(desired, current):
+    """True if every value in desired is present and equal in current.
+
+    Elasticsearch and Kibana add defaults and metadata to stored
+    definitions, so extra keys in current do not count as a difference.
+    """
+    if isinstance(desired, dict):
+        return isinstance(current, dict) and all(
+            key in current and is_subset(value, current[key]) for key, value in desired.items()
+        )
+    if isinstance(desired, list):
+        return (isinstance(current, list) and len(desired) == len(current)
+                and all(is_subset(d, c) for d, c in zip(desired, current)))
+    return desired == current
+
+
+def apply(resource, force=False):
+    """Bring one resource up to date and return its ProvisionResult"""
+    started = time.perf_counter()
+    try:
+        current = resource.fetch()
+        if current is None:
+            resource.push(False)
+            action = CREATED
+        elif not resource.overwrite or (not force and resource.matches(resource.desired, current)):
+            action = UNCHANGED
+        else:
+            resource.push(True)
+            action = UPDATED
+        error = None
+    except Exception as e:
+        action, error = FAILED, str(e)
+        logger.error(f"Error provisioning {resource.key}: {error}")
+    return ProvisionResult(resource.key, action, time.perf_counter() - started, error)
+
+
+def provision(resources, force=False, workers=DEFAULT_WORKERS):
+    """Provision resources concurrently, respecting their dependencies.
+
+    Dependencies on resources that are not in the list are ignored, so a
+    subset (only templates, say) can be provisioned on its own. Returns the
+    results in the order of the resources.
+    """
+    keys = {resource.key for resource in resources}
+    results = {}
+    pending = list(resources)
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='provision') as executor:
+        while pending:
+            ready = [resource for resource in pending
+                     if all(dep in results for dep in resource.depends_on if dep in keys)]
+            if not ready:
+                raise ValueError(f"Circular dependencies between: {', '.join(r.key for r in pending)}")
+
+            runnable = []
+            for resource in ready:
+                failed = [dep for dep in resource.depends_on
+                          if dep in results and results[dep].action in (FAILED, SKIPPED)]
+                if failed:
+                    results[resource.key] = ProvisionResult(resource.key, SKIPPED, 0.0,
+                                                            f"dependency failed: {', '.join(failed)}")
+                else:
+                    runnable.append(resource)
+            for resource, result in zip(runnable, executor.map(lambda r: apply(r, force), runnable)):
+                results[resource.key] = result
+            pending = [resource for resource in pending if resource.key not in results]
+    return [results[resource.key] for resource in resources]
+
+
+def log_results(results, total_seconds=None):
+    """Log a per-resource table with actions and timings; returns True if none failed"""
+    width = max([len(result.key) for result in results] + [8]) + 2
+    logger.info(f"{'resource':<{width}}{'action':>10}{'ms':>10}")
+    for result in results:
+        logger.info(f"{result.key:<{width}}{result.action:>10}{result.seconds * 1000:>10.1f}")
+    counts = {}
+    for result in results:
+        counts[result.action] = counts.get(result.action, 0) + 1
+    summary = ', '.join(f"{count} {action}" for action, count in counts.items())
+    if total_seconds is not None:
+        summary += f" in {total_seconds:.2f}s"
+    logger.info(f"Provisioned {len(results)} resources: {summary}")
+    return not any(result.action in (FAILED, SKIPPED) for result in results)
+
+
+def _missing_as_none(fetch):
+    from elasticsearch import NotFoundError
+    try:
+        return fetch()
+    except NotFoundError:
+        return None
+
+
+def flatten_settings(settings, prefix=''):
+    """Index settings as {'index.x.y': 'value'} (Elasticsearch returns them nested, as strings)"""
+    flat = {}
+    for key, value in settings.items():
+        path = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten_settings(value, f"{path}."))
+        else:
+            if not path.startswith('index.'):
+                path = f"index.{path}"
+            flat[path] = str(value).lower() if isinstance(value, bool) else str(value)
+    return flat
+
+
+def _template_matches(desired, current):
+    def normalized(template):
+        template = dict(template)
+        body = dict(template.get('template', {}))
+        body['settings'] = flatten_settings(body.get('settings', {}))
+        template['template'] = body
+        return template
+    return is_subset(normalized(desired), normalized(current))
+
+
+def pipeline_resource(es, pipeline_id, body):
+    def fetch():
+        current = _missing_as_none(lambda: es.ingest.get_pipeline(id=pipeline_id))
+        return current[pipeline_id] if current is not None else None
+
+    def push(exists):
+        es.ingest.put_pipeline(id=pipeline_id, body=body)
+
+    return Resource('pipeline', pipeline_id, body, fetch, push)
+
+
+def ilm_policy_resource(es, policy_name, policy):
+    def fetch():
+        current = _missing_as_none(lambda: es.ilm.get_lifecycle(name=policy_name))
+        return current[policy_name]['policy'] if current is not None else None
+
+    def push(exists):
+        es.ilm.put_lifecycle(name=policy_name, policy=policy)
+
+    return Resource('ilm_policy', policy_name, policy, fetch, push)
+
+
+def index_template_resource(es, template_name, body, depends_on=()):
+    def fetch():
+        current = _missing_as_none(lambda: es.indices.get_index_template(name=template_name))
+        return current['index_templates'][0]['index_template'] if current is not None else None
+
+    def push(exists):
+        es.indices.put_index_template(name=template_name, body=body)
+
+    return Resource('template', template_name, body, fetch, push, depends_on, matches=_template_matches)
+
+
+def data_stream_resource(es, stream_name, depends_on=()):
+    def fetch():
+        current = _missing_as_none(lambda: es.indices.get_data_stream(name=stream_name))
+        return current['data_streams'][0] if current and current.get('data_streams') else None
+
+    def push(exists):
+        es.indices.create_data_stream(name=stream_name)
+
+    # Recreating a data stream would delete its data, so it is only created
+    return Resource('data_stream', stream_name, {}, fetch, push, depends_on, overwrite=False)
+
+
+def data_stream_alias_resource(es, alias, stream_name, depends_on=()):
+    def fetch():
+        current = _missing_as_none(lambda: es.indices.get_alias(name=alias))
+        return current or None
+
+    def push(exists):
+        es.indices.update_aliases(actions=[{'add': {'index': stream_name, 'alias': alias, 'is_write_index': True}}])
+
+    # Once created the alias belongs to migrate_data_stream.py, which may
+    # have moved it to another data stream, so it is never re-pointed
+    return Resource('alias', alias, {}, fetch, push, depends_on, overwrite=False)
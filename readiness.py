@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+Readiness Waiter
+
+Waits for Elasticsearch and Kibana to become ready before the setup scripts
+run. Shared by setup_elasticsearch.py, kibana_setup.py and the setup
+containers:
+
+    python readiness.py --es-host http://elasticsearch:9200 --kibana-host http://kibana:5601
+
+- Elasticsearch is long-polled with _cluster/health?wait_for_status=yellow,
+  so the call returns as soon as the cluster turns yellow instead of at the
+  next poll
+- between attempts the delay grows exponentially up to a cap, so a service
+  that is almost up is picked up quickly and a slow one is not hammered
+- every wait has an overall deadline (and optionally a maximum number of
+  attempts)
+- when both services are awaited, they are checked in parallel
+"""
+
+import argparse
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from dotenv import load_dotenv
+
+from client_factory import es_request_kwargs, http_session, parse_hosts
+from lazy_imports import lazy_import
+
+requests = lazy_import('requests')
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TIMEOUT = 300        # overall deadline, seconds
+DEFAULT_POLL_TIMEOUT = 30    # longest single _cluster/health long-poll, seconds
+INITIAL_DELAY = 0.5
+MAX_DELAY = 10
+
+
+class NotReadyError(Exception):
+    """A check that must not be retried (wrong credentials, for instance)"""
+
+
+def backoff_delays(initial=INITIAL_DELAY, cap=MAX_DELAY, factor=2):
+    """initial, initial*factor, ... capped at cap"""
+    delay = initial
+    while True:
+        yield delay
+        delay = min(delay * factor, cap)
+
+
+def wait_until(name, check, timeout=DEFAULT_TIMEOUT, max_attempts=None,
+               initial_delay=INITIAL_DELAY, max_delay=MAX_DELAY):
+    """Call check(attempt, remaining_seconds) until it returns True.
+
+    check returns False (or raises a RequestException) while the service is
+    not ready and raises NotReadyError to give up. Returns whether the
+    service became ready before the deadline.
+    """
+    logger.info(f"Waiting for {name} to be available...")
+    started = time.monotonic()
+    deadline = started + timeout
+    delays = backoff_delays(initial_delay, max_delay)
+    attempt = 0
+    while True:
+        attempt += 1
+        remaining = deadline - time.monotonic()
+        try:
+            if check(attempt, remaining):
+                logger.info(f"{name} is available! ({time.monotonic() - started:.1f}s, attempt {attempt})")
+                return True
+        except NotReadyError as e:
+            logger.error(f"{name}: {str(e)}")
+            return False
+        except requests.exceptions.RequestException as e:
+            logger.warning(f"{name} not yet available, attempt {attempt}: {str(e)}")
+
+        remaining = deadline - time.monotonic()
+        if remaining <= 0 or (max_attempts and attempt >= max_attempts):
+            break
+        time.sleep(min(next(delays), remaining))
+
+    logger.error(f"Timed out waiting for {name} after {time.monotonic() - started:.1f}s ({attempt} attempts)")
+    return False
+
+
+def elasticsearch_check(host, poll_timeout=DEFAULT_POLL_TIMEOUT):
+    """Check for wait_until: long-polls cluster health until the status is yellow or green"""
+    # Authentication and TLS settings from the environment
+    request_kwargs = es_request_kwargs()
+    hosts = parse_hosts(host)
+
+    def check(attempt, remaining):
+        # The server holds the request until the cluster is yellow or the poll
+        # times out; keep the poll inside the overall deadline
+        poll = max(0.1, min(poll_timeout, remaining))
+        # Any configured node will do; try them in turn
+        response = http_session().get(
+            f"{hosts[(attempt - 1) % len(hosts)]}/_cluster/health",
+            params={'wait_for_status': 'yellow', 'timeout': f"{int(poll * 1000)}ms"},
+            timeout=poll + 10,
+            **request_kwargs
+        )
+        if response.status_code == 401:
+            raise NotReadyError("Authentication failed. Check ES_USERNAME and ES_PASSWORD environment variables.")
+        # 408 means the poll timed out before the cluster reached yellow
+        if response.status_code not in (200, 408):
+            logger.warning(f"Unexpected status code: {response.status_code}, response: {response.text}")
+            return False
+        status = response.json().get('status')
+        logger.info(f"Elasticsearch cluster status: {status}")
+        return status in ('yellow', 'green')
+
+    return check
+
+
+def kibana_check(host):
+    """Check for wait_until: Kibana reports its overall status as available"""
+    def check(attempt, remaining):
+        response = http_session().get(f"{host}/api/status", timeout=max(1, min(10, remaining)))
+        if response.status_code != 200:
+            logger.warning(f"Kibana returned status code: {response.status_code}")
+            return False
+        overall = response.json().get('status', {}).get('overall', {})
+        # Kibana 8 reports a level, 7.x a state
+        if overall.get('level') == 'available' or overall.get('state') == 'green':
+            return True
+        logger.warning(f"Kibana status is {overall.get('level') or overall.get('state')}, waiting...")
+        return False
+
+    return check
+
+
+def wait_for_elasticsearch(host, timeout=DEFAULT_TIMEOUT, max_attempts=None):
+    return wait_until("Elasticsearch", elasticsearch_check(host), timeout, max_attempts)
+
+
+def wait_for_kibana(host, timeout=DEFAULT_TIMEOUT, max_attempts=None):
+    return wait_until("Kibana", kibana_check(host), timeout, max_attempts)
+
+
+def wait_for_services(es_host=None, kibana_host=None, timeout=DEFAULT_TIMEOUT, max_attempts=None):
+    """Wait for Elasticsearch and/or Kibana in parallel; True if all are ready"""
+    waits = []
+    if es_host:
+        waits.append((wait_for_elasticsearch, es_host))
+    if kibana_host:
+        waits.append((wait_for_kibana, kibana_host))
+    if not waits:
+        return True
+    with ThreadPoolExecutor(max_workers=len(waits), thread_name_prefix='readiness') as executor:
+        futures = [executor.submit(wait, host, timeout, max_attempts) for wait, host in waits]
+        return all(future.result() for future in futures)
+
+
+def add_wait_arguments(parser):
+    """--wait-timeout and --retry for the setup scripts"""
+    parser.add_argument('--wait-timeout', type=float, default=DEFAULT_TIMEOUT,
+                      help='Seconds to wait for services with --wait')
+    parser.add_argument('--retry', type=int, default=None,
+                      help='Wait for services, giving up after this many attempts (implies --wait)')
+
+
+def main():
+    load_dotenv()
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    parser = argparse.ArgumentParser(description='Wait for Elasticsearch and Kibana to be ready')
+    parser.add_argument('--es-host', default=os.environ.get('ES_HOST', 'http://localhost:9200'),
+                      help='Elasticsearch host URL(s), comma-separated (empty to skip)')
+    parser.add_argument('--kibana-host', default=os.environ.get('KIBANA_URL', ''),
+                      help='Kibana host URL (empty to skip)')
+    parser.add_argument('--timeout', type=float, default=DEFAULT_TIMEOUT,
+                      help='Overall deadline in seconds')
+    args = parser.parse_args()
+    if not wait_for_services(args.es_host, args.kibana_host, args.timeout):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+"""
+CSV Schema Mapping
+
+Maps CSV headers onto sensor document fields. The header is resolved once
+into a plan that knows, for every document field, which column (or constant)
+feeds it. Columns are converted in bulk with pandas and rows are then
+assembled by position, so the per-row work is tuple indexing only.
+
+Field specs come from the sensor type registry (sensor_registry), so every
+registered type gets the same compiled path.
+
+Both header layouts are supported:
+- flat generator output (timestamp, host, temperature_value, ...)
+- dotted export layout (tag.host, temperaturesensor.telemetry_temperature_value, ...)
+"""
+
+import functools
+import itertools
+import logging
+import operator
+import uuid
+
+from lazy_imports import lazy_import
+from sensor_registry import GENERATE_UUID, sensor_for_index
+from timestamp_conversion import find_timestamp_column
+
+pd = lazy_import('pandas')
+
+logger = logging.getLogger(__name__)
+
+LAYOUT_NESTED = 'nested'
+LAYOUT_FLATTENED = 'flattened'
+LAYOUT_CHOICES = [LAYOUT_NESTED, LAYOUT_FLATTENED]
+
+class SchemaMappingError(ValueError):
+    """Raised when a CSV header cannot be mapped onto a sensor schema"""
+
+
+def schema_for_index(index_name):
+    """Return the field specs for an index or data stream name, or None"""
+    sensor = sensor_for_index(index_name)
+    return sensor.fields() if sensor else None
+
+
+def _path_tree(entries):
+    """Group (path parts, position) entries into (key, position | subtree) nodes"""
+    tree = []
+    groups = {}
+    for parts, position in entries:
+        if len(parts) == 1:
+            tree.append((parts[0], position))
+        else:
+            if parts[0] not in groups:
+                groups[parts[0]] = []
+                tree.append((parts[0], groups[parts[0]]))
+            groups[parts[0]].append((parts[1:], position))
+    return [(key, node if isinstance(node, int) else _path_tree(node)) for key, node in tree]
+
+
+def _node_builder(node):
+    """Function building the dict of one tree node from a values tuple"""
+    if all(isinstance(child, int) for _, child in node):
+        # Only leaves: one itemgetter call fills the whole dict
+        keys = tuple(key for key, _ in node)
+        if len(keys) == 1:
+            key, position = node[0]
+            return lambda values: {key: values[position]}
+        getter = operator.itemgetter(*(position for _, position in node))
+        return lambda values: dict(zip(keys, getter(values)))
+    items = tuple((key, operator.itemgetter(child) if isinstance(child, int) else _node_builder(child))
+                  for key, child in node)
+    return lambda values: {key: build(values) for key, build in items}
+
+
+def document_builder(paths, index_name, layout=LAYOUT_NESTED):
+    """Function that assembles one bulk document from a tuple of values, one
+    per field path in paths order.
+
+    The document shape is resolved once into nested getters, so building a
+    document does no path splitting or tree walking.
+    """
+    if layout == LAYOUT_FLATTENED:
+        tree = [(path, position) for position, path in enumerate(paths)]
+    else:
+        tree = _path_tree([(path.split('.'), position) for position, path in enumerate(paths)])
+    build_fields = _node_builder(tree) if tree else (lambda values: {})
+
+    def build(values):
+        document = build_fields(values)
+        document['_index'] = index_name
+        document['_op_type'] = 'create'
+        return document
+    return build
+
+
+class DocumentPlan:
+    """Compiled column-to-document mapping for one CSV header"""
+
+    def __init__(self, fields, header, index_name, layout=LAYOUT_NESTED):
+        if layout not in LAYOUT_CHOICES:
+            raise SchemaMappingError(f"Unsupported document layout: {layout}")
+
+        self.fields = fields
+        self.header = list(header)
+        self.index_name = index_name
+        self.layout = layout
+        # Source column for each field, in field order (None for constants)
+        self.sources = []
+
+        missing = []
+        for spec in fields:
+            column = next((c for c in spec.sources if c in self.header), None)
+            if column is None and spec.required:
+                missing.append(spec)
+            self.sources.append(column)
+
+        if missing:
+            details = "; ".join(
+                f"{spec.path} (expected one of: {', '.join(spec.sources)})" for spec in missing
+            )
+            raise SchemaMappingError(
+                f"CSV header cannot be mapped for {index_name}: missing {details}. "
+                f"Available columns: {', '.join(self.header)}"
+            )
+
+        used = {column for column in self.sources if column}
+        if 'timestamp' in used:
+            # add_timestamp_column() converted this column into "timestamp"
+            used.add(find_timestamp_column([column for column in self.header if column != 'timestamp']))
+        self.unmapped = [column for column in self.header if column not in used]
+
+        self._builder = document_builder([spec.path for spec in fields], index_name, layout)
+
+    def describe(self):
+        """Return a human readable summary of the mapping"""
+        lines = []
+        for spec, column in zip(self.fields, self.sources):
+            if column:
+                lines.append(f"{spec.path} <- {column}")
+            elif spec.default is GENERATE_UUID:
+                lines.append(f"{spec.path} <- generated uuid")
+            else:
+                lines.append(f"{spec.path} <- constant {spec.default!r}")
+        return lines
+
+    def _column_values(self, df, spec, column, invalid):
+        """Convert one source column in bulk, recording invalid rows"""
+        if column is None:
+            if spec.default is GENERATE_UUID:
+                return [str(uuid.uuid4()) for _ in range(len(df))]
+            return itertools.repeat(spec.default, len(df))
+
+        series = df[column]
+        if spec.field_type == 'float':
+            values = pd.to_numeric(series, errors='coerce')
+            bad = values.isna()
+            if spec.default is not None:
+                values = values.fillna(spec.default)
+            elif bad.any():
+                invalid[spec.path] = bad
+            return values.astype(float).tolist()
+
+        if spec.field_type == 'keyword':
+            if spec.default is GENERATE_UUID:
+                series = series.astype(object)
+                missing = series.isna()
+                if missing.any():
+                    series[missing] = [str(uuid.uuid4()) for _ in range(int(missing.sum()))]
+                return series.astype(str).tolist()
+            if spec.default is not None:
+                series = series.fillna(spec.default)
+            return series.astype(str).tolist()
+
+        missing = series.isna()
+        if missing.any() and spec.required:
+            invalid[spec.path] = missing
+        return series.tolist()
+
+    def validate(self, df):
+        """Convert all columns and return (columns, invalid row mask, error counts)"""
+        invalid = {}
+        columns = [
+            self._column_values(df, spec, column, invalid)
+            for spec, column in zip(self.fields, self.sources)
+        ]
+
+        mask = pd.Series(False, index=df.index)
+        counts = {}
+        for path, bad in invalid.items():
+            counts[path] = int(bad.sum())
+            mask |= bad
+        return columns, mask.to_numpy(), counts
+
+    def build(self, values):
+        """Assemble one document from field values in plan order"""
+        return self._builder(values)
+
+    def documents(self, df):
+        """Build documents for a DataFrame, skipping rows with invalid values"""
+        columns, invalid, counts = self.validate(df)
+        for path, count in counts.items():
+            logger.warning(f"Skipping {count} rows with missing or non-numeric values for {path}")
+
+        build = self._builder
+        if not invalid.any():
+            return [build(values) for values in zip(*columns)]
+        return [build(values) for values, skip in zip(zip(*columns), invalid) if not skip]
+
+
+def flatten_record(record, prefix=''):
+    """Flatten a nested JSON object into dotted keys matching the CSV headers"""
+    flat = {}
+    for key, value in record.items():
+        path = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten_record(value, f"{path}."))
+        else:
+            flat[path] = value
+    return flat
+
+
+def records_to_frame(records):
+    """Turn JSON records (flat, dotted or nested) into a DataFrame for a plan"""
+    return pd.DataFrame.from_records([flatten_record(record) for record in records])
+
+
+def compile_plan(header, index_name, layout=LAYOUT_NESTED):
+    """Resolve a CSV header against the schema for an index"""
+    fields = schema_for_index(index_name)
+    if fields is None:
+        raise SchemaMappingError(f"Unknown index type: {index_name}")
+
+    plan = DocumentPlan(fields, header, index_name, layout)
+    for line in plan.describe():
+        logger.debug(f"Field mapping: {line}")
+    if plan.unmapped:
+        logger.info(f"Ignoring unmapped CSV columns: {', '.join(plan.unmapped)}")
+    return plan
+
+
+@functools.lru_cache(maxsize=128)
+def cached_plan(header, index_name, layout=LAYOUT_NESTED):
+    """compile_plan for a header tuple, reusing plans for repeated headers"""
+    return compile_plan(header, index_name, layout)
@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+Sensor Type Registry
+
+Declarative description of every sensor type. Each type lists its metrics
+once; everything type-specific is derived from that:
+
+- the CSV/JSON field specs compiled into document builders (schema_mapping)
+- the ingest pipeline, index template and optional ILM policy (setup_elasticsearch)
+- the data stream reported by /status and accepted by /api/ingest
+- the index pattern and visualization on the Kibana dashboard
+
+Adding a sensor type means adding one SensorType here, or listing it in the
+JSON file named by SENSOR_TYPES_FILE:
+
+    [{"name": "humiditysensor", "measurement": "humidity", "title": "Humidity",
+      "metrics": [{"field": "humidity_value", "target": "humidity", "label": "Average Humidity"}],
+      "axis_title": "Relative humidity (%)"}]
+"""
+
+import json
+import logging
+import os
+import re
+from collections import namedtuple
+
+logger = logging.getLogger(__name__)
+
+# Marker default: generate a random UUID for rows without one
+GENERATE_UUID = object()
+
+# path: dotted document path
+# sources: CSV columns that may feed the field, in order of preference
+# field_type: 'float', 'keyword' or 'date' (dates are converted upstream)
+# default: value used when no source column exists or a value is missing
+# required: whether a missing source column is a mapping error
+FieldSpec = namedtuple('FieldSpec', ['path', 'sources', 'field_type', 'default', 'required'])
+
+# field: document field under "<sensor>.telemetry_", also the flat CSV column
+# target: field name after the ingest pipeline, as stored and charted
+# label: series label on the dashboard (None keeps the metric off the chart)
+MetricSpec = namedtuple('MetricSpec', ['field', 'target', 'field_type', 'default', 'required', 'label'])
+MetricSpec.__new__.__defaults__ = ('float', None, True, None)
+
+FIELD_TYPES = {'float', 'keyword'}
+
+
+class SensorType:
+    """One sensor type and the Elasticsearch and Kibana objects derived from it"""
+
+    def __init__(self, name, measurement, title, metrics, axis_title=None,
+                 chart_title=None, chart_metrics=None, visualization_id=None, ilm_policy=None):
+        if not re.fullmatch(r'[a-z0-9_]+', name):
+            raise ValueError(f"Invalid sensor type name '{name}': use lowercase letters, digits and _")
+        self.name = name
+        self.measurement = measurement
+        self.title = title
+        self.metrics = [metric if isinstance(metric, MetricSpec) else MetricSpec(**metric)
+                        for metric in metrics]
+        for metric in self.metrics:
+            if metric.field_type not in FIELD_TYPES:
+                raise ValueError(f"Unsupported field type '{metric.field_type}' for {name}.{metric.field}")
+        self.axis_title = axis_title or title
+        self.chart_title = chart_title or f"{title} Over Time"
+        # Charted metrics, by target name, in series order
+        self.chart_metrics = list(chart_metrics or [m.target for m in self.metrics if m.label])
+        self.visualization_id = visualization_id or f"{name}-over-time"
+        # Optional ILM policy body ({"phases": ...}) attached to the template
+        self.ilm_policy = ilm_policy
+
+    def __repr__(self):
+        return f"SensorType({self.name!r})"
+
+    @property
+    def stream(self):
+        return f"{self.name}-ds"
+
+    @property
+    def alias(self):
+        """Alias that readers and writers use instead of the data stream name;
+        created by setup_elasticsearch.py and moved by migrate_data_stream.py"""
+        return self.name
+
+    @property
+    def summary_stream(self):
+        """Data stream of pre-aggregated summary documents (pre_aggregation)"""
+        return f"{self.name}_summary-ds"
+
+    @property
+    def index_pattern(self):
+        return f"{self.name}-*"
+
+    @property
+    def index_pattern_id(self):
+        return f"{self.name}-index-pattern"
+
+    @property
+    def pipeline_id(self):
+        return f"{self.name}_pipeline"
+
+    @property
+    def template_name(self):
+        return f"{self.name}_template"
+
+    @property
+    def summary_template_name(self):
+        return f"{self.name}_summary_template"
+
+    @property
+    def policy_name(self):
+        return f"{self.name}_policy"
+
+    def metric_path(self, metric):
+        return f"{self.name}.telemetry_{metric.field}"
+
+    def fields(self):
+        """Field specs for the document builder, in document order"""
+        return [
+            FieldSpec('@timestamp', ('timestamp',), 'date', None, True),
+            FieldSpec('measurement_name', (), 'keyword', self.measurement, False),
+            FieldSpec('tag.host', ('host', 'tag.host'), 'keyword', 'unknown', False),
+            FieldSpec('tag.sensor_type', (), 'keyword', self.measurement, False),
+            FieldSpec('uuid', ('uuid', f'{self.name}.uuid'), 'keyword', GENERATE_UUID, False),
+        ] + [
+            FieldSpec(self.metric_path(metric), (metric.field, self.metric_path(metric)),
+                      metric.field_type, metric.default, metric.required)
+            for metric in self.metrics
+        ]
+
+    def pipeline(self):
+        """Ingest pipeline flattening the telemetry fields"""
+        return {
+            "description": f"Flatten and enrich {self.title.lower()} telemetry",
+            "processors": [
+                {"dot_expander": {"field": "*"}},
+                {"set": {"field": "ingested_at", "value": "{{_ingest.timestamp}}"}},
+            ] + [
+                {"rename": {"field": self.metric_path(metric), "target_field": metric.target}}
+                for metric in self.metrics
+            ] + [
+                {"remove": {"field": self.name}}
+            ]
+        }
+
+    def template(self):
+        """Data stream index template using the pipeline"""
+        properties = {"@timestamp": {"type": "date"}}
+        properties.update({metric.target: {"type": metric.field_type} for metric in self.metrics})
+        properties.update({
+            "ingested_at": {"type": "date"},
+            "measurement_name": {"type": "keyword"},
+            "tag": {
+                "properties": {
+                    "host": {"type": "keyword"},
+                    "sensor_type": {"type": "keyword"}
+                }
+            },
+            "uuid": {"type": "keyword"}
+        })
+        settings = {"index.default_pipeline": self.pipeline_id}
+        if self.ilm_policy:
+            settings["index.lifecycle.name"] = self.policy_name
+        return {
+            "index_patterns": [self.index_pattern],
+            "data_stream": {},
+            "template": {
+                "settings": settings,
+                "mappings": {
+                    "properties": properties
+                }
+            }
+        }
+
+    def summary_template(self):
+        """Template for the summary data stream: the raw template plus the
+        min/max, sample count and interval fields of summary documents"""
+        template = self.template()
+        template["index_patterns"] = [f"{self.name}_summary-*"]
+        properties = template["template"]["mappings"]["properties"]
+        for metric in self.metrics:
+            if metric.field_type == 'float':
+                properties[f"{metric.target}_min"] = {"type": "float"}
+                properties[f"{metric.target}_max"] = {"type": "float"}
+        properties["sample_count"] = {"type": "long"}
+        properties["summary_interval"] = {"type": "keyword"}
+        return template
+
+    def chart_series(self):
+        """(target field, label) for each charted metric"""
+        labels = {metric.target: metric.label or metric.target for metric in self.metrics}
+        return [(target, labels[target]) for target in self.chart_metrics]
+
+
+SENSOR_TYPES = {}
+
+
+def register(sensor_type):
+    """Add or replace a sensor type"""
+    SENSOR_TYPES[sensor_type.name] = sensor_type
+    return sensor_type
+
+
+register(SensorType(
+    'temperaturesensor', 'temperature', 'Temperature',
+    [
+        MetricSpec('temperature_value', 'temperature_value', label='Average Temperature'),
+        MetricSpec('temperature_unit', 'temperature_unit', 'keyword', 'C', False),
+    ],
+    axis_title='Temperature (°C)',
+    visualization_id='temperature-over-time',
+))
+
+register(SensorType(
+    'airqualitysensor', 'air_quality', 'Air Quality',
+    [
+        MetricSpec(f'{metric}_value', metric, label=label)
+        for metric, label in [('co', 'Average CO'), ('no2', 'Average NO2'), ('o3', None),
+                              ('pm10', None), ('pm25', 'Average PM2.5'), ('so2', None)]
+    ],
+    axis_title='Concentration',
+    chart_title='Air Quality Metrics',
+    chart_metrics=['pm25', 'co', 'no2'],
+    visualization_id='air-quality-metrics',
+))
+
+
+def load_sensor_types(path):
+    """Register the sensor types listed in a JSON file"""
+    with open(path) as f:
+        definitions = json.load(f)
+    loaded = [register(SensorType(**definition)) for definition in definitions]
+    logger.info(f"Loaded sensor types from {path}: {', '.join(t.name for t in loaded)}")
+    return loaded
+
+
+if os.environ.get('SENSOR_TYPES_FILE'):
+    load_sensor_types(os.environ['SENSOR_TYPES_FILE'])
+
+
+def sensor_types():
+    """All registered sensor types, in registration order"""
+    return list(SENSOR_TYPES.values())
+
+
+def sensor_for_index(index_name):
+    """Return the sensor type whose name appears in an index or data stream name, or None"""
+    name = index_name.lower()
+    matches = [sensor for sensor in SENSOR_TYPES.values() if sensor.name in name]
+    # Prefer the most specific name when one type's name contains another's
+    return max(matches, key=lambda sensor: len(sensor.name)) if matches else None
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Sensor Dashboard CLI
+
+One entry point for the setup and ingestion scripts:
+
+    python sensorctl.py setup --wait          # setup_elasticsearch.py
+    python sensorctl.py ingest --csv temperaturesensor_data.csv --index temperaturesensor
+    python sensorctl.py generate              # sample_data_generator.py
+    python sensorctl.py kibana --wait         # kibana_setup.py
+    python sensorctl.py export --index temperaturesensor-ds --output temperature.csv.gz
+    python sensorctl.py migrate --source temperaturesensor-ds --dest temperaturesensor-v2-ds
+    python sensorctl.py wait                  # readiness.py
+    python sensorctl.py check                 # check_dependencies.py
+
+Only the script behind the chosen command is imported, and the scripts
+import pandas and the Elasticsearch client lazily, so `--help` and `check`
+start almost as fast as the interpreter. Arguments after the command are
+passed to the script unchanged.
+"""
+
+import argparse
+import importlib
+import os
+import sys
+
+# command: (module, description)
+COMMANDS = {
+    'setup': ('setup_elasticsearch', 'Create ingest pipelines, index templates and data streams'),
+    'ingest': ('ingest_bulk_to_elasticsearch', 'Ingest CSV data into Elasticsearch'),
+    'generate': ('sample_data_generator', 'Generate sample sensor data'),
+    'kibana': ('kibana_setup', 'Import index patterns and dashboards into Kibana'),
+    'export': ('export_sensor_data', 'Export sensor data to CSV, NDJSON or Parquet'),
+    'migrate': ('migrate_data_stream', 'Copy a data stream into a new one and move its alias'),
+    'wait': ('readiness', 'Wait for Elasticsearch and Kibana to be ready'),
+    'check': ('check_dependencies', 'Check that the required packages are installed'),
+}
+
+
+def parse_command(argv):
+    """Split argv into the command and the arguments for its script"""
+    parser = argparse.ArgumentParser(
+        prog=os.path.basename(sys.argv[0]),
+        description='Sensor dashboard setup and ingestion tools',
+        epilog='commands:\n' + ''.join(f"  {name:<10}{description}\n" for name, (_, description) in COMMANDS.items())
+               + '\nRun "%(prog)s <command> --help" for the options of a command.',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument('command', choices=COMMANDS, metavar='command', help='one of the commands below')
+    # Only the command is parsed here; everything after it belongs to the script
+    args = parser.parse_args(argv[:1] if argv and not argv[0].startswith('-') else argv)
+    return args.command, argv[1:]
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    command, script_args = parse_command(argv)
+    module = importlib.import_module(COMMANDS[command][0])
+    # The scripts parse sys.argv; make their usage read "sensorctl.py <command>"
+    sys.argv = [f"{os.path.basename(sys.argv[0])} {command}"] + script_args
+    return module.main()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
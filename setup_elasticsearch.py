@@ -5,23 +5,36 @@ Elasticsearch Setup Script
 This script sets up the Elasticsearch environment for telemetry data including:
 - Ingest pipelines
 - Index templates
-- Data streams
+- Data streams, and an alias for each that readers and writers use
+
+One of each is created for every sensor type in the sensor registry (plus
+an ILM policy for types that declare one). Existing definitions are compared
+with the desired ones and only missing or changed resources are pushed, with
+independent resources provisioned in parallel.
 """
 
 import argparse
-import json
 import logging
 import os
 import sys
 import time
-import ssl
-from urllib.parse import urlparse
 
-import requests
-from elasticsearch import Elasticsearch
-from elasticsearch.exceptions import ApiError, ConnectionError as ESConnectionError
 from dotenv import load_dotenv
 
+from client_factory import create_client
+from provisioning import (
+    DEFAULT_WORKERS,
+    data_stream_alias_resource,
+    data_stream_resource,
+    ilm_policy_resource,
+    index_template_resource,
+    log_results,
+    pipeline_resource,
+    provision,
+)
+from readiness import add_wait_arguments, wait_for_elasticsearch
+from sensor_registry import sensor_types
+
 # Load environment variables from .env file
 load_dotenv()
 
@@ -32,87 +45,6 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Define constants for ingest pipelines and templates
-TEMPERATURE_PIPELINE = {
-    "description": "Flatten and enrich temperature telemetry",
-    "processors": [
-        {"set": {"field": "ingested_at", "value": "{{_ingest.timestamp}}"}},
-        {"rename": {"field": "temperaturesensor.telemetry_temperature_value", "target_field": "temperature_value"}},
-        {"rename": {"field": "temperaturesensor.telemetry_temperature_unit", "target_field": "temperature_unit"}},
-        {"remove": {"field": "temperaturesensor"}}
-    ]
-}
-
-AIR_QUALITY_PIPELINE = {
-    "description": "Flatten and enrich air quality telemetry",
-    "processors": [
-        {"set": {"field": "ingested_at", "value": "{{_ingest.timestamp}}"}},
-        {"rename": {"field": "airqualitysensor.telemetry_co_value", "target_field": "co"}},
-        {"rename": {"field": "airqualitysensor.telemetry_no2_value", "target_field": "no2"}},
-        {"rename": {"field": "airqualitysensor.telemetry_o3_value", "target_field": "o3"}},
-        {"rename": {"field": "airqualitysensor.telemetry_pm10_value", "target_field": "pm10"}},
-        {"rename": {"field": "airqualitysensor.telemetry_pm25_value", "target_field": "pm25"}},
-        {"rename": {"field": "airqualitysensor.telemetry_so2_value", "target_field": "so2"}},
-        {"remove": {"field": "airqualitysensor"}}
-    ]
-}
-
-TEMPERATURE_TEMPLATE = {
-    "index_patterns": ["temperaturesensor-*"],
-    "data_stream": {},
-    "template": {
-        "settings": {
-            "index.default_pipeline": "temperaturesensor_pipeline"
-        },
-        "mappings": {
-            "properties": {
-                "@timestamp": {"type": "date"},
-                "temperature_value": {"type": "float"},
-                "temperature_unit": {"type": "keyword"},
-                "ingested_at": {"type": "date"},
-                "measurement_name": {"type": "keyword"},
-                "tag": {
-                    "properties": {
-                        "host": {"type": "keyword"},
-                        "sensor_type": {"type": "keyword"}
-                    }
-                },
-                "uuid": {"type": "keyword"}
-            }
-        }
-    }
-}
-
-AIR_QUALITY_TEMPLATE = {
-    "index_patterns": ["airqualitysensor-*"],
-    "data_stream": {},
-    "template": {
-        "settings": {
-            "index.default_pipeline": "airqualitysensor_pipeline"
-        },
-        "mappings": {
-            "properties": {
-                "@timestamp": {"type": "date"},
-                "co": {"type": "float"},
-                "no2": {"type": "float"},
-                "o3": {"type": "float"},
-                "pm10": {"type": "float"},
-                "pm25": {"type": "float"},
-                "so2": {"type": "float"},
-                "ingested_at": {"type": "date"},
-                "measurement_name": {"type": "keyword"},
-                "tag": {
-                    "properties": {
-                        "host": {"type": "keyword"},
-                        "sensor_type": {"type": "keyword"}
-                    }
-                },
-                "uuid": {"type": "keyword"}
-            }
-        }
-    }
-}
-
 def parse_arguments():
     """Parse command line arguments"""
     parser = argparse.ArgumentParser(description='Setup Elasticsearch for sensor telemetry')
@@ -124,11 +56,15 @@ def parse_arguments():
                       help='Elasticsearch password')
     parser.add_argument('--wait', action='store_true', 
                       help='Wait for Elasticsearch to be available')
+    add_wait_arguments(parser)
     parser.add_argument('--force', action='store_true',
-                      help='Force recreate existing components')
+                      help='Push pipelines, policies and templates even when unchanged '
+                           '(existing data streams are never recreated)')
     parser.add_argument('--components', default='all',
-                      choices=['all', 'pipelines', 'templates', 'datastreams'],
+                      choices=['all', 'pipelines', 'policies', 'templates', 'datastreams'],
                       help='Components to setup')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                      help='Resources provisioned in parallel')
     args = parser.parse_args()
     
     # Set environment variables for the credentials
@@ -139,105 +75,10 @@ def parse_arguments():
         
     return args
 
-def wait_for_elasticsearch(host, max_retries=12, delay=5):
-    """Wait for Elasticsearch to become available, with Elasticsearch 8.x compatibility"""
-    logger.info(f"Waiting for Elasticsearch at {host} to be available...")
-    
-    # Get authentication details from environment
-    username = os.environ.get('ES_USERNAME', 'elastic')
-    password = os.environ.get('ES_PASSWORD', '')
-    api_key = os.environ.get('ES_API_KEY', '')
-    
-    # Setup headers and auth for requests
-    headers = {}
-    auth = None
-    
-    if api_key:
-        headers['Authorization'] = f'ApiKey {api_key}'
-    elif password:
-        auth = (username, password)
-    
-    # Determine if we need to verify SSL
-    verify = True
-    if os.environ.get('ES_VERIFY_CERTS', 'true').lower() == 'false':
-        verify = False
-        # Suppress SSL warning messages if verification is disabled
-        import urllib3
-        urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
-    
-    for i in range(max_retries):
-        try:
-            response = requests.get(
-                f"{host}/_cluster/health", 
-                headers=headers, 
-                auth=auth, 
-                verify=verify,
-                timeout=10
-            )
-            
-            if response.status_code == 200:
-                health = response.json()
-                status = health.get('status')
-                logger.info(f"Elasticsearch cluster status: {status}")
-                if status in ['yellow', 'green']:
-                    logger.info("Elasticsearch is available!")
-                    return True
-                else:
-                    logger.warning(f"Elasticsearch status is {status}, waiting...")
-            elif response.status_code == 401:
-                logger.error("Authentication failed. Check ES_USERNAME and ES_PASSWORD environment variables.")
-                return False
-            else:
-                logger.warning(f"Unexpected status code: {response.status_code}, response: {response.text}")
-                
-        except requests.exceptions.RequestException as e:
-            logger.warning(f"Elasticsearch not yet available, retry {i+1}/{max_retries}: {str(e)}")
-        
-        time.sleep(delay)
-    
-    logger.error("Timed out waiting for Elasticsearch")
-    return False
-
 def connect_to_elasticsearch(host):
     """Connect to Elasticsearch cluster with 8.x compatibility"""
     try:
-        # Get credentials from environment variables
-        username = os.environ.get('ES_USERNAME', 'elastic')
-        password = os.environ.get('ES_PASSWORD', '')
-        api_key = os.environ.get('ES_API_KEY', '')
-        
-        # Parse URL to determine if SSL is needed
-        parsed_url = urlparse(host)
-        use_ssl = parsed_url.scheme == 'https'
-        
-        # Setup SSL context if using HTTPS
-        ssl_context = None
-        if use_ssl:
-            ssl_context = ssl.create_default_context()
-            # If using self-signed certs, you can disable verification
-            if os.environ.get('ES_VERIFY_CERTS', 'true').lower() == 'false':
-                ssl_context.check_hostname = False
-                ssl_context.verify_mode = ssl.CERT_NONE
-        
-        # Configure connection options for Elasticsearch 8.x
-        conn_params = {
-            'hosts': [host],
-            'request_timeout': 30,
-            'retry_on_timeout': True
-        }
-        
-        # Add authentication
-        if api_key:
-            conn_params['api_key'] = api_key
-        elif password:
-            conn_params['basic_auth'] = (username, password)
-        
-        # Add SSL if needed
-        if ssl_context:
-            conn_params['ssl_context'] = ssl_context
-            
-        # Create the Elasticsearch client with appropriate parameters
-        es = Elasticsearch(**conn_params)
+        es = create_client(host, request_timeout=30)
         
         # Test the connection
         if not es.ping():
@@ -254,114 +95,51 @@ def connect_to_elasticsearch(host):
         logger.error(f"Error connecting to Elasticsearch: {str(e)}")
         return None
 
-def setup_pipelines(es, force=False):
-    """Setup ingest pipelines for temperature and air quality sensors"""
-    success = True
-    
-    # Setup temperature sensor pipeline
-    try:
-        pipeline_id = "temperaturesensor_pipeline"
-        if force:
-            logger.info(f"Forcing recreation of pipeline: {pipeline_id}")
-            es.ingest.delete_pipeline(id=pipeline_id, ignore=[404])
-        
-        es.ingest.put_pipeline(id=pipeline_id, body=TEMPERATURE_PIPELINE)
-        logger.info(f"Successfully created pipeline: {pipeline_id}")
-    except Exception as e:
-        logger.error(f"Error creating temperature pipeline: {str(e)}")
-        success = False
-    
-    # Setup air quality sensor pipeline
-    try:
-        pipeline_id = "airqualitysensor_pipeline"
-        if force:
-            logger.info(f"Forcing recreation of pipeline: {pipeline_id}")
-            es.ingest.delete_pipeline(id=pipeline_id, ignore=[404])
-        
-        es.ingest.put_pipeline(id=pipeline_id, body=AIR_QUALITY_PIPELINE)
-        logger.info(f"Successfully created pipeline: {pipeline_id}")
-    except Exception as e:
-        logger.error(f"Error creating air quality pipeline: {str(e)}")
-        success = False
-    
-    return success
-
-def setup_templates(es, force=False):
-    """Setup index templates for temperature and air quality sensors"""
-    success = True
-    
-    # Setup temperature sensor template
-    try:
-        template_name = "temperaturesensor_template"
-        if force:
-            logger.info(f"Forcing recreation of template: {template_name}")
-            es.indices.delete_index_template(name=template_name, ignore=[404])
-        
-        es.indices.put_index_template(name=template_name, body=TEMPERATURE_TEMPLATE)
-        logger.info(f"Successfully created template: {template_name}")
-    except Exception as e:
-        logger.error(f"Error creating temperature template: {str(e)}")
-        success = False
-    
-    # Setup air quality sensor template
-    try:
-        template_name = "airqualitysensor_template"
-        if force:
-            logger.info(f"Forcing recreation of template: {template_name}")
-            es.indices.delete_index_template(name=template_name, ignore=[404])
-        
-        es.indices.put_index_template(name=template_name, body=AIR_QUALITY_TEMPLATE)
-        logger.info(f"Successfully created template: {template_name}")
-    except Exception as e:
-        logger.error(f"Error creating air quality template: {str(e)}")
-        success = False
-    
-    return success
-
-def setup_data_streams(es, force=False):
-    """Setup data streams for temperature and air quality sensors"""
-    success = True
-    
-    # Setup temperature sensor data stream
-    try:
-        stream_name = "temperaturesensor-ds"
-        if force:
-            logger.info(f"Forcing recreation of data stream: {stream_name}")
-            es.indices.delete_data_stream(name=stream_name, ignore=[404])
-        
-        es.indices.create_data_stream(name=stream_name)
-        logger.info(f"Successfully created data stream: {stream_name}")
-    except Exception as e:
-        if "resource_already_exists_exception" in str(e):
-            logger.info(f"Data stream already exists: {stream_name}")
-        else:
-            logger.error(f"Error creating temperature data stream: {str(e)}")
-            success = False
-    
-    # Setup air quality sensor data stream
-    try:
-        stream_name = "airqualitysensor-ds"
-        if force:
-            logger.info(f"Forcing recreation of data stream: {stream_name}")
-            es.indices.delete_data_stream(name=stream_name, ignore=[404])
-        
-        es.indices.create_data_stream(name=stream_name)
-        logger.info(f"Successfully created data stream: {stream_name}")
-    except Exception as e:
-        if "resource_already_exists_exception" in str(e):
-            logger.info(f"Data stream already exists: {stream_name}")
-        else:
-            logger.error(f"Error creating air quality data stream: {str(e)}")
-            success = False
-    
-    return success
+def pipeline_resources(es):
+    """An ingest pipeline for every sensor type"""
+    return [pipeline_resource(es, sensor.pipeline_id, sensor.pipeline()) for sensor in sensor_types()]
+
+def policy_resources(es):
+    """An ILM policy for every sensor type that declares one"""
+    return [ilm_policy_resource(es, sensor.policy_name, sensor.ilm_policy)
+            for sensor in sensor_types() if sensor.ilm_policy]
+
+def template_resources(es):
+    """An index template (and one for pre-aggregated summaries) for every
+    sensor type, pushed after the pipeline and policy they name"""
+    resources = []
+    for sensor in sensor_types():
+        depends_on = [f"pipeline/{sensor.pipeline_id}", f"ilm_policy/{sensor.policy_name}"]
+        resources.append(index_template_resource(es, sensor.template_name, sensor.template(),
+                                                 depends_on=depends_on))
+        # The summary data stream is created by the first summary written
+        resources.append(index_template_resource(es, sensor.summary_template_name, sensor.summary_template(),
+                                                 depends_on=depends_on))
+    return resources
+
+def data_stream_resources(es):
+    """A data stream for every sensor type, created after its index template,
+    and the alias readers and writers use for it"""
+    resources = []
+    for sensor in sensor_types():
+        resources.append(data_stream_resource(es, sensor.stream, depends_on=[f"template/{sensor.template_name}"]))
+        resources.append(data_stream_alias_resource(es, sensor.alias, sensor.stream,
+                                                    depends_on=[f"data_stream/{sensor.stream}"]))
+    return resources
+
+COMPONENTS = {
+    'pipelines': pipeline_resources,
+    'policies': policy_resources,
+    'templates': template_resources,
+    'datastreams': data_stream_resources,
+}
 
 def main():
     """Main function to run the setup process"""
     args = parse_arguments()
     
     # Wait for Elasticsearch if requested
-    if args.wait and not wait_for_elasticsearch(args.host):
+    if (args.wait or args.retry) and not wait_for_elasticsearch(args.host, args.wait_timeout, args.retry):
         sys.exit(1)
     
     # Connect to Elasticsearch
@@ -369,20 +147,15 @@ def main():
     if not es:
         sys.exit(1)
     
-    # Setup components based on user selection
-    success = True
-    
-    if args.components in ['all', 'pipelines']:
-        logger.info("Setting up ingest pipelines...")
-        success = setup_pipelines(es, args.force) and success
-    
-    if args.components in ['all', 'templates']:
-        logger.info("Setting up index templates...")
-        success = setup_templates(es, args.force) and success
+    # Diff against the cluster and push only what changed, in parallel
+    resources = []
+    for component, build in COMPONENTS.items():
+        if args.components in ['all', component]:
+            resources += build(es)
     
-    if args.components in ['all', 'datastreams']:
-        logger.info("Setting up data streams...")
-        success = setup_data_streams(es, args.force) and success
+    started = time.perf_counter()
+    results = provision(resources, force=args.force, workers=args.workers)
+    success = log_results(results, time.perf_counter() - started)
     
     if success:
         logger.info("Elasticsearch setup completed successfully")
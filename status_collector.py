@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Status Collector
+
+Builds the /status response for any list of sensor data streams with three
+Elasticsearch calls that run concurrently, whatever the number of streams:
+
+- ping, to tell an unreachable cluster from a failing request
+- one data stream lookup covering every stream
+- one msearch with a size-0 search per stream for the document counts
+
+Sync callers (the Flask app) run the calls on a small shared thread pool,
+async callers (the ASGI app) gather them on the event loop. The response
+keeps the historical keys: "<stream>" with dashes replaced by underscores
+("temperaturesensor_ds") and "<sensor>_count" ("temperaturesensor_count"),
+the count being present only for streams that exist.
+
+A sensor type's own data stream is counted through the sensor type's alias
+and reported available while any of its data streams exists, so the status
+follows the data to a migrated stream (migrate_data_stream.py).
+"""
+
+import asyncio
+import fnmatch
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from sensor_registry import sensor_types
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def configured_streams(default=None):
+    """Streams listed in STATUS_STREAMS (comma-separated), else the default.
+
+    Without a default, every registered sensor type's data stream is reported.
+    """
+    value = os.environ.get('STATUS_STREAMS', '')
+    streams = [name.strip() for name in value.split(',') if name.strip()]
+    return streams or list(default or [sensor.stream for sensor in sensor_types()])
+
+
+def status_keys(stream):
+    """Response keys for a stream: (availability key, count key)"""
+    key = stream.replace('-', '_')
+    sensor = key[:-len('_ds')] if key.endswith('_ds') else key
+    return key, f"{sensor}_count"
+
+
+def status_targets(stream):
+    """(name pattern of the data streams that make stream available, index
+    to count); a sensor type's stream is read through its alias"""
+    for sensor in sensor_types():
+        if stream == sensor.stream:
+            return sensor.index_pattern, sensor.alias
+    return stream, stream
+
+
+def unknown_streams(streams):
+    return {status_keys(stream)[0]: "unknown" for stream in streams}
+
+
+def data_stream_request(streams):
+    # A trailing wildcard makes missing streams match nothing instead of
+    # failing the whole lookup with a 404; names are filtered exactly below
+    return {'name': ','.join(f"{status_targets(stream)[0].rstrip('*')}*" for stream in streams)}
+
+
+def count_searches(streams):
+    searches = []
+    for stream in streams:
+        searches.append({'index': status_targets(stream)[1], 'ignore_unavailable': True})
+        searches.append({'size': 0, 'track_total_hits': True})
+    return searches
+
+
+def build_status(streams, data_streams, counts):
+    """Combine the data stream lookup and msearch responses"""
+    names = [stream['name'] for stream in data_streams.get('data_streams', [])]
+    existing = {stream for stream in streams if fnmatch.filter(names, status_targets(stream)[0])}
+    status_data = {"elasticsearch": "connected"}
+    for stream in streams:
+        key, _ = status_keys(stream)
+        status_data[key] = "available" if stream in existing else "not found"
+
+    for stream, response in zip(streams, counts.get('responses', [])):
+        if stream not in existing:
+            continue
+        if 'error' in response:
+            raise RuntimeError(f"count of {stream} failed: {response['error']}")
+        status_data[status_keys(stream)[1]] = response['hits']['total']['value']
+    return status_data
+
+
+def finish_status(streams, ping, data_streams, counts):
+    """Turn the three call results (or the exceptions they raised) into a response"""
+    if isinstance(ping, Exception):
+        logger.error(f"Error connecting to Elasticsearch: {str(ping)}")
+        return {"elasticsearch": "error", "error": str(ping), **unknown_streams(streams)}
+    if not ping:
+        return {
+            "elasticsearch": "disconnected",
+            "message": "Elasticsearch is running but ping failed",
+            **unknown_streams(streams)
+        }
+    try:
+        for result in (data_streams, counts):
+            if isinstance(result, Exception):
+                raise result
+        return build_status(streams, data_streams, counts)
+    except Exception as e:
+        logger.error(f"Error checking data streams: {str(e)}")
+        return {"elasticsearch": "error", "error": str(e), **unknown_streams(streams)}
+
+
+def _executor_instance():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix='status')
+        return _executor
+
+
+def _outcome(function, *args, **kwargs):
+    try:
+        return function(*args, **kwargs)
+    except Exception as e:
+        return e
+
+
+def collect_status(es, streams=None):
+    """Collect the status with a sync client"""
+    streams = list(streams or configured_streams())
+    if es is None:
+        return {
+            "elasticsearch": "disconnected",
+            "message": "Elasticsearch client not initialized",
+            **unknown_streams(streams)
+        }
+    executor = _executor_instance()
+    ping = executor.submit(_outcome, es.ping)
+    data_streams = executor.submit(_outcome, es.indices.get_data_stream, **data_stream_request(streams))
+    # The third call runs on the request thread
+    counts = _outcome(es.msearch, searches=count_searches(streams))
+    return finish_status(streams, ping.result(), data_streams.result(), counts)
+
+
+async def collect_status_async(es, streams=None):
+    """Collect the status with an AsyncElasticsearch client"""
+    streams = list(streams or configured_streams())
+    ping, data_streams, counts = await asyncio.gather(
+        es.ping(),
+        es.indices.get_data_stream(**data_stream_request(streams)),
+        es.msearch(searches=count_searches(streams)),
+        return_exceptions=True
+    )
+    return finish_status(streams, ping, data_streams, counts)
@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+"""
+CSV Tail Follower
+
+Follows growing CSV files and hands new rows to a callback in small batches.
+
+- Wakes up on inotify events when the optional 'inotify_simple' package is
+  available (Linux), and falls back to polling otherwise
+- Detects rotation (file replaced or truncated), drains the old file to its
+  end and continues with the new one from its header once the old rows are
+  flushed
+- Batches rows per file until batch_size rows are pending or the oldest
+  pending row has waited `linger` seconds
+- Persists byte offsets (and the header) after every successful flush so a
+  restart resumes where the last flush ended
+"""
+
+import csv
+import json
+import logging
+import os
+import signal
+import time
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LINGER = 0.5
+DEFAULT_POLL_INTERVAL = 0.25
+DEFAULT_RESCAN_INTERVAL = 10.0
+
+# Upper bound on bytes read from one file per pass, which bounds memory when
+# catching up on a large backlog
+READ_CHUNK_SIZE = 1024 * 1024
+
+START_BEGINNING = 'beginning'
+START_END = 'end'
+START_CHOICES = [START_BEGINNING, START_END]
+
+
+class OffsetStore:
+    """JSON file holding the committed offset and header of every followed file"""
+
+    def __init__(self, path):
+        self.path = path
+        self.offsets = {}
+        if os.path.exists(path):
+            try:
+                with open(path, 'r') as f:
+                    self.offsets = json.load(f)
+                logger.info(f"Loaded offsets for {len(self.offsets)} files from {path}")
+            except ValueError:
+                logger.warning(f"Ignoring unreadable offsets file {path}")
+
+    def get(self, path):
+        return self.offsets.get(os.path.abspath(path))
+
+    def commit(self, path, inode, offset, header):
+        """Record a committed position and write the store atomically"""
+        self.offsets[os.path.abspath(path)] = {'inode': inode, 'offset': offset, 'header': header}
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.offsets, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+
+class FollowedFile:
+    """A single CSV file being tailed"""
+
+    def __init__(self, path, offsets, start_at=START_BEGINNING):
+        self.path = path
+        self.handle = None
+        self.inode = None
+        self.offset = 0            # bytes consumed into complete lines
+        self.header = None
+        self.pending = []          # parsed rows not flushed yet
+        self.pending_since = None  # monotonic time the oldest pending row was read
+        self.has_more = False      # last read stopped at READ_CHUNK_SIZE
+        self._partial = b''
+        self._open(offsets.get(path), start_at)
+
+    def _open(self, saved=None, start_at=START_BEGINNING):
+        try:
+            self.handle = open(self.path, 'rb')
+        except FileNotFoundError:
+            self.handle = None
+            return
+        self.inode = os.fstat(self.handle.fileno()).st_ino
+        self.offset = 0
+        self.header = None
+        self._partial = b''
+
+        size = os.fstat(self.handle.fileno()).st_size
+        if saved and saved.get('inode') == self.inode and saved.get('offset', 0) <= size:
+            self.offset = saved['offset']
+            self.header = saved.get('header')
+            self.handle.seek(self.offset)
+            logger.info(f"Resuming {self.path} at byte {self.offset}")
+        elif start_at == START_END:
+            self.header = self._read_header()
+            self.offset = size
+            self.handle.seek(size)
+            logger.info(f"Following {self.path} from the end")
+        else:
+            logger.info(f"Following {self.path} from the beginning")
+
+    def _read_header(self):
+        self.handle.seek(0)
+        line = self.handle.readline()
+        if not line.endswith(b'\n'):
+            return None
+        return next(csv.reader([line.decode('utf-8').rstrip('\r\n')]))
+
+    def read_rows(self):
+        """Read complete new lines and append them to pending as parsed rows"""
+        if self.handle is None:
+            return 0
+
+        data = self.handle.read(READ_CHUNK_SIZE)
+        self.has_more = len(data) == READ_CHUNK_SIZE
+        if not data:
+            return 0
+
+        data = self._partial + data
+        end = data.rfind(b'\n')
+        if end < 0:
+            self._partial = data
+            return 0
+        complete, self._partial = data[:end + 1], data[end + 1:]
+
+        lines = complete.decode('utf-8').splitlines()
+        self.offset += len(complete)
+        if self.header is None and lines:
+            self.header = next(csv.reader([lines[0]]))
+            lines = lines[1:]
+
+        rows = [row for row in csv.reader(lines) if row]
+        if rows:
+            if self.pending_since is None:
+                self.pending_since = time.monotonic()
+            self.pending.extend(rows)
+        return len(rows)
+
+    def rotated(self):
+        """Return True if the path now refers to a different or truncated file"""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return False
+        if self.handle is None:
+            return True
+        if stat.st_ino != self.inode:
+            return True
+        return stat.st_size < self.offset
+
+    def reopen(self):
+        """Switch to the file currently at the path, starting from its header"""
+        if self.handle:
+            self.handle.close()
+        logger.info(f"Detected rotation of {self.path}, reopening")
+        self._open()
+
+    def take_pending(self):
+        rows, self.pending, self.pending_since = self.pending, [], None
+        return rows
+
+    def close(self):
+        if self.handle:
+            self.handle.close()
+            self.handle = None
+
+
+class ChangeWatcher:
+    """Blocks until a followed directory changes or a timeout expires"""
+
+    def __init__(self, paths):
+        self._inotify = None
+        try:
+            from inotify_simple import INotify, flags
+        except ImportError:
+            logger.info("inotify_simple not available, polling for changes")
+            return
+
+        self._inotify = INotify()
+        mask = flags.MODIFY | flags.CREATE | flags.MOVED_TO | flags.CLOSE_WRITE | flags.DELETE
+        for directory in {os.path.dirname(os.path.abspath(path)) for path in paths}:
+            self._inotify.add_watch(directory, mask)
+        logger.info("Using inotify to watch for changes")
+
+    def wait(self, timeout):
+        if self._inotify is not None:
+            self._inotify.read(timeout=int(timeout * 1000))
+        else:
+            time.sleep(timeout)
+
+    def close(self):
+        if self._inotify is not None:
+            self._inotify.close()
+
+
+def follow(paths, handle_batch, offsets_file, batch_size=1000, linger=DEFAULT_LINGER,
+           poll_interval=DEFAULT_POLL_INTERVAL, start_at=START_BEGINNING,
+           discover=None, rescan_interval=DEFAULT_RESCAN_INTERVAL):
+    """Tail CSV files until SIGINT/SIGTERM.
+
+    handle_batch(path, header, rows) must return True once the rows are
+    safely stored; offsets only advance after that, so delivery is
+    at-least-once. Exceptions raised by handle_batch stop the follower.
+    discover(), when given, is called every rescan_interval seconds and may
+    return new paths to follow.
+    """
+    offsets = OffsetStore(offsets_file)
+    files = {path: FollowedFile(path, offsets, start_at) for path in paths}
+    watcher = ChangeWatcher(paths)
+    stopping = []
+
+    def request_stop(signum, frame):
+        logger.info("Stopping follower, flushing pending rows...")
+        stopping.append(signum)
+
+    previous_handlers = {sig: signal.signal(sig, request_stop) for sig in (signal.SIGINT, signal.SIGTERM)}
+
+    def flush(followed):
+        if not followed.pending:
+            return True
+        waited = time.monotonic() - followed.pending_since
+        rows = followed.take_pending()
+        if not followed.header:
+            logger.error(f"No header known for {followed.path}, dropping {len(rows)} rows")
+            return False
+        if handle_batch(followed.path, followed.header, rows):
+            offsets.commit(followed.path, followed.inode, followed.offset, followed.header)
+            logger.info(f"Flushed {len(rows)} rows from {followed.path} "
+                        f"(oldest row waited {waited * 1000:.0f}ms)")
+            return True
+        # Keep the rows and retry on a later pass
+        followed.pending = rows + followed.pending
+        followed.pending_since = time.monotonic()
+        return False
+
+    def drain(followed):
+        """Read and flush the rest of a rotated file; False if a flush failed,
+        in which case the old file is kept and drained again on a later pass"""
+        while followed.read_rows() or followed.has_more:
+            if len(followed.pending) >= batch_size and not flush(followed):
+                return False
+        return flush(followed)
+
+    last_rescan = time.monotonic()
+    try:
+        while not stopping:
+            now = time.monotonic()
+            for followed in list(files.values()):
+                followed.read_rows()
+                if followed.rotated() and drain(followed):
+                    followed.reopen()
+                    followed.read_rows()
+
+                if len(followed.pending) >= batch_size or (
+                        followed.pending and now - followed.pending_since >= linger):
+                    flush(followed)
+
+            if discover and now - last_rescan >= rescan_interval:
+                last_rescan = now
+                for path in discover():
+                    if path not in files:
+                        files[path] = FollowedFile(path, offsets, start_at)
+
+            # Sleep no longer than the earliest pending linger deadline, and
+            # not at all while a file still has unread backlog
+            timeout = poll_interval
+            for followed in files.values():
+                if followed.has_more:
+                    timeout = 0.0
+                if followed.pending:
+                    timeout = min(timeout, max(0.0, linger - (time.monotonic() - followed.pending_since)))
+            if timeout > 0:
+                watcher.wait(timeout)
+
+        for followed in files.values():
+            followed.read_rows()
+            flush(followed)
+    finally:
+        for followed in files.values():
+            followed.close()
+        watcher.close()
+        for sig, handler in previous_handlers.items():
+            signal.signal(sig, handler)
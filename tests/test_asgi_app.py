@@ -0,0 +1,48 @@
+import asyncio
+
+import asgi_app
+from metrics import REGISTRY
+
+
+def request(path, method='GET'):
+    """Send one request straight through the ASGI app and return its status"""
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+        'method': method, 'scheme': 'http', 'path': path, 'raw_path': path.encode(),
+        'root_path': '', 'query_string': b'', 'headers': [],
+        'server': ('testserver', 80), 'client': ('testclient', 50000),
+    }
+    asyncio.run(asgi_app.app(scope, receive, send))
+    return next(message['status'] for message in messages if message['type'] == 'http.response.start')
+
+
+def recorded(endpoint, method, status):
+    label = f'endpoint="{endpoint}",method="{method}",status="{status}"'
+    return any(label in line for line in REGISTRY.render().splitlines()
+               if line.startswith('http_request_duration_seconds_count'))
+
+
+def test_requests_are_labelled_by_route_rule():
+    assert request('/healthz') == 200
+    assert recorded('/healthz', 'GET', 200)
+
+
+def test_path_parameters_are_not_labels():
+    assert request('/api/ingest/temperaturesensor') == 405
+    assert recorded('/api/ingest/{sensor}', 'GET', 405)
+    assert not recorded('/api/ingest/temperaturesensor', 'GET', 405)
+
+
+def test_mounted_and_unknown_paths():
+    assert request('/static/no-such-file.css') == 404
+    assert recorded('/static', 'GET', 404)
+    assert request('/no/such/page') == 404
+    assert recorded('unmatched', 'GET', 404)
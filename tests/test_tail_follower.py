@@ -0,0 +1,78 @@
+import os
+import signal
+import threading
+
+from tail_follower import READ_CHUNK_SIZE, follow
+
+ROW = "2024-01-01T00:00:00Z,sensor1,21.5\n"
+HEADER = "timestamp,host,temperature_value\n"
+
+
+def write_csv(path, rows):
+    with open(path, 'w') as f:
+        f.write(HEADER)
+        f.write(ROW * rows)
+
+
+def stop_follower():
+    os.kill(os.getpid(), signal.SIGINT)
+
+
+def test_rotation_drains_old_file_past_one_read_chunk(tmp_path):
+    path = str(tmp_path / 'readings.csv')
+    old_rows = 4 * READ_CHUNK_SIZE // len(ROW)  # several chunks still unread at rotation
+    new_rows = 3
+    write_csv(path, old_rows)
+    received = []
+
+    def handle_batch(batch_path, header, rows):
+        if not received:
+            # The follower has read one chunk; rotate while the rest is unread
+            os.rename(path, path + '.1')
+            write_csv(path, new_rows)
+        received.extend(rows)
+        if len(received) >= old_rows + new_rows:
+            stop_follower()
+        return True
+
+    safety = threading.Timer(20, stop_follower)
+    safety.start()
+    try:
+        follow([path], handle_batch, str(tmp_path / 'offsets.json'), batch_size=10 ** 6, linger=0)
+    finally:
+        safety.cancel()
+    assert len(received) == old_rows + new_rows
+
+
+def test_rotation_keeps_old_file_until_its_rows_are_flushed(tmp_path):
+    path = str(tmp_path / 'readings.csv')
+    write_csv(path, 10)
+    batches = []
+
+    def handle_batch(batch_path, header, rows):
+        batches.append((header, rows))
+        if len(batches) == 1:
+            # The writer appends a last few rows, then the file is rotated
+            with open(path, 'a') as f:
+                f.write(ROW * 5)
+            os.rename(path, path + '.1')
+            with open(path, 'w') as f:
+                f.write("ts,site\n")
+                f.write("2024-01-02T00:00:00Z,north\n")
+            return True
+        if len(batches) == 2:
+            return False
+        if header == ["ts", "site"]:
+            stop_follower()
+        return True
+
+    safety = threading.Timer(20, stop_follower)
+    safety.start()
+    try:
+        follow([path], handle_batch, str(tmp_path / 'offsets.json'), linger=0, poll_interval=0.01)
+    finally:
+        safety.cancel()
+    # The failed rows are retried under the old file's header, not the new one
+    assert [len(rows) for _, rows in batches] == [10, 5, 5, 1]
+    assert [header for header, _ in batches[:3]] == [HEADER.strip().split(',')] * 3
+    assert batches[3][0] == ["ts", "site"]
@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""
+Timestamp Conversion
+
+Helpers for turning CSV timestamp columns into values Elasticsearch accepts
+for @timestamp. Columns that are already ISO 8601 or epoch based are passed
+through (or scaled to epoch_millis) instead of being parsed and re-formatted,
+and the remaining formatted columns are converted once per distinct value.
+
+Only values in the strict form Elasticsearch's date mapping accepts (T
+separator, a date that exists) are passed through unchanged; other ISO-like
+values are converted, and values that cannot be parsed become missing so the
+row is rejected by the document plan instead of by Elasticsearch.
+"""
+
+import logging
+import re
+import time
+from datetime import datetime, timezone
+
+from lazy_imports import lazy_import
+from metrics import TIMESTAMP_CACHE_HITS
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+
+logger = logging.getLogger(__name__)
+
+# Output format used for @timestamp when ISO strings are requested
+ISO_OUTPUT_FORMAT = '%Y-%m-%dT%H:%M:%S.%fZ'
+
+# Supported output representations
+OUTPUT_ISO = 'iso'
+OUTPUT_EPOCH_MILLIS = 'epoch_millis'
+OUTPUT_CHOICES = [OUTPUT_ISO, OUTPUT_EPOCH_MILLIS]
+
+# Detected input representations
+KIND_ISO = 'iso'
+KIND_EPOCH_SECONDS = 'epoch_seconds'
+KIND_EPOCH_MILLIS = 'epoch_millis'
+KIND_FORMATTED = 'formatted'
+
+# Column names tried when the requested timestamp field is not in the CSV
+TIMESTAMP_CANDIDATES = ['timestamp', '@timestamp']
+
+# ISO 8601-like values (space separator allowed); detects the column kind
+ISO_8601_PATTERN = re.compile(
+    r'^\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}(:\d{2}(\.\d+)?)?(Z|[+-]\d{2}:?\d{2})$'
+)
+# Values Elasticsearch's strict_date_optional_time accepts as they are
+STRICT_ISO_8601_PATTERN = re.compile(
+    r'^\d{4}-\d{2}-\d{2}T\d{2}:\d{2}(:\d{2}(\.\d+)?)?(Z|[+-]\d{2}:?\d{2})$'
+)
+EPOCH_PATTERN = re.compile(r'^\d{9,13}(\.\d+)?$')
+
+# Epoch values above this are treated as milliseconds (year 5138 in seconds)
+EPOCH_MILLIS_THRESHOLD = 1e11
+
+# Number of non-null values inspected when detecting the column kind
+DETECTION_SAMPLE_SIZE = 100
+
+
+def find_timestamp_column(columns, preferred='timestamp'):
+    """Return the best timestamp column in a CSV header, or None"""
+    columns = list(columns)
+    if preferred in columns:
+        return preferred
+
+    for candidate in TIMESTAMP_CANDIDATES:
+        if candidate in columns:
+            return candidate
+
+    # Dotted layouts carry epoch seconds in e.g. "temperaturesensor.timestamp"
+    for column in columns:
+        if column.endswith('.timestamp'):
+            return column
+
+    return None
+
+
+def detect_timestamp_kind(series):
+    """Detect how the values of a timestamp column are represented"""
+    sample = series.dropna().head(DETECTION_SAMPLE_SIZE)
+    if sample.empty:
+        return KIND_FORMATTED
+
+    if pd.api.types.is_numeric_dtype(sample):
+        if sample.abs().median() > EPOCH_MILLIS_THRESHOLD:
+            return KIND_EPOCH_MILLIS
+        return KIND_EPOCH_SECONDS
+
+    values = sample.astype(str).str.strip()
+    values = values[values != '']
+    if values.empty:
+        return KIND_FORMATTED
+    # Decided by most of the sample, so a few bad cells do not change the
+    # kind of the whole column (they are rejected when converted)
+    if values.str.match(ISO_8601_PATTERN).mean() > 0.5:
+        return KIND_ISO
+    epoch = values.str.match(EPOCH_PATTERN)
+    if epoch.mean() > 0.5:
+        numeric = pd.to_numeric(values[epoch])
+        if numeric.abs().median() > EPOCH_MILLIS_THRESHOLD:
+            return KIND_EPOCH_MILLIS
+        return KIND_EPOCH_SECONDS
+
+    return KIND_FORMATTED
+
+
+class TimestampConverter:
+    """Convert timestamp columns to Elasticsearch-ready @timestamp values.
+
+    Conversions that need parsing are done once per distinct raw value and
+    remembered in a bounded cache, so repeated timestamps (many sensors
+    reporting on the same tick) and repeated calls across batches are cheap.
+    Time spent in each phase is accumulated in ``phase_times``.
+    """
+
+    def __init__(self, output=OUTPUT_ISO, timestamp_format=None, cache_size=100000):
+        if output not in OUTPUT_CHOICES:
+            raise ValueError(f"Unsupported timestamp output: {output}")
+        self.output = output
+        self.timestamp_format = timestamp_format
+        self.cache_size = cache_size
+        self.phase_times = {}
+        self.rows = 0
+        self.cache_hits = 0
+        self.rejected = 0
+        self._cache = {}
+        self._kind = None
+
+    def _record(self, phase, started):
+        self.phase_times[phase] = self.phase_times.get(phase, 0.0) + (time.perf_counter() - started)
+
+    def convert(self, series, kind=None):
+        """Convert a timestamp column, detecting its representation if needed"""
+        started = time.perf_counter()
+        if kind is None:
+            # Detected per batch (a follower's file may change format);
+            # batches without values keep the previous kind
+            if self._kind is None or series.notna().any():
+                kind = detect_timestamp_kind(series)
+            else:
+                kind = self._kind
+        if self._kind is not None and kind != self._kind:
+            logger.info(f"Timestamp column changed from {self._kind} to {kind} values")
+        self._kind = kind
+        self._record('detect', started)
+        self.rows += len(series)
+
+        started = time.perf_counter()
+        if kind == KIND_ISO and self.output == OUTPUT_ISO:
+            result = self._passthrough(series)
+            phase = 'passthrough'
+        elif kind in (KIND_EPOCH_SECONDS, KIND_EPOCH_MILLIS) and self.output == OUTPUT_EPOCH_MILLIS:
+            numeric = pd.to_numeric(series, errors='coerce')
+            if kind == KIND_EPOCH_SECONDS:
+                numeric = numeric * 1000
+            # Nullable, so a blank cell only rejects its own row
+            result = numeric.round().astype('Int64')
+            phase = 'scale'
+        else:
+            result = self._convert_cached(series, kind)
+            phase = 'parse_and_format'
+        self._record(phase, started)
+
+        rejected = int((result.isna() & series.notna()).sum())
+        if rejected:
+            self.rejected += rejected
+            logger.warning(f"{rejected} timestamps could not be parsed as {kind}; their rows are skipped")
+        return result
+
+    def _passthrough(self, series):
+        """Keep values Elasticsearch accepts as they are and convert the rest"""
+        values = series.astype(str)
+        valid = (values.str.match(STRICT_ISO_8601_PATTERN)
+                 & pd.to_datetime(values, format='ISO8601', utc=True, errors='coerce').notna())
+        valid &= series.notna()
+        if valid.all():
+            return series
+        others = series[~valid & series.notna()]
+        converted = self._convert_cached(others, KIND_ISO) if len(others) else others
+        return series.astype(object).where(valid, converted.reindex(series.index)).astype(object)
+
+    def _convert_cached(self, series, kind):
+        """Convert only the distinct values that are not cached yet"""
+        codes, uniques = pd.factorize(series)
+
+        converted = np.empty(len(uniques), dtype=object)
+        missing = []
+        for position, value in enumerate(uniques):
+            cached = self._cache.get(value)
+            if cached is None:
+                missing.append(position)
+            else:
+                converted[position] = cached
+        self.cache_hits += len(uniques) - len(missing)
+        TIMESTAMP_CACHE_HITS.inc(len(uniques) - len(missing))
+
+        if missing:
+            raw = pd.Series(uniques[missing])
+            fresh = self._convert_values(raw, kind)
+            if len(self._cache) + len(fresh) > self.cache_size:
+                self._cache.clear()
+            self._cache.update(zip(raw.tolist(), fresh))
+            converted[missing] = fresh
+
+        values = converted[codes]
+        # factorize marks missing values with -1; keep them missing
+        values[codes == -1] = None
+        return pd.Series(values, index=series.index)
+
+    def _convert_values(self, values, kind):
+        """Vectorized parse + format of a set of distinct raw values"""
+        # Unparseable values become missing (None) rather than failing the batch
+        if kind == KIND_EPOCH_SECONDS:
+            parsed = pd.to_datetime(pd.to_numeric(values, errors='coerce'), unit='s')
+        elif kind == KIND_EPOCH_MILLIS:
+            parsed = pd.to_datetime(pd.to_numeric(values, errors='coerce'), unit='ms')
+        elif kind == KIND_ISO:
+            parsed = pd.to_datetime(values, format='ISO8601', utc=True, errors='coerce').dt.tz_localize(None)
+        else:
+            parsed = pd.to_datetime(values, format=self.timestamp_format, errors='coerce')
+
+        if self.output == OUTPUT_EPOCH_MILLIS:
+            millis = (parsed - pd.Timestamp(0)) // pd.Timedelta(milliseconds=1)
+            return [None if pd.isna(value) else int(value) for value in millis.tolist()]
+        return [None if pd.isna(value) else value for value in parsed.dt.strftime(ISO_OUTPUT_FORMAT).tolist()]
+
+    def log_report(self):
+        """Log the time spent per conversion phase"""
+        phases = ", ".join(
+            f"{phase}={seconds * 1000:.1f}ms" for phase, seconds in self.phase_times.items()
+        )
+        logger.info(
+            f"Timestamp conversion ({self._kind} -> {self.output}) for {self.rows} rows: {phases}"
+            f" (cache hits: {self.cache_hits})"
+            + (f", {self.rejected} rejected" if self.rejected else "")
+        )
+
+
+def current_timestamp(output=OUTPUT_ISO):
+    """Return the current time in the requested @timestamp representation"""
+    if output == OUTPUT_EPOCH_MILLIS:
+        return int(time.time() * 1000)
+    return datetime.now(timezone.utc).strftime(ISO_OUTPUT_FORMAT)
+
+
+def add_timestamp_column(df, converter, timestamp_field='timestamp'):
+    """Add the "timestamp" column used for @timestamp to a DataFrame.
+
+    Returns the source column that was converted, or None when the frame has
+    no timestamp column and the current time was used instead.
+    """
+    timestamp_column = find_timestamp_column(df.columns, timestamp_field)
+    if timestamp_column:
+        df["timestamp"] = converter.convert(df[timestamp_column])
+    else:
+        df["timestamp"] = current_timestamp(converter.output)
+    return timestamp_column